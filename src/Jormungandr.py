@@ -1,6 +1,32 @@
+import contextlib, io, os, time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappush, heappop
 from queue import PriorityQueue
 
-from utils import manhattan_distance, euclidean_distance
+from heuristics import HeuristicCache, HEURISTICS
+from board import Bitboard, BORDER, WALL_STAMP
+from stats import SearchStats
+from walls import WallMap
+
+# Available search backends:
+# - legacy: the original PriorityQueue + dictionaries implementation.
+# - grid: flat array grids for g-cost, parent and closed state with a heapq frontier.
+# - jps: Jump Point Search on the grids, straight runs of free cells are skipped instead of expanded.
+BACKENDS = ('legacy', 'grid', 'jps')
+
+# Move codes and their (dX, dY) in cells
+MOVE_DELTAS = {1: (0, -1), 2: (0, 1), 3: (-1, 0), 4: (1, 0)}
+
+# Available search modes (grid backend):
+# - greedy: greedy best-first, nodes are ranked by h only (the original behaviour).
+# - astar: classic A*, f = g + h.
+# - weighted: weighted A*, f = g + w * h.
+SEARCH_MODES = ('greedy', 'astar', 'weighted')
+
+# Cell states on the grid backend
+UNSEEN, OPEN, CLOSED = 0, 1, 2
 
 
 class Jormungandr():
@@ -8,21 +34,92 @@ class Jormungandr():
     Why this name?  --> I could have called it Ouroboros but Jormungandr is a cooler name (see: https://en.wikipedia.org/wiki/J%C3%B6rmungandr)
     """
 
-    def __init__(self, frame_size_x: int, frame_size_y: int, heuristic: str):
+    def __init__(self, frame_size_x: int, frame_size_y: int, heuristic: str, backend: str = 'grid', search: str = 'greedy', weight: float = 2.0, survival: bool = False, stats: SearchStats = None, wall_map: WallMap = None):
         self.MAX_X = frame_size_x
         self.MAX_Y = frame_size_y
+
+        # Arguments to build the same pathfinder in the worker processes of pathfind_many
+        self.config = (frame_size_x, frame_size_y, heuristic, backend, search, weight, survival, None, wall_map)
+
+        # Board size in cells (every cell is 10x10 pixels)
+        self.COLS = (frame_size_x - 10) // 10 + 1
+        self.ROWS = (frame_size_y - 10) // 10 + 1
         
-        # Manhattan distance
-        if heuristic == 'manhattan':
-            self.heuristic_value = manhattan_distance
-        
-        # Euclidean distance
-        elif heuristic == 'euclidean':
-            self.heuristic_value = euclidean_distance
+        # Manhattan, euclidean, chebyshev or octile distance
+        if heuristic not in HEURISTICS:
+            raise ValueError('Unknown heuristic, avaliable values: ' + ', '.join(HEURISTICS) + ' (dont use commas if you are on the command line')
+
+        self.heuristic = heuristic
+        self.heuristic_value = HEURISTICS [heuristic]
+
+        # Fields of the heuristic to the last targets, the grid backends read h from them
+        self.heuristics = HeuristicCache()
+
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend, avaliable values: ' + ', '.join(BACKENDS))
+
+        if search not in SEARCH_MODES:
+            raise ValueError('Unknown search mode, avaliable values: ' + ', '.join(SEARCH_MODES))
+
+        if backend == 'legacy' and search != 'greedy':
+            raise ValueError('The legacy backend only supports greedy search')
+
+        if search == 'weighted' and weight < 1:
+            raise ValueError('The weight of weighted A* must be at least 1')
+
+        # Fixed walls inside the board, their exact distances replace the heuristic
+        if wall_map is not None:
+            if (wall_map.cols, wall_map.rows) != (self.COLS, self.ROWS):
+                raise ValueError('The board has ' + str(self.COLS) + 'x' + str(self.ROWS) + ' cells but the map ' + str(wall_map.cols) + 'x' + str(wall_map.rows))
+
+            if backend not in ('legacy', 'grid'):
+                raise ValueError('Only the legacy and grid backends support wall maps')
+
+        self.wall_map = wall_map
+        if wall_map is not None:
+            self.heuristic_value = self.map_distance
+
+        self.backend = backend
+        self.search = search
+
+        # Check every path to the food before following it (see survive)
+        self.survival = survival
+
+        # f = g_cost * g + h_weight * h
+        self.g_cost = 0 if search == 'greedy' else 1
+        self.h_weight = weight if search == 'weighted' else 1
+
+        # Grids used by the grid backends. The grid backend uses the bit indices of the Bitboard, the other
+        # ones store the cell (X, Y) at index (Y // 10) * COLS + X // 10.
+        # They are allocated once and only the cells touched by a search are cleaned afterwards.
+        cells = (self.COLS + 2 * BORDER) * (self.ROWS + 2 * BORDER)
+        self.g = array('i', [0]) * cells
+        self.parent = array('i', [-1]) * cells
+        self.moves = bytearray(cells)
+        self.closed = bytearray(cells)
+
+        # Number of moves after which each cell stops being part of the snake's body (0 means free)
+        self.release = array('i', [0]) * cells
+
+        # Board reused when pathfind gets the body as a list
+        self.board = Bitboard(self.COLS, self.ROWS, wall_map.walls if wall_map is not None else ())
+
+        # Body segments on every row and column, and rows where a horizontal jump can stop (jps backend)
+        self.body_by_row = {}
+        self.body_by_col = {}
+        self.jump_rows = []
+
+        # Nodes expanded by the last call to pathfind
+        self.nodes_expanded = 0
 
-        else:
-            raise ValueError('Unknown heuristic, avaliable values: manhattan, euclidean (dont use commas if you are on the command line')
+        # Counters of the last call to pathfind (nodes generated and peak size of the frontier) and whether it
+        # found a path to the food
+        self.nodes_generated = 0
+        self.frontier_peak = 0
+        self.found = True
 
+        # Histograms of the counters of every call, None to disable them
+        self.stats = stats
 
     # A* function
     def can_expand(self, node: tuple, obstacles: dict, open: dict, closed: dict):
@@ -139,8 +236,639 @@ class Jormungandr():
             except:
                 return path
 
+    def heuristic_field(self, target: tuple):
+        """
+        Returns the h of every cell to the target cell (X, Y), laid out like the bits of the board: the field
+        of the heuristic, or the exact distances around the walls of the map.
+        """
+        if self.wall_map is not None:
+            return self.wall_map.field(target, BORDER)
+
+        return self.heuristics.field(self.heuristic, target, self.COLS, self.ROWS, BORDER)
+
+    def map_distance(self, node: tuple, target: tuple) -> float:
+        """
+        Heuristic of the legacy backend on a wall map, distance between two positions (pixel coordinates).
+        """
+        return self.wall_map.field((target [0] // 10, target [1] // 10)) [(node [1] // 10) * self.COLS + node [0] // 10]
+
+    def as_board(self, snake_body) -> Bitboard:
+        """
+        Returns the snake's body as a Bitboard, a list of pixel coordinates is pushed on a reused board.
+        """
+        if isinstance(snake_body, Bitboard):
+            return snake_body
+
+        board = self.board
+        board.clear()
+        for x, y in reversed(snake_body):
+            board.push_head(x // 10, y // 10)
+
+        return board
+
+    def as_body(self, snake_body) -> list:
+        """
+        Returns the snake's body as a list of pixel coordinates, head first.
+        """
+        if isinstance(snake_body, Bitboard):
+            return [ [x * 10, y * 10] for x, y in map(snake_body.cell, snake_body.body) ]
+
+        return snake_body
+
+    def pathfind(self, snake_body, food_pos: list):
+        """
+        A* algorithm, runs the search with the selected backend. In survival mode the path is only
+        followed if the snake can still get out of the place where it leaves it.
+
+        Args:
+            snake_body (list or Bitboard): List with snake's body (pixel coordinates, head first) or a Bitboard
+                with it, considered obstacle nodes.
+            food_pos (list): Position of the food, considered the goal that we have to reach.
+
+        return: List with the action sequence
+        """
+        stats = self.stats
+        if stats is not None:
+            start = time.perf_counter()
+
+        path = self.search_path(snake_body, food_pos)
+
+        if self.survival:
+            path = self.survive(self.as_board(snake_body), food_pos, path)
+
+        if stats is not None:
+            stats.record(self.nodes_expanded, self.nodes_generated, self.frontier_peak, len(path), time.perf_counter() - start, self.found)
+
+        return path
+
+    def add_counters(self, expanded: int, generated: int, frontier_peak: int):
+        """
+        Adds the counters of a previous search of the same call to pathfind to the ones of the last search.
+        """
+        self.nodes_expanded += expanded
+        self.nodes_generated += generated
+        self.frontier_peak = max(self.frontier_peak, frontier_peak)
+
+    def pathfind_batch(self, positions) -> list:
+        """
+        Runs pathfind over every position in this process, the "No way!" messages are silenced.
+
+        Args:
+            positions (iterable): (snake_body, food_pos) pairs.
+
+        return: List with (path, seconds, nodes expanded) of every position.
+        """
+        results = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for snake_body, food_pos in positions:
+                start = time.perf_counter()
+                path = self.pathfind(snake_body, food_pos)
+                results.append((path, time.perf_counter() - start, self.nodes_expanded))
+
+        return results
+
+    def pathfind_many(self, positions, workers: int = None, chunk_size: int = None) -> list:
+        """
+        Runs pathfind over a batch of positions split across a process pool.
+
+        Positions are sent in chunks, so every task carries many queries and the inter process communication
+        is paid once per chunk. Every worker builds its own pathfinder with the same configuration once and
+        reuses it for all its chunks. Results keep the order of the positions.
+
+        Args:
+            positions (iterable): (snake_body, food_pos) pairs, bodies as lists of pixel coordinates.
+            workers (int): Number of processes, all the CPUs by default. With 1 the batch runs in this process.
+            chunk_size (int): Positions per task, by default the batch is split in 4 tasks per worker.
+
+        return: List with (path, seconds, nodes expanded) of every position.
+        """
+        positions = list(positions)
+        workers = workers or os.cpu_count()
+
+        if workers == 1 or len(positions) <= 1:
+            return self.pathfind_batch(positions)
+
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(positions) // (workers * 4)))
+
+        chunks = [ positions [i:i + chunk_size] for i in range(0, len(positions), chunk_size) ]
+
+        results = []
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            for chunk in executor.map(pathfind_chunk, [self.config] * len(chunks), chunks):
+                results.extend(chunk)
+
+        return results
+
+    def search_path(self, snake_body, food_pos: list):
+        """
+        Runs the search with the selected backend, see pathfind. On a wall map the shortest path is taken
+        without searching when the body does not block it.
+        """
+        if self.wall_map is not None:
+            path = self.follow_distances(self.as_board(snake_body), food_pos)
+            if path is not None:
+                return path
+
+        if self.backend == 'grid':
+            return self.pathfind_grid(self.as_board(snake_body), food_pos)
+
+        snake_body = self.as_body(snake_body)
+
+        if self.backend == 'legacy':
+            return self.pathfind_legacy(snake_body, food_pos)
+
+        return self.pathfind_jps(snake_body, food_pos)
+
+    def follow_distances(self, board: Bitboard, food_pos: list):
+        """
+        Walks down the exact distances of the wall map from the head to the food, every move goes to a cell
+        one step closer which is free when the head gets there. The result is a shortest path.
+
+        return: List with the action sequence, None if the body blocks the way (then a search is needed).
+        """
+        stride, bits, stamp = board.stride, board.bits, board.stamp
+        field = self.wall_map.field((food_pos [0] // 10, food_pos [1] // 10), BORDER)
+        tail = stamp [board.body [-1]] - 1
+
+        current = board.body [0]
+        distance = field [current]
+        if distance == float('inf'):
+            return None
+
+        path = []
+        steps = 0
+        while distance:
+            steps += 1
+            for move, next_node in ((1, current - stride), (2, current + stride), (3, current - 1), (4, current + 1)):
+                if field [next_node] == distance - 1 and not (bits [next_node >> 3] >> (next_node & 7) & 1 and stamp [next_node] - tail >= steps):
+                    break
+            else:
+                return None
+
+            path.append(move)
+            current = next_node
+            distance -= 1
+
+        self.nodes_expanded, self.nodes_generated, self.frontier_peak = 0, 0, 0
+        self.found = True
+
+        return path
+
+    # Survival function
+    def simulate(self, board: Bitboard, path: list, target: int):
+        """
+        Follows the path from the current position of the body.
+
+        Args:
+            board (Bitboard): Board with the snake's body.
+            path (list): Move sequence.
+            target (int): Bit index of the food, the snake grows if the last move of the path gets to it.
+
+        return: List with the bit indices of the body (head first) at the end of the path, None if the path
+            leaves the board or bites the body.
+        """
+        stride = board.stride
+        deltas = {1: -stride, 2: stride, 3: -1, 4: 1}
+
+        body = deque(board.body)
+        occupied = set(body)
+        last = len(path) - 1
+
+        for step, move in enumerate(path):
+            head = body [0] + deltas [move]
+
+            # The tail leaves its cell before the head gets in, unless the snake is eating
+            if not (head == target and step == last):
+                occupied.discard(body.pop())
+
+            if board.walls [head] or head in occupied:
+                return None
+
+            body.appendleft(head)
+            occupied.add(head)
+
+        return list(body)
+
+    # Survival function
+    def free_area(self, board: Bitboard, body: list) -> tuple:
+        """
+        Flood fills the free cells from the head of the body.
+
+        Args:
+            board (Bitboard): Board of the game (its walls are used, not its body).
+            body (list): Bit indices of the body to check, head first.
+
+        return: Tuple (tail reachable, number of free cells reachable from the head).
+        """
+        tail = body [-1]
+
+        # The tail leaves its cell on the next move, so it counts as a free cell
+        free = ((1 << board.size) - 1) & ~(board.wall_bits | board.mask(body)) | 1 << tail
+        region = board.flood_fill(body [0], free)
+
+        return bool(region >> tail & 1), bin(region).count('1') - 1
+
+    # Survival function
+    def is_safe(self, board: Bitboard, body: list) -> bool:
+        """
+        Checks that the snake is not trapped, that is, its tail is reachable from its head. Then the snake
+        can always follow its tail until the cells around it are released, however small the area is.
+        """
+        return self.free_area(board, body) [0]
+
+    # Survival function
+    def survive(self, board: Bitboard, food_pos: list, path: list):
+        """
+        Survival mode. The body is moved along the path to the food and the position where the snake eats is
+        checked with is_safe. If the path is not safe (or there is no path) the snake chases its tail one move
+        at a time, and if it can not reach its tail it makes the move that leaves it the biggest area.
+
+        Args:
+            board (Bitboard): Board with the snake's body.
+            food_pos (list): Position of the food.
+            path (list): Move sequence to the food found by the search.
+
+        return: List with the action sequence
+        """
+        target = board.index(food_pos [0] // 10, food_pos [1] // 10)
+        expanded, generated, peak, found = self.nodes_expanded, self.nodes_generated, self.frontier_peak, self.found
+
+        body = self.simulate(board, path, target)
+        if body is not None and body [0] == target and self.is_safe(board, body):
+            return path
+
+        # Chase the tail, which is released after one move
+        tail_x, tail_y = board.cell(board.body [-1])
+        path = self.pathfind_grid(board, [tail_x * 10, tail_y * 10])
+        self.add_counters(expanded, generated, peak)
+        self.found = found
+
+        body = self.simulate(board, path [:1], target)
+        if body is not None and self.is_safe(board, body):
+            return path [:1]
+
+        # No way to the tail (the search does not step on the tail right away), make a safe move if there is
+        # one, otherwise the move that leaves the biggest free area
+        best_move, best_score = 1, (False, -1)
+        for move in (1, 2, 3, 4):
+            body = self.simulate(board, [move], target)
+            if body is None:
+                continue
+
+            score = self.free_area(board, body)
+            if score > best_score:
+                best_move, best_score = move, score
+
+        return [best_move]
+
+    # JPS function
+    def walkable(self, x: int, y: int, steps: int) -> bool:
+        """
+        Checks if the cell (X, Y) is inside the board and free after the given number of moves.
+        """
+        return 0 <= x < self.COLS and 0 <= y < self.ROWS and self.release [y * self.COLS + x] < steps
+
+    # JPS function
+    def near_body(self, x: int, y: int) -> bool:
+        """
+        Checks if one of the 8 cells around (X, Y) is a segment of the body.
+        """
+        release, cols = self.release, self.COLS
+        for ny in (y - 1, y, y + 1):
+            if 0 <= ny < self.ROWS:
+                for nx in (x - 1, x, x + 1):
+                    if 0 <= nx < cols and (nx, ny) != (x, y) and release [ny * cols + nx]:
+                        return True
+
+        return False
+
+    # JPS function
+    def jump(self, x: int, y: int, dx: int, dy: int, steps: int, target: int):
+        """
+        Walks from (X, Y) in the direction (dX, dY) until it finds a jump point.
+
+        A cell is a jump point if it is the target, if one of the 8 cells around it is a segment of the body
+        or, when walking vertically, if a horizontal jump from it finds a jump point. Walkability is checked at
+        the time the snake would get to every cell.
+
+        The classic forced neighbour rule is not enough here: a body cell is blocked or free depending on when
+        the snake gets to it, so a detour which turns one cell later reaches it at another time, and pruning the
+        turn made JPS return longer paths than the grid backend. Stopping next to every segment keeps the turns
+        around the body, where the release time matters, and JPS returns paths as short as the grid A*.
+
+        Away from the body every cell is free, so instead of walking cell by cell only the cells where something
+        can happen are visited: the cells next to the body, the target and, when walking vertically, the rows
+        where a horizontal jump can find a jump point.
+
+        Args:
+            x, y (int): First cell of the jump.
+            dx, dy (int): Direction of the jump.
+            steps (int): Number of moves to get to (X, Y).
+            target (int): Cell of the food.
+
+        return: Tuple (cell, steps) of the jump point or None if the jump runs into an obstacle.
+        """
+        walkable = self.walkable
+        cols, rows = self.COLS, self.ROWS
+        target_y, target_x = divmod(target, cols)
+
+        if not (0 <= x < cols and 0 <= y < rows):
+            return None
+
+        if dx != 0:
+            events = set()
+            for col in self.body_by_row.get(y - 1, []) + self.body_by_row.get(y, []) + self.body_by_row.get(y + 1, []):
+                events.update((col - 1, col, col + 1))
+            if y == target_y:
+                events.add(target_x)
+
+            for col in sorted(col for col in events if (col - x) * dx >= 0 and 0 <= col < cols)[::dx]:
+                col_steps = steps + (col - x) * dx
+                if not walkable(col, y, col_steps):
+                    return None
+
+                cell = y * cols + col
+                if cell == target or self.near_body(col, y):
+                    return cell, col_steps
+
+            return None
+
+        events = set(self.jump_rows)
+        for row in self.body_by_col.get(x - 1, []) + self.body_by_col.get(x, []) + self.body_by_col.get(x + 1, []):
+            events.update((row - 1, row, row + 1))
+
+        for row in sorted(row for row in events if (row - y) * dy >= 0 and 0 <= row < rows)[::dy]:
+            row_steps = steps + (row - y) * dy
+            if not walkable(x, row, row_steps):
+                return None
+
+            cell = row * cols + x
+            if cell == target or self.near_body(x, row):
+                return cell, row_steps
+
+            if self.jump(x + 1, row, 1, 0, row_steps + 1, target) or self.jump(x - 1, row, -1, 0, row_steps + 1, target):
+                return cell, row_steps
+
+        return None
+
+    # A* function
+    def pathfind_jps(self, snake_body: list, food_pos: list):
+        """
+        A* algorithm with Jump Point Search on a 4-connected grid.
+
+        Only jump points are pushed on the frontier, a node reached horizontally generates the cells above
+        and below it and the next one in its direction, and a node reached vertically the cells to its left
+        and right and the next one in its direction. The body is handled like in the grid backend, a segment
+        is free once the number of moves to get to it is higher than its release time.
+        If JPS finds no way the grid backend searches again with every cell expanded.
+
+        Args:
+            snake_body (list): List with snake's body, considered obstacle nodes.
+            food_pos (list): Position of the food, considered the goal that we have to reach.
+
+        return: List with the action sequence
+        """
+        cols = self.COLS
+        g, parent, moves, closed, release = self.g, self.parent, self.moves, self.closed, self.release
+        g_cost, h_weight = self.g_cost, self.h_weight
+
+        start = (snake_body [0] [1] // 10) * cols + snake_body [0] [0] // 10
+        body = [ (y // 10) * cols + x // 10 for x, y in snake_body [1:] ]
+        position = len(body)
+        for cell in body:
+            release [cell] = position
+            position -= 1
+
+        self.body_by_row, self.body_by_col = {}, {}
+        for cell in body:
+            row, col = divmod(cell, cols)
+            self.body_by_row.setdefault(row, []).append(col)
+            self.body_by_col.setdefault(col, []).append(row)
+
+        target = (food_pos [1] // 10) * cols + food_pos [0] // 10
+        target_xy = (food_pos [0] // 10, food_pos [1] // 10)
+        h_field = self.heuristics.field(self.heuristic, target_xy, cols, self.ROWS)
+
+        # Rows where a horizontal jump can find a jump point: next to the body or the row of the target
+        self.jump_rows = { row + offset for row in self.body_by_row for offset in (-1, 0, 1) } | {target_xy [1]}
+
+        open_nodes = []
+        touched = [start]
+        closed [start] = CLOSED
+        g [start] = 0
+        moves [start] = 0
+        current = start
+        expanded = 0
+
+        # Peak size of the frontier, only measured when the counters are enabled
+        track, peak = self.stats is not None, 0
+
+        while current != target:
+            expanded += 1
+            y, x = divmod(current, cols)
+
+            # Pruned neighbours, the start has no direction so it generates the four of them
+            move = moves [current]
+            if move == 0:
+                directions = (1, 2, 3, 4)
+            elif move in (3, 4):
+                directions = (1, 2, move)
+            else:
+                directions = (3, 4, move)
+
+            for direction in directions:
+                dx, dy = MOVE_DELTAS [direction]
+                jump_point = self.jump(x + dx, y + dy, dx, dy, g [current] + 1, target)
+                if jump_point is None:
+                    continue
+
+                next_node, steps = jump_point
+                state = closed [next_node]
+                if state == CLOSED or (state == OPEN and (not g_cost or steps >= g [next_node])):
+                    continue
+
+                if state == UNSEEN:
+                    closed [next_node] = OPEN
+                    touched.append(next_node)
+
+                g [next_node] = steps
+                parent [next_node] = current
+                moves [next_node] = direction
+
+                heappush(open_nodes, (g_cost * steps + h_weight * h_field [next_node], -g_cost * steps, next_node))
+
+            if track and len(open_nodes) > peak:
+                peak = len(open_nodes)
+
+            current = -1
+            while open_nodes:
+                node = heappop(open_nodes) [2]
+                if closed [node] != CLOSED:
+                    current = node
+                    closed [current] = CLOSED
+                    break
+
+            if current == -1:
+                break
+
+        self.nodes_expanded = expanded
+        self.nodes_generated = len(touched) - 1
+        self.frontier_peak = peak
+        self.found = current == target
+
+        # Backtrack, every jump is a straight run of the same move
+        path = []
+        if current == target:
+            node = target
+            while node != start:
+                path.extend([moves [node]] * (g [node] - g [parent [node]]))
+                node = parent [node]
+            path.reverse()
+
+            # Only jump points are closed, so waiting for a segment of the body to be released can make the
+            # path cross itself (the snake would bite its own new body). Those paths are searched again.
+            x, y = snake_body [0] [0] // 10, snake_body [0] [1] // 10
+            visited = {(x, y)}
+            for move in path:
+                dx, dy = MOVE_DELTAS [move]
+                x, y = x + dx, y + dy
+                if (x, y) in visited:
+                    current = -1
+                    break
+                visited.add((x, y))
+
+        for cell in touched:
+            closed [cell] = UNSEEN
+            moves [cell] = 0
+        for cell in body:
+            release [cell] = 0
+
+        if current != target:
+            path = self.pathfind_grid(self.as_board(snake_body), food_pos)
+            self.add_counters(expanded, len(touched) - 1, peak)
+
+        return path
+
+    # A* function
+    def pathfind_grid(self, board: Bitboard, food_pos: list):
+        """
+        A* algorithm on flat array grids.
+
+        Nodes are cell indices, the frontier is a plain heapq and the g-cost, parent, move and closed state
+        of every cell live in preallocated arrays. Frontier entries are (f, tie, move, father, node):
+
+        - greedy: f = h and no tie-break on g, which is exactly the legacy PriorityQueue order (h, move, father),
+          so both backends return the same move sequence.
+        - astar / weighted: f = g + w * h, ties are broken on the larger g (deeper nodes first) and a node
+          is reopened when a cheaper way to it is found.
+
+        Nodes are the bit indices of the Bitboard, its border of walls replaces the bounds checks and the
+        occupancy bits and push stamps of the body replace the obstacles dictionary: an occupied cell is
+        released after stamp - tail stamp + 1 moves.
+
+        Args:
+            board (Bitboard): Board with the snake's body, considered obstacle nodes.
+            food_pos (list): Position of the food, considered the goal that we have to reach.
+
+        return: List with the action sequence
+        """
+        rows, stride = self.ROWS, board.stride
+        g, parent, moves, closed = self.g, self.parent, self.moves, self.closed
+        bits, stamp = board.bits, board.stamp
+        g_cost, h_weight = self.g_cost, self.h_weight
+
+        # Preprocessing, the segment right after the head is released after len(body) - 1 moves
+        # and the tail after 1 move.
+        start = board.body [0]
+        tail = stamp [board.body [-1]] - 1
+
+        target = board.index(food_pos [0] // 10, food_pos [1] // 10)
+
+        # h of every cell, laid out like the bits of the board
+        h_field = self.heuristic_field((food_pos [0] // 10, food_pos [1] // 10))
+
+        open_nodes = []
+        touched = [start]
+        closed [start] = CLOSED
+        g [start] = 0
+        current = start
+        expanded = 0
+
+        # Peak size of the frontier, only measured when the counters are enabled
+        track, peak = self.stats is not None, 0
+
+        while current != target:
+            expanded += 1
+            row, col = divmod(current, stride)
+            steps = g [current] + 1
+            key = col * rows + row
+
+            # Node above, below, to the left and to the right.
+            for move, next_node in ((1, current - stride), (2, current + stride), (3, current - 1), (4, current + 1)):
+
+                # A wall or an obstacle that will still be there when we get there
+                if bits [next_node >> 3] >> (next_node & 7) & 1 and stamp [next_node] - tail >= steps:
+                    continue
+
+                # Closed nodes are never generated again, open nodes only when we found a cheaper way to them (A* modes)
+                state = closed [next_node]
+                if state == CLOSED or (state == OPEN and (not g_cost or steps >= g [next_node])):
+                    continue
+
+                if state == UNSEEN:
+                    closed [next_node] = OPEN
+                    touched.append(next_node)
+
+                g [next_node] = steps
+                parent [next_node] = current
+                moves [next_node] = move
+
+                heappush(open_nodes, (g_cost * steps + h_weight * h_field [next_node], -g_cost * steps, move, key, next_node))
+
+            if track and len(open_nodes) > peak:
+                peak = len(open_nodes)
+
+            # Get the best node, skipping the stale entries of reopened nodes
+            current = -1
+            while open_nodes:
+                node = heappop(open_nodes) [4]
+                if closed [node] != CLOSED:
+                    current = node
+                    closed [current] = CLOSED
+                    break
+
+            if current == -1:
+                break
+
+        self.nodes_expanded = expanded
+        self.nodes_generated = len(touched) - 1
+        self.frontier_peak = peak
+        self.found = current == target
+
+        # Backtrack to get the real path to food_pos.
+        path = []
+        if current == target:
+            node = target
+            while node != start:
+                path.append(moves [node])
+                node = parent [node]
+            path.reverse()
+
+        # Clean the grids for the next search
+        for cell in touched:
+            closed [cell] = UNSEEN
+
+        if current != target:
+            print("No way!")
+
+            # By default go up, but there's no possible path to the food
+            return [1]
+
+        return path
+
     # A* function
-    def pathfind(self, snake_body: list, food_pos: list):
+    def pathfind_legacy(self, snake_body: list, food_pos: list):
         """
         A* algorithm
 
@@ -167,14 +895,23 @@ class Jormungandr():
             obstacles [key] = position
             position -=1
 
+        # The walls of the map are obstacles that are never released
+        if self.wall_map is not None:
+            for x, y in self.wall_map.walls:
+                obstacles [ (x * 10, y * 10) ] = WALL_STAMP
+
         open_nodes = PriorityQueue()
         open_nodes_dict = {snake_head [0]: None}
         closed_nodes = {}
         current = snake_head
 
+        # Counters of the search
+        expanded, generated, peak = 0, 0, 0
+
         # It is set to True when food_pos is reached.
         reached = False
         while not reached:
+            expanded += 1
 
             # Expand, get possible nodes
             possible_nodes = self.expand(current, obstacles, open_nodes_dict, closed_nodes, food_pos)
@@ -190,6 +927,8 @@ class Jormungandr():
             for node in possible_nodes:
                 open_nodes.put(node)
                 open_nodes_dict [ node [1] [2] [0] ] = None
+            generated += len(possible_nodes)
+            peak = max(peak, open_nodes.qsize())
 
             # Get node, and add to path dictionary, also, now it's a closed node
             current = open_nodes.get() [1]
@@ -202,11 +941,32 @@ class Jormungandr():
                 reached = True
 
             if open_nodes.empty():
+                self.nodes_expanded, self.nodes_generated, self.frontier_peak = expanded, generated, peak
+                self.found = False
                 print("No way!")
 
                 # By default go up, but there's no possible path to the food
                 return [1]
 
         # Backtrack to get the real path to food_pos.
+        self.nodes_expanded, self.nodes_generated, self.frontier_peak = expanded, generated, peak
+        self.found = True
         path = self.backtrack(paths, food_pos)
-        return path
\ No newline at end of file
+        return path
+
+
+# Pathfinders of a worker process of pathfind_many, one per configuration
+worker_snakes = {}
+
+
+def pathfind_chunk(config: tuple, positions: list) -> list:
+    """
+    Task of the worker processes of pathfind_many, runs pathfind over a chunk of positions.
+
+    return: List with (path, seconds, nodes expanded) of every position.
+    """
+    snake = worker_snakes.get(config)
+    if snake is None:
+        snake = worker_snakes [config] = Jormungandr(*config)
+
+    return snake.pathfind_batch(positions)
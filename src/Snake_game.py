@@ -1,17 +1,23 @@
 import pygame, sys, time, random, argparse
 from numpy import cumsum
 
-from Jormungandr import Jormungandr
-from utils import game_over
-
-from rl.environments import SnakeGame
+from Jormungandr import Jormungandr, BACKENDS, SEARCH_MODES
+from hamiltonian import HamiltonianPlanner
+from simulation import Simulation, PygameRenderer
+from stats import SearchStats
+from walls import load_map
+
+from rl.environments import SnakeGame, VecSnakeGame, OBSERVATIONS
+from rl.parallel import SubprocVecSnakeGame, Hogwild, HOGWILD_SOLVERS
+from rl.checkpoint import CheckpointManager
 from rl.agent import Jormungandr as RL_Jormungandr
 from rl.action_selection import EpsilonGreedy
-from rl.solvers import SARSA, QLearning, n_step_SARSA, n_step_OffPolicy
+from rl.solvers import SARSA, QLearning, n_step_SARSA, n_step_OffPolicy, SARSALambda, QLambda
+from rl.agent import TRACE_MODES
 from rl.actor_crtitc import ActorCritic
 from rl.DQN import DQNSolver
 
-from rl.planner import DynaQ, DynaQWithPriority
+from rl.planner import DynaQ, DynaQWithPriority, MCTS
 
 from tqdm import tqdm
 import matplotlib.pyplot as plt
@@ -29,7 +35,17 @@ parser.add_argument("-d","--display",dest = 'display', required = False, action=
 parser.add_argument("-t","--test",dest = 'test', required = False, action='store_true', default = False, help = "Whether to train (False) or test (True). Default is False")
 
 # Heuristic
-parser.add_argument("-hh","--heuristic",dest = 'heuristic', type = str, required = False, default = 'manhattan', help = "Which heuristic to use, 1 .- Manhattan Distance. 2.- Euclidean Distance")
+parser.add_argument("-hh","--heuristic",dest = 'heuristic', type = str, required = False, default = 'manhattan', help = "Which heuristic to use, 1 .- Manhattan Distance. 2.- Euclidean Distance. 3.- Chebyshev Distance. 4.- Octile Distance")
+
+# A* search mode
+parser.add_argument("-sm","--search",dest = 'search', type = str, required = False, default = 'greedy', choices = SEARCH_MODES, help = "A* search mode: 'greedy' (f = h), 'astar' (f = g + h) or 'weighted' (f = g + w * h). Default is 'greedy'.")
+parser.add_argument("-w","--weight",dest = 'weight', type = float, required = False, default = 2.0, help = "Weight w of the heuristic in weighted A* (--search weighted only). Default is 2.0.")
+
+# A* search backend
+parser.add_argument("-b","--backend",dest = 'backend', type = str, required = False, default = 'grid', choices = BACKENDS, help = "A* search backend, 'grid' (array grids and heapq), 'legacy' (PriorityQueue and dictionaries) or 'jps' (Jump Point Search). Default is 'grid'.")
+
+# A* survival mode
+parser.add_argument("-sv","--survival",dest = 'survival', required = False, action='store_true', default = False, help = "Only follow the paths to the food after which the snake can still reach its tail, chase the tail otherwise. Default is False.")
 
 # Whether to run using A* or not
 group.add_argument("-a","--algorithm",dest = 'algorithm', required = False, action='store_true', default = False, help = "Whether to run A* algorithm or not (mutually exclusive with -r)")
@@ -40,8 +56,17 @@ group.add_argument("-r","--reinforcement",dest = 'reinforcement',required = Fals
 # Checkpoint path to Q function
 parser.add_argument("-c","--checkpoint",dest = 'checkpoint', type = str, required = False, default = None, help = "Checkpoint path for Q function (-r only).")
 
+# Checkpoints of Q
+parser.add_argument("--checkpoint_episodes",dest = 'checkpoint_episodes', type = int, required = False, default = 100, help = "Save Q (-s) in the background every this many episodes. Default is 100.")
+parser.add_argument("--checkpoint_seconds",dest = 'checkpoint_seconds', type = float, required = False, default = 60, help = "Save Q (-s) when this many seconds went by since the last checkpoint. Default is 60.")
+parser.add_argument("--keep",dest = 'keep', type = int, required = False, default = 1, help = "Number of checkpoints kept, the older ones are saved as <save path>.1.npy, .2.npy... Default is 1.")
+parser.add_argument("--mmap",dest = 'mmap', required = False, action='store_true', default = False, help = "Load the checkpoint (-c) memory mapped (copy on write).")
+
+# Mirror symmetry of the tabular agent
+parser.add_argument("--symmetric",dest = 'symmetric', required = False, action='store_true', default = False, help = "Share the values of every state and its left/right mirror in Q, every update trains both.")
+
 # Learning algorithm
-parser.add_argument("-la","--learning_algorithm",dest = 'learning_algorithm', type = str, required = False, default = 'SARSA', help = "Learning algorithm to use (RL only): 'sarsa', 'qlearning', 'nstep'")
+parser.add_argument("-la","--learning_algorithm",dest = 'learning_algorithm', type = str, required = False, default = 'SARSA', help = "Learning algorithm to use (RL only): 'sarsa', 'qlearning', 'nstep', 'sarsalambda', 'qlambda'")
 
 # Size of the screen
 parser.add_argument("--width",dest = 'width', type = int, required = False, default = 500, help = "Width of the display screen.")
@@ -59,20 +84,54 @@ parser.add_argument("-s", "--save_path",dest = 'save_path', type = str, required
 # Steps of nStep Sarsa
 parser.add_argument("-ns", "--n_steps",dest = 'n_steps', type = int, required = False, default = 3, help = "Number of steps in nStepSarsa and nStepQLearning.")
 
+# Lambda-returns
+parser.add_argument("-lm", "--lambda",dest = 'lam', type = float, required = False, default = 0.9, help = "Lambda of SARSA(lambda) and Q(lambda) (-la sarsalambda or qlambda). Default is 0.9.")
+parser.add_argument("--trace",dest = 'trace', type = str, required = False, default = 'replacing', choices = TRACE_MODES, help = "Eligibility traces of SARSA(lambda) and Q(lambda), 'replacing' or 'accumulating'. Default is 'replacing'.")
+
 # Planning steps
 parser.add_argument("-ps", "--planning_steps",dest = 'planning_steps', type = int, required = False, default = 0, help = "Number of planning steps.")
 
 # Type of planner
-parser.add_argument("-p", "--planner",dest = 'planner', type = str, required = False, default = 'dynaq', help = "Type of planner, can be either 'DynaQ' or 'DynaQPriority'.")
+parser.add_argument("-p", "--planner",dest = 'planner', type = str, required = False, default = 'dynaq', help = "Type of planner, can be either 'DynaQ' or 'DynaQPriority' (-r), 'MCTS' (-r, play with a tree search over the environment guided by Q, see -ps and -ms), or 'hamiltonian' (-a, follow a Hamiltonian cycle with shortcuts once the snake is long, A* before).")
+
+# Budget and worker processes of the MCTS planner
+parser.add_argument("-ms", "--milliseconds",dest = 'milliseconds', type = float, required = False, default = None, help = "Time budget per move of the MCTS planner, the planning steps (-ps) are the simulations per move (0 for no limit, 100 simulations without -ms).")
+parser.add_argument("--workers",dest = 'workers', type = int, required = False, default = 1, help = "Processes searching in parallel with the MCTS planner. Default is 1.")
 
 # Threshold for priority sweeping
 parser.add_argument("-th", "--threshold",dest = 'threshold', type = float, required = False, default = 0.1, help = "Threshold for priority sweeping (DynaQ planning).")
 
+# Number of games (-a) and seed of the food positions (-a and -r)
+parser.add_argument("-g", "--games",dest = 'games', type = int, required = False, default = 1, help = "Number of games played by the A* agent, a summary of them is printed at the end. Default is 1.")
+parser.add_argument("--seed",dest = 'seed', type = int, required = False, default = None, help = "Seed of the food positions of the A* games and of the environment (-r). Default is random.")
+
+# Search counters of the A* agent
+parser.add_argument("--stats",dest = 'stats', type = str, required = False, default = None, help = "Record the counters of every A* search (nodes expanded and generated, frontier peak, path length, latency), show them live with -d and dump their histograms to this JSON file at the end.")
+
+# Map with fixed walls
+parser.add_argument("-m", "--map",dest = 'map', type = str, required = False, default = None, help = "Map file with fixed walls, one line per row of the board with '#' for walls and '.' for free cells. With -a it sets the size of the board. Default is no walls.")
+
+# Observation mode of the environment
+parser.add_argument("-o", "--observation",dest = 'observation', type = str, required = False, default = None, choices = OBSERVATIONS, help = "States of the environment (-r): 'dict' (11 features), 'int' (features packed in an integer) or 'grid' (planes of the board, networks only). Default is 'int' for the tabular solvers and 'dict' for the networks.")
+
+# Vector environments
+parser.add_argument("-ve", "--vec_envs",dest = 'vec_envs', type = int, required = False, default = 0, help = "Train on this many boards at once (-la sarsa, qlearning or dqn), every episode (-ep) is --vec_steps steps of all of them. Default is 0, one SnakeGame.")
+parser.add_argument("--vec_steps",dest = 'vec_steps', type = int, required = False, default = 100, help = "Steps of every board per episode with --vec_envs. Default is 100.")
+parser.add_argument("--env_workers",dest = 'env_workers', type = int, required = False, default = 0, help = "Processes stepping the boards of --vec_envs through shared memory (SubprocVecSnakeGame), 0 steps them in this process (VecSnakeGame). Default is 0.")
+
+# Hogwild training
+parser.add_argument("--hogwild",dest = 'hogwild', type = int, required = False, default = 0, help = "Train the tabular solvers with this many processes updating a shared Q without locks, each with its own game (no planner). Default is 0, one process.")
+
 # Plot cumulative reward sum at the end
 parser.add_argument("-pl", "--plot",dest = 'plot', action='store_true', default = False, help = "Plot the cumulative reward sum at the end of training.")
 
 args = parser.parse_args()
 
+# The A* agent plays on a board of the size of the map
+wall_map = load_map(args.map) if args.map else None
+if wall_map is not None and args.algorithm:
+    args.width, args.height = wall_map.cols * 10, wall_map.rows * 10
+
 # Checks for errors encountered
 check_errors = pygame.init()
 
@@ -102,19 +161,28 @@ if args.reinforcement:
 
     total_rewards = []
 
-    # Initialize environment
-    environment = SnakeGame(game_window, width = args.width, height = args.height, display = args.display)
+    solver = args.learning_algorithm.lower()
+
+    # Initialize environment, the tabular solvers index Q with the integer states and the networks take the dict values
+    observation = args.observation or ('dict' if solver in ('actorcritic', 'dqn') else 'int')
+    if observation == 'grid' and solver not in ('actorcritic', 'dqn'):
+        print('[!] The grid observation needs a network, use -la actorcritic or -la dqn')
+        sys.exit(-1)
+    environment = SnakeGame(game_window, width = args.width, height = args.height, display = args.display, wall_map = wall_map, observation = observation, seed = args.seed)
 
     # Action selector
-    action_selector = EpsilonGreedy(args.epsilon, reduce_on_steps = False)
+    action_selector = EpsilonGreedy(args.epsilon, args.epsilon)
 
     # Agent
-    agent = RL_Jormungandr(alpha = 0.1, action_selector = action_selector, environment = environment, checkpoint = args.checkpoint)
+    agent = RL_Jormungandr(alpha = 0.1, action_selector = action_selector, environment = environment, checkpoint = args.checkpoint, mmap = args.mmap, symmetric = args.symmetric)
 
     planner_name = args.planner.lower()
     planner = None
 
-    solver = args.learning_algorithm.lower()
+    # Checkpoints of the tabular solvers and of Hogwild, written in the background and a last time at the end.
+    # The networks and the MCTS planner (without Hogwild) do not save Q
+    saves_Q = solver in HOGWILD_SOLVERS and (planner_name != 'mcts' or args.hogwild)
+    checkpoints = CheckpointManager(args.save_path, episodes = args.checkpoint_episodes, seconds = args.checkpoint_seconds, keep = args.keep) if saves_Q and not args.test else None
 
 
     # Planner
@@ -126,42 +194,89 @@ if args.reinforcement:
         elif planner_name == 'dynaqpriority':
             planner = DynaQWithPriority(agent = agent, environment = environment, planning_steps = args.planning_steps, learning_algorithm = solver, threshold = args.threshold)
 
-    # Solver
-    if solver == 'sarsa':
-        solver = SARSA(agent, environment, planner = planner, save_path = args.save_path, test = args.test)
+    # Solver, the MCTS planner plays with search and Q (it does not learn)
+    if planner_name == 'mcts':
+        # -ps 0 leaves the simulations unlimited when -ms gives the budget, without both MCTS has its default budget
+        budget = { 'simulations': args.planning_steps or None, 'milliseconds': args.milliseconds } if args.planning_steps or args.milliseconds else {}
+        solver = MCTS(agent, environment, workers = args.workers, seed = args.seed, **budget)
+
+    elif solver == 'sarsa':
+        solver = SARSA(agent, environment, planner = planner, save_path = args.save_path, test = args.test, checkpoints = checkpoints)
 
     elif solver == 'qlearning':
-        solver = QLearning(agent = agent, environment = environment, planner = planner, save_path = args.save_path, test = args.test)
+        solver = QLearning(agent = agent, environment = environment, planner = planner, save_path = args.save_path, test = args.test, checkpoints = checkpoints)
 
     elif solver == 'nstepsarsa':
-        solver = n_step_SARSA(n_steps = args.n_steps, agent = agent, environment = environment, planner = planner, save_path = args.save_path, test = args.test)
+        solver = n_step_SARSA(n_steps = args.n_steps, agent = agent, environment = environment, planner = planner, save_path = args.save_path, test = args.test, checkpoints = checkpoints)
 
     elif solver == 'nstepoffpolicy':
-        solver = n_step_OffPolicy(n_steps = args.n_steps, agent = agent, environment = environment, planner = planner, save_path = args.save_path, test = args.test)
+        solver = n_step_OffPolicy(n_steps = args.n_steps, agent = agent, environment = environment, planner = planner, save_path = args.save_path, test = args.test, checkpoints = checkpoints)
+
+    elif solver == 'sarsalambda':
+        solver = SARSALambda(agent, environment, save_path = args.save_path, test = args.test, lam = args.lam, trace = args.trace, checkpoints = checkpoints)
+
+    elif solver == 'qlambda':
+        solver = QLambda(agent, environment, save_path = args.save_path, test = args.test, lam = args.lam, trace = args.trace, checkpoints = checkpoints)
 
     elif solver == "actorcritic":
         solver = ActorCritic(environment = environment)
 
-    elif solver == "DQN":
+    elif solver == "dqn":
         solver = DQNSolver(environment = environment, batch_size = 128)
     else:
         print("ERROR Solver not found")
         sys.exit(-1)
+
+    # Boards trained at once, stepped in this process or by worker processes
+    if args.vec_envs:
+        if not hasattr(solver, 'run_vectorized'):
+            print('[!] Only sarsa, qlearning and dqn train on --vec_envs')
+            sys.exit(-1)
+
+        if observation == 'grid' and not args.env_workers:
+            print('[!] The boards of VecSnakeGame have no grids, use --env_workers to train on grids with --vec_envs')
+            sys.exit(-1)
+
+        if args.env_workers:
+            environment = SubprocVecSnakeGame(args.vec_envs, workers = args.env_workers, width = args.width, height = args.height, wall_map = wall_map, seed = args.seed, observation = observation)
+        else:
+            environment = VecSnakeGame(args.vec_envs, width = args.width, height = args.height, wall_map = wall_map, seed = args.seed, observation = observation)
  
     reward_sum = []
 
-    for episode in tqdm(range(1, args.episodes + 1), desc = 'Training...'):
-        
-        # Run episode
-        solver.run_episode()
+    # Worker processes training on a shared Q, the episodes are split among them
+    if args.hogwild:
+        if args.learning_algorithm.lower() not in HOGWILD_SOLVERS:
+            print('[!] Only ' + ', '.join(HOGWILD_SOLVERS) + ' train with --hogwild')
+            sys.exit(-1)
 
-        # Append reward sum
-        reward_sum.append(solver.reward_sum)
+        environment = Hogwild(agent, args.learning_algorithm, workers = args.hogwild, width = args.width, height = args.height, wall_map = wall_map,
+                              n_steps = args.n_steps, lam = args.lam, trace = args.trace, checkpoints = checkpoints, seed = args.seed)
+        with tqdm(total = args.episodes, desc = 'Training...') as progress:
+            reward_sum = environment.train(args.episodes, progress = progress.update)
 
+    else:
+        for episode in tqdm(range(1, args.episodes + 1), desc = 'Training...'):
+            
+            # Run episode
+            if args.vec_envs:
+                solver.run_vectorized(environment, args.vec_steps)
+            else:
+                solver.run_episode()
+
+            # Append reward sum
+            reward_sum.append(solver.reward_sum)
+
+
+    if checkpoints is not None:
+        checkpoints.close()
 
     print("Food eaten:", environment.food_eaten)
     print("Deaths:", environment.deaths)
 
+    if args.env_workers and args.vec_envs:
+        environment.close()
+
     if args.plot:
         plt.plot(list(range(1, args.episodes + 1)), cumsum(reward_sum), label = 'Reward sum = ' + str(cumsum(reward_sum)[-1]) + ' (ε = ' + str(args.epislon) + ')')
         plt.title("Cumulative reward over time")
@@ -172,121 +287,25 @@ if args.reinforcement:
         plt.clf()
 if args.algorithm:
 
-    black = pygame.Color(0, 0, 0)
-    white = pygame.Color(255, 255, 255)
-    red = pygame.Color(255, 0, 0)
-    green = pygame.Color(0, 255, 0)
-    blue = pygame.Color(0, 0, 255)
-    # Default snake position
-    snake_pos = [100, 50]
-
-    # Snake starts with length == 3
-    snake_body = [[100, 50], [90, 50], [80, 50]]
-
-    # We generate the first piece of food
-    food_pos = [random.randrange(1, (args.width//10)) * 10, random.randrange(1, (args.height//10)) * 10]
-    food_spawn = True
-
-    direction = 'RIGHT'
-
-    score = 0
-
-
-    # Score
-    def show_score(choice, color, font, size):
-        score_font = pygame.font.SysFont(font, size)
-        score_surface = score_font.render('Score : ' + str(score), True, color)
-        score_rect = score_surface.get_rect()
-        if choice == 1:
-            score_rect.midtop = (args.width/10, 15)
-        else:
-            score_rect.midtop = (args.width/2, args.height/1.25)
-        game_window.blit(score_surface, score_rect)
-        # pygame.display.flip()
-
-    snake = Jormungandr(args.width, args.height, args.heuristic)
-    # Main logic
-    while True:
-    
-        move_sequence = snake.pathfind(snake_body, food_pos)
-        for move in move_sequence:
-
-            # Moving the snake
-
-            # Move up
-            if move == 1:
-                snake_pos[1] -= 10
-
-            # Move down
-            if move == 2:
-                snake_pos[1] += 10
-
-            # Move left
-            if move == 3:
-                snake_pos[0] -= 10
-
-            # Move right
-            if move == 4:
-                snake_pos[0] += 10
-            
-            # Snake body growing mechanism
-            snake_body.insert(0, list(snake_pos))
-            if snake_pos[0] == food_pos[0] and snake_pos[1] == food_pos[1]:
-                score += 1
-                food_spawn = False
-            else:
-                snake_body.pop()
-
-            # Spawning food on the screen
-            while not food_spawn:
-                food_pos = [random.randrange(1, (args.width//10)) * 10, random.randrange(1, (args.height//10)) * 10]
-
-                #We check that food does not spawn inside the snake, otherwise it could crash
-                if food_pos not in snake_body and food_pos not in snake_pos:
-                    food_spawn = True
-
-            
-
-            # GFX
-            game_window.fill(black)
-            for pos in snake_body:
-                # Snake body
-                # .draw.rect(play_surface, color, xy-coordinate)
-                # xy-coordinate -> .Rect(x, y, size_x, size_y)
-                pygame.draw.rect(game_window, green, pygame.Rect(pos[0], pos[1], 10, 10))
-
-            # Snake food
-            pygame.draw.rect(game_window, white, pygame.Rect(food_pos[0], food_pos[1], 10, 10))
-            
-            # Game Over conditions
-            # Getting out of bounds
-            if snake_pos[0] < 0 or snake_pos[0] > args.width - 10:
-                print("My planet needs me! Bye!")
-                game_over()
-            if snake_pos[1] < 0 or snake_pos[1] > args.height - 10:
-                print("My planet needs me! Bye!")
-                game_over()
-
-            # Touching the snake body
-            for block in snake_body[1:]:
-                if snake_pos[0] == block[0] and snake_pos[1] == block[1]:
-                    print("Oopsie! I ate a wall!")
-                    game_over()
-
-            show_score(1, white, 'Console', 20)
-
-            # Refresh game screen
-            pygame.display.update()
-
-            # Refresh rate
-            fps_controller.tick(25)
-            
-    
-
+    # Counters of all the searches of the run, disabled by default
+    stats = SearchStats() if args.stats else None
 
+    def make_planner():
+        snake = Jormungandr(args.width, args.height, args.heuristic, backend = args.backend, search = args.search, weight = args.weight, survival = args.survival, stats = stats, wall_map = wall_map)
 
-   
+        # The Hamiltonian planner takes over from A* when the snake gets long
+        return HamiltonianPlanner(snake) if args.planner.lower() == 'hamiltonian' else snake
 
+    # Drawing is an add-on of the simulation, without display the games run as fast as possible
+    renderer = PygameRenderer(game_window, args.width, args.height, stats = stats, walls = wall_map.walls if wall_map is not None else ()) if args.display else None
 
+    # Snake starts with length == 3 (at the middle of the free cells on a map)
+    simulation = Simulation(make_planner, (args.width - 10) // 10 + 1, (args.height - 10) // 10 + 1,
+                            start = [[100, 50], [90, 50], [80, 50]] if wall_map is None else None, renderer = renderer,
+                            quiet = not args.display, wall_map = wall_map)
+    simulation.run(args.games, args.seed)
+    simulation.print_summary()
 
-   
\ No newline at end of file
+    if stats is not None:
+        print("Searches:", stats.summary())
+        stats.dump(args.stats)
@@ -0,0 +1,577 @@
+import argparse, random, time
+
+import numpy as np
+
+from Jormungandr import Jormungandr, BACKENDS, SEARCH_MODES
+from heuristics import HEURISTICS
+from hamiltonian import HamiltonianPlanner
+from simulation import Simulation
+from board import FreeCellBoard
+from walls import load_map
+from rl.environments import SnakeGame, VecSnakeGame, FEATURES, DIRECTION_DICT, N_STATES
+from rl.agent import Jormungandr as RL_Jormungandr, TRACE_MODES
+from rl.action_selection import EpsilonGreedy
+from rl.planner import MCTS
+from rl.solvers import QLearning, n_step_SARSA, SARSALambda, QLambda
+from rl.parallel import SubprocVecSnakeGame
+
+
+class CountingJormungandr(Jormungandr):
+    """
+    Counts the expansions of the legacy backend, which does not keep track of them.
+    """
+
+    def expand(self, node: tuple, obstacles: dict, open: dict, closed: dict, target: tuple):
+        self.nodes_expanded += 1
+        return super().expand(node, obstacles, open, closed, target)
+
+    def pathfind_legacy(self, snake_body: list, food_pos: list):
+        self.nodes_expanded = 0
+        return super().pathfind_legacy(snake_body, food_pos)
+
+
+def random_position(rng: random.Random, cols: int, rows: int, length: int):
+    """
+    Builds a random (snake_body, food_pos) position on a board of cols x rows cells.
+
+    The body is a self avoiding random walk of the given length, coordinates are in pixels like in Snake_game.py.
+    Positions where the head is boxed in are discarded, the legacy backend blocks forever on them.
+    """
+    while True:
+        head = (rng.randrange(cols), rng.randrange(rows))
+        body = [head]
+        occupied = {head}
+
+        while len(body) < length:
+            x, y = body [-1]
+            free = [ (x + dx, y + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0))
+                     if 0 <= x + dx < cols and 0 <= y + dy < rows and (x + dx, y + dy) not in occupied ]
+            if not free:
+                break
+            cell = rng.choice(free)
+            body.append(cell)
+            occupied.add(cell)
+
+        if len(body) < length:
+            continue
+
+        x, y = head
+        if all(not (0 <= x + dx < cols and 0 <= y + dy < rows) or (x + dx, y + dy) in occupied
+               for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0))):
+            continue
+
+        food = (rng.randrange(cols), rng.randrange(rows))
+        while food in occupied:
+            food = (rng.randrange(cols), rng.randrange(rows))
+
+        return [ [x * 10, y * 10] for x, y in body ], [food [0] * 10, food [1] * 10]
+
+
+def run_pathfind(snake: Jormungandr, positions: list):
+    """
+    Runs pathfind over every position and returns (seconds, nodes expanded, moves).
+    """
+    results = snake.pathfind_batch(positions)
+
+    return sum(seconds for _, seconds, _ in results), sum(nodes for _, _, nodes in results), [ path for path, _, _ in results ]
+
+
+def benchmark_pathfind(args):
+    """
+    Nodes expanded per second of every backend and search mode over the same random positions.
+    """
+    rng = random.Random(args.seed)
+    configurations = [ (backend, search) for backend in args.backends for search in args.searches
+                       if backend != 'legacy' or search == 'greedy' ]
+
+    for size in args.sizes:
+        positions = [ random_position(rng, size, size, args.length) for _ in range(args.positions) ]
+        reference = None
+
+        for backend, search in configurations:
+            snake = CountingJormungandr(size * 10, size * 10, args.heuristic, backend = backend, search = search, weight = args.weight)
+            elapsed, expanded, moves = run_pathfind(snake, positions)
+
+            if reference is None:
+                reference = moves
+
+            # The legacy backend gives up ("No way!") as soon as its queue is empty after a pop, even if the
+            # node it just popped could still be expanded, those positions are reported apart.
+            same = sum(path == other for path, other in zip(moves, reference))
+            gave_up = sum(path != other and other == [1] for path, other in zip(moves, reference))
+
+            length = sum(len(path) for path in moves) / len(moves)
+
+            print(f'{size}x{size} {backend:>8} {search:>8}: {expanded / elapsed:>12,.0f} nodes/s, {expanded:>10,} nodes, '
+                  f'{1000 * elapsed / len(positions):8.3f} ms/call, path length {length:7.1f}, '
+                  f'same moves: {same}/{len(positions)} (reference gave up on {gave_up})')
+
+
+def benchmark_batch(args):
+    """
+    Throughput of pathfind_many over the same random positions with different numbers of worker processes.
+    """
+    rng = random.Random(args.seed)
+    positions = [ random_position(rng, args.size, args.size, args.length) for _ in range(args.positions) ]
+    snake = Jormungandr(args.size * 10, args.size * 10, args.heuristic, backend = args.backend, search = args.search)
+
+    reference, serial = None, None
+    for workers in args.workers:
+        start = time.perf_counter()
+        results = snake.pathfind_many(positions, workers = workers, chunk_size = args.chunk_size)
+        elapsed = time.perf_counter() - start
+
+        paths = [ path for path, _, _ in results ]
+        if reference is None:
+            reference, serial = paths, elapsed
+
+        latency = sum(seconds for _, seconds, _ in results) / len(results)
+        print(f'{workers:>3} workers: {len(positions) / elapsed:>10,.0f} positions/s, {elapsed:7.2f} s, '
+              f'speedup {serial / elapsed:5.2f}x, {1000 * latency:7.3f} ms/query, same paths: {paths == reference}')
+
+
+def benchmark_replan(args):
+    """
+    Planning cost per food of every backend along whole games.
+    """
+    for size in args.sizes:
+        for backend in args.backends:
+
+            def make_planner():
+                snake = Jormungandr(size * 10, size * 10, args.heuristic, backend = backend, search = args.search, survival = args.survival)
+                if args.planner == 'hamiltonian':
+                    return HamiltonianPlanner(snake, switch_fill = args.switch_fill)
+                return snake
+
+            simulation = Simulation(make_planner, size, size, max_foods = args.foods)
+            summary = simulation.run(args.games, args.seed)
+
+            foods = sum(simulation.scores)
+            elapsed = sum(simulation.latencies)
+            deaths = summary ['outcomes'] ['died']
+
+            print(f'{size}x{size} {args.planner:>11} {backend:>12}: {summary ["nodes_expanded"] / foods:10.1f} nodes/food, '
+                  f'{1000 * elapsed / foods:8.3f} ms/food, {foods} foods, {deaths}/{args.games} deaths')
+
+
+def benchmark_simulate(args):
+    """
+    Throughput, pathfind latency and scores of whole headless games.
+    """
+    # On a map the board has its size
+    wall_map = load_map(args.map) if args.map else None
+    cols, rows = (wall_map.cols, wall_map.rows) if wall_map is not None else (args.size, args.size)
+
+    def make_planner():
+        snake = Jormungandr(cols * 10, rows * 10, args.heuristic, backend = args.backend, search = args.search, survival = args.survival, wall_map = wall_map)
+        if args.planner == 'hamiltonian':
+            return HamiltonianPlanner(snake)
+        return snake
+
+    simulation = Simulation(make_planner, cols, rows, max_foods = args.foods, wall_map = wall_map)
+    simulation.run(args.games, args.seed)
+    simulation.print_summary()
+
+
+def benchmark_env(args):
+    """
+    Environment steps per second of SnakeGame, of VecSnakeGame with different numbers of boards and of
+    SubprocVecSnakeGame with different numbers of workers, with uniformly random actions.
+    """
+    random.seed(args.seed)
+    environment = SnakeGame(None, width = args.size, height = args.size, seed = args.seed)
+
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        terminal, _, next_state = environment.step(random.randrange(3))
+        environment.state = next_state
+        if terminal:
+            environment.reset()
+
+    single = args.steps / (time.perf_counter() - start)
+    print(f'SnakeGame:            {single:>12,.0f} steps/s')
+
+    rng = np.random.default_rng(args.seed)
+    for boards in args.boards:
+        environment = VecSnakeGame(boards, args.size, args.size, seed = args.seed)
+        actions = rng.integers(0, 3, (max(1, args.steps // boards), boards))
+
+        start = time.perf_counter()
+        for batch in actions:
+            environment.step(batch)
+
+        rate = actions.size / (time.perf_counter() - start)
+        print(f'VecSnakeGame {boards:>7}: {rate:>12,.0f} steps/s, {rate / single:6.1f}x')
+
+    # SnakeGame boards stepped by worker processes through shared memory
+    for workers in args.workers:
+        with SubprocVecSnakeGame(args.subproc_boards, workers, args.size, args.size, seed = args.seed) as environment:
+            actions = rng.integers(0, 3, (max(1, args.steps // args.subproc_boards), args.subproc_boards))
+
+            start = time.perf_counter()
+            for batch in actions:
+                environment.step(batch)
+
+            rate = actions.size / (time.perf_counter() - start)
+            print(f'SubprocVecSnakeGame {args.subproc_boards} boards, {workers:>3} workers: {rate:>12,.0f} steps/s, {rate / single:6.1f}x')
+
+
+def benchmark_length(args):
+    """
+    Step time of SnakeGame with snakes of different lengths.
+
+    The snake zigzags along the rows of the board (left to right, then right to left on the next row), the
+    body follows the head on the same path and the food is at the end of it, so no step kills the snake,
+    eats or resets and only the length changes between the runs.
+    """
+    size = args.size
+    path = [ (x if y % 2 == 0 else size - x, y) for y in range(size + 1) for x in range(size + 1) ]
+    heading = lambda a, b: 'E' if b [0] > a [0] else 'W' if b [0] < a [0] else 'S'
+
+    for length in args.lengths:
+        if length + args.steps > len(path):
+            raise ValueError('The board of ' + str(size + 1) + 'x' + str(size + 1) + ' cells is too small for a snake of ' +
+                             str(length) + ' cells and ' + str(args.steps) + ' steps')
+
+        environment = SnakeGame(None, width = size, height = size)
+
+        # Body on the start of the path, head first
+        environment.snake_body.clear()
+        environment.board.clear()
+        for x, y in path [:length]:
+            environment.snake_body.appendleft((x, y))
+            environment.board.push_head(x, y)
+        environment.x, environment.y = path [length - 1]
+        environment.food_x, environment.food_y = path [-1]
+
+        direction = heading(path [length - 2], path [length - 1])
+        environment.state = { feature: int(feature == 'Going' + { 'N': 'North', 'S': 'South', 'W': 'West', 'E': 'East' } [direction])
+                              for feature in FEATURES }
+
+        # Relative actions that follow the path
+        actions = []
+        for a, b in zip(path [length - 1:length + args.steps - 1], path [length:length + args.steps]):
+            next_direction = heading(a, b)
+            actions.append(next(action for action in range(3) if DIRECTION_DICT [direction] [action] == next_direction))
+            direction = next_direction
+
+        start = time.perf_counter()
+        for action in actions:
+            terminal, _, environment.state = environment.step(action)
+
+        elapsed = time.perf_counter() - start
+        if terminal or len(environment.snake_body) != length:
+            raise RuntimeError('The snake left the path')
+
+        print(f'Length {length:>7,}: {elapsed / args.steps * 1e6:8.2f} us/step')
+
+
+def benchmark_spawn(args):
+    """
+    Cost of placing the food on boards filled to different fractions, drawing random cells until one is
+    free against one draw from the FreeCellIndex of the board.
+    """
+    size = args.size
+    path = [ (x if y % 2 == 0 else size - 1 - x, y) for y in range(size) for x in range(size) ]
+    rng = random.Random(args.seed)
+
+    for fill in args.fills:
+        board = FreeCellBoard.from_body(size, size, path [:int(fill * len(path))] [::-1])
+
+        start = time.perf_counter()
+        for _ in range(args.spawns):
+            x, y = rng.randrange(size), rng.randrange(size)
+            while board.occupied(x, y):
+                x, y = rng.randrange(size), rng.randrange(size)
+        rejection = (time.perf_counter() - start) / args.spawns
+
+        start = time.perf_counter()
+        for _ in range(args.spawns):
+            board.random_free(rng)
+        index = (time.perf_counter() - start) / args.spawns
+
+        print(f'Fill {fill:5.0%}: rejection {rejection * 1e6:8.2f} us, free cell index {index * 1e6:6.2f} us')
+
+
+def benchmark_updates(args):
+    """
+    Cost of the Q-learning updates of a vector environment step, one call of update_QLearning per board
+    against one update_QLearning_batch, with random transitions over the 2048 states.
+    """
+    rng = np.random.default_rng(args.seed)
+
+    for boards in args.boards:
+        agent = RL_Jormungandr(alpha = 0.1, action_selector = EpsilonGreedy(0, 0), environment = None, checkpoint = None)
+        states, next_states = rng.integers(0, N_STATES, (2, boards))
+        actions = rng.integers(0, 3, boards)
+        rewards = rng.choice([-10, -1, 10], boards)
+        terminal = rewards != -1
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            for board in range(boards):
+                agent.update_QLearning(states [board], actions [board], rewards [board], next_states [board], terminal [board])
+        loop = (time.perf_counter() - start) / args.repeats
+
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            agent.update_QLearning_batch(states, actions, rewards, next_states, terminal)
+        batch = (time.perf_counter() - start) / args.repeats
+
+        print(f'{boards:>7} updates: one by one {loop * 1e3:9.3f} ms, batch {batch * 1e3:7.3f} ms, {loop / batch:6.1f}x')
+
+
+def benchmark_symmetry(args):
+    """
+    Learning curves of Q-learning with the plain Q table and with the mirror symmetric one, the same games
+    (seeds) for both. Every window prints the foods eaten per episode (episodes end eating or dying).
+    """
+    curves = {}
+    for symmetric in (False, True):
+        curve = np.zeros(args.episodes // args.window)
+        for seed in range(args.seed, args.seed + args.runs):
+            random.seed(seed)
+            np.random.seed(seed)
+            environment = SnakeGame(None, width = args.size, height = args.size, observation = 'int', seed = seed)
+            agent = RL_Jormungandr(alpha = 0.1, action_selector = EpsilonGreedy(args.epsilon, args.epsilon, reduce_on_steps = True),
+                                   environment = environment, checkpoint = None, symmetric = symmetric)
+            solver = QLearning(agent, environment, planner = None, save_path = None, test = False)
+
+            food = 0
+            for episode in range(len(curve) * args.window):
+                solver.run_episode()
+                if (episode + 1) % args.window == 0:
+                    curve [episode // args.window] += (environment.food_eaten - food) / args.window
+                    food = environment.food_eaten
+
+        curves [symmetric] = curve / args.runs
+
+    print(f'{"Episodes":>9} {"plain":>7} {"mirror":>7}')
+    for window, (plain, mirror) in enumerate(zip(curves [False], curves [True]), 1):
+        print(f'{window * args.window:>9} {plain:7.3f} {mirror:7.3f}')
+
+
+def benchmark_traces(args):
+    """
+    Learning curves against wall clock time of Q-learning, n-step SARSA, SARSA(lambda) and Q(lambda), the
+    same games (seed) for all of them. Every window prints the foods eaten per episode (episodes end eating
+    or dying) and the seconds of training so far.
+    """
+    solvers = {
+        'qlearning': lambda agent, environment: QLearning(agent, environment, planner = None, save_path = None, test = False),
+        'nstepsarsa': lambda agent, environment: n_step_SARSA(args.n_steps, agent, environment, planner = None, save_path = None, test = False),
+        'sarsalambda': lambda agent, environment: SARSALambda(agent, environment, save_path = None, test = False, lam = args.lam, trace = args.trace),
+        'qlambda': lambda agent, environment: QLambda(agent, environment, save_path = None, test = False, lam = args.lam, trace = args.trace),
+    }
+
+    for name, make_solver in solvers.items():
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        environment = SnakeGame(None, width = args.size, height = args.size, observation = 'int', seed = args.seed)
+        agent = RL_Jormungandr(alpha = 0.1, action_selector = EpsilonGreedy(args.epsilon, args.epsilon, reduce_on_steps = True),
+                               environment = environment, checkpoint = None)
+        solver = make_solver(agent, environment)
+
+        points, food, seconds = [], 0, 0.0
+        for window in range(args.episodes // args.window):
+            start = time.perf_counter()
+            for _ in range(args.window):
+                solver.run_episode()
+            seconds += time.perf_counter() - start
+
+            points.append(f'{(environment.food_eaten - food) / args.window:.2f} @ {seconds:.1f}s')
+            food = environment.food_eaten
+
+        print(f'{name:>12}: ' + ', '.join(points))
+
+
+def benchmark_mcts(args):
+    """
+    Score and latency of the MCTS planner against the search budget. Every game is played until the snake
+    dies (or max moves), the score is the number of foods eaten. A budget of 0 simulations is the greedy
+    policy of Q.
+    """
+    wall_map = load_map(args.map) if args.map else None
+    environment = SnakeGame(None, width = args.size, height = args.size, wall_map = wall_map, observation = 'int', seed = args.seed)
+
+    # Q of a checkpoint or learned here with Q-learning
+    action_selector = EpsilonGreedy(0.1, 0.1)
+    action_selector.epsilon = 0.1
+    agent = RL_Jormungandr(alpha = 0.1, action_selector = action_selector, environment = environment, checkpoint = args.checkpoint)
+
+    if args.checkpoint is None:
+        random.seed(args.seed)
+        for _ in range(args.train_steps):
+            state = environment.state
+            action = agent.select_action(state)
+            terminal, reward, next_state = environment.step(action)
+            agent.update_QLearning(state, action, reward, next_state, terminal)
+            environment.state = next_state
+            if terminal:
+                environment.reset()
+
+    for simulations in args.simulations:
+        planner = MCTS(agent, environment, simulations = simulations, milliseconds = args.milliseconds,
+                       rollout_steps = args.rollout_steps, workers = args.workers, seed = args.seed)
+        scores, latencies, reused = [], [], 0
+
+        for game in range(args.games):
+
+            # A new game from the start of the board
+            environment.rng.seed(args.seed + game)
+            environment.food_before = False
+            environment.reset()
+
+            score, moves, terminal = 0, 0, False
+            while moves < args.max_moves:
+                start = time.perf_counter()
+                action = planner.search()
+                latencies.append(time.perf_counter() - start)
+                reused += planner.reused
+
+                terminal, reward, environment.state = environment.step(action)
+                moves += 1
+                if terminal:
+                    if not environment.food_before:
+                        break
+                    score += 1
+                    environment.reset()
+
+            scores.append(score)
+
+        planner.close()
+        latencies = np.array(latencies) * 1000
+        print(f'Simulations {simulations:>5}: score mean {np.mean(scores):6.1f}, max {max(scores):4} | '
+              f'latency p50 {np.percentile(latencies, 50):7.3f} ms, p99 {np.percentile(latencies, 99):7.3f} ms | '
+              f'subtree reused {reused / len(latencies):4.0%}')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Benchmarks for the Jormungandr agents.")
+    subparsers = parser.add_subparsers(dest = 'benchmark', required = True)
+
+    # Pathfinding backends
+    pathfind = subparsers.add_parser('pathfind', help = "Nodes expanded per second of each A* backend.")
+    pathfind.add_argument("--sizes", type = int, nargs = '+', default = [50, 100, 200], help = "Board sizes (in cells) to benchmark.")
+    pathfind.add_argument("--positions", type = int, default = 100, help = "Number of random positions per board size.")
+    pathfind.add_argument("--length", type = int, default = 30, help = "Length of the snake on the random positions.")
+    pathfind.add_argument("--backends", type = str, nargs = '+', default = list(BACKENDS), choices = BACKENDS, help = "Backends to compare.")
+    pathfind.add_argument("--searches", type = str, nargs = '+', default = ['greedy'], choices = SEARCH_MODES, help = "Search modes to compare (the legacy backend is greedy only).")
+    pathfind.add_argument("-w", "--weight", type = float, default = 2.0, help = "Weight of the heuristic in weighted A*.")
+    pathfind.add_argument("-hh", "--heuristic", type = str, default = 'manhattan', choices = HEURISTICS, help = "Heuristic used by the search.")
+    pathfind.add_argument("--seed", type = int, default = 0, help = "Seed for the random positions.")
+    pathfind.set_defaults(run = benchmark_pathfind)
+
+    # Replanning along whole games
+    replan = subparsers.add_parser('replan', help = "Planning cost per food of each A* backend along whole games.")
+    replan.add_argument("--sizes", type = int, nargs = '+', default = [30, 50], help = "Board sizes (in cells) to benchmark.")
+    replan.add_argument("--games", type = int, default = 5, help = "Number of games per board size.")
+    replan.add_argument("--foods", type = int, default = 200, help = "Maximum number of foods per game.")
+    replan.add_argument("--backends", type = str, nargs = '+', default = ['grid'], choices = BACKENDS, help = "Backends to compare.")
+    replan.add_argument("-sm", "--search", type = str, default = 'astar', choices = SEARCH_MODES, help = "Search mode of the grid backend.")
+    replan.add_argument("-hh", "--heuristic", type = str, default = 'manhattan', choices = HEURISTICS, help = "Heuristic used by the search.")
+    replan.add_argument("-p", "--planner", type = str, default = 'astar', choices = ['astar', 'hamiltonian'], help = "Plan with A* only or with the Hamiltonian cycle once the snake is long.")
+    replan.add_argument("--switch-fill", type = float, default = 0.1, help = "Fraction of the board the snake fills when the Hamiltonian planner stops using A*.")
+    replan.add_argument("--survival", action = 'store_true', default = False, help = "Check the paths to the food and chase the tail when they are not safe.")
+    replan.add_argument("--seed", type = int, default = 0, help = "Seed for the food positions.")
+    replan.set_defaults(run = benchmark_replan)
+
+    # Batches of positions over a process pool
+    batch = subparsers.add_parser('batch', help = "Throughput of pathfind_many with different numbers of worker processes.")
+    batch.add_argument("--size", type = int, default = 50, help = "Board size (in cells).")
+    batch.add_argument("--positions", type = int, default = 5000, help = "Number of random positions.")
+    batch.add_argument("--length", type = int, default = 30, help = "Length of the snake on the random positions.")
+    batch.add_argument("--workers", type = int, nargs = '+', default = [1, 2, 4], help = "Numbers of worker processes to compare.")
+    batch.add_argument("--chunk-size", type = int, default = None, help = "Positions per task, 4 tasks per worker by default.")
+    batch.add_argument("-b", "--backend", type = str, default = 'grid', choices = BACKENDS, help = "Backend of the A* search.")
+    batch.add_argument("-sm", "--search", type = str, default = 'astar', choices = SEARCH_MODES, help = "Search mode of the A* search.")
+    batch.add_argument("-hh", "--heuristic", type = str, default = 'manhattan', choices = HEURISTICS, help = "Heuristic used by the search.")
+    batch.add_argument("--seed", type = int, default = 0, help = "Seed for the random positions.")
+    batch.set_defaults(run = benchmark_batch)
+
+    # Headless games
+    simulate = subparsers.add_parser('simulate', help = "Throughput, pathfind latency and scores of headless games.")
+    simulate.add_argument("--size", type = int, default = 30, help = "Board size (in cells).")
+    simulate.add_argument("--games", type = int, default = 20, help = "Number of games.")
+    simulate.add_argument("--foods", type = int, default = None, help = "Maximum number of foods per game, no limit by default.")
+    simulate.add_argument("-b", "--backend", type = str, default = 'grid', choices = BACKENDS, help = "Backend of the A* search.")
+    simulate.add_argument("-sm", "--search", type = str, default = 'astar', choices = SEARCH_MODES, help = "Search mode of the A* search.")
+    simulate.add_argument("-hh", "--heuristic", type = str, default = 'manhattan', choices = HEURISTICS, help = "Heuristic used by the search.")
+    simulate.add_argument("-p", "--planner", type = str, default = 'astar', choices = ['astar', 'hamiltonian'], help = "Plan with A* only or with the Hamiltonian cycle once the snake is long.")
+    simulate.add_argument("--survival", action = 'store_true', default = False, help = "Check the paths to the food and chase the tail when they are not safe.")
+    simulate.add_argument("-m", "--map", type = str, default = None, help = "Map file with fixed walls, replaces --size.")
+    simulate.add_argument("--seed", type = int, default = 0, help = "Seed for the food positions.")
+    simulate.set_defaults(run = benchmark_simulate)
+
+    # Environments
+    env = subparsers.add_parser('env', help = "Steps per second of SnakeGame, VecSnakeGame and SubprocVecSnakeGame.")
+    env.add_argument("--size", type = int, default = 20, help = "Width and height of the boards (cells from 0 to size).")
+    env.add_argument("--steps", type = int, default = 200000, help = "Steps of every environment.")
+    env.add_argument("--boards", type = int, nargs = '+', default = [64, 1024, 16384], help = "Numbers of boards of VecSnakeGame to compare.")
+    env.add_argument("--workers", type = int, nargs = '*', default = [], help = "Numbers of worker processes of SubprocVecSnakeGame to compare.")
+    env.add_argument("--subproc_boards", type = int, default = 256, help = "Boards of SubprocVecSnakeGame.")
+    env.add_argument("--seed", type = int, default = 0, help = "Seed for the actions and the food positions.")
+    env.set_defaults(run = benchmark_env)
+
+    # Step time against the length of the snake
+    length = subparsers.add_parser('length', help = "Step time of SnakeGame with snakes of different lengths.")
+    length.add_argument("--size", type = int, default = 299, help = "Width and height of the board (cells from 0 to size).")
+    length.add_argument("--lengths", type = int, nargs = '+', default = [3, 100, 1000, 10000, 50000], help = "Lengths of the snake to compare.")
+    length.add_argument("--steps", type = int, default = 20000, help = "Steps timed for every length.")
+    length.set_defaults(run = benchmark_length)
+
+    # Food placement on crowded boards
+    spawn = subparsers.add_parser('spawn', help = "Cost of placing the food on boards filled to different fractions.")
+    spawn.add_argument("--size", type = int, default = 50, help = "Board size (in cells).")
+    spawn.add_argument("--fills", type = float, nargs = '+', default = [0.05, 0.5, 0.9, 0.95, 0.99], help = "Fractions of the board covered by the snake.")
+    spawn.add_argument("--spawns", type = int, default = 20000, help = "Foods placed for every fraction.")
+    spawn.add_argument("--seed", type = int, default = 0, help = "Seed for the food positions.")
+    spawn.set_defaults(run = benchmark_spawn)
+
+    # Batched Q updates
+    updates = subparsers.add_parser('updates', help = "Cost of one by one against batched Q-learning updates.")
+    updates.add_argument("--boards", type = int, nargs = '+', default = [16, 256, 4096, 65536], help = "Updates per batch to compare.")
+    updates.add_argument("--repeats", type = int, default = 10, help = "Batches timed for every size.")
+    updates.add_argument("--seed", type = int, default = 0, help = "Seed for the transitions.")
+    updates.set_defaults(run = benchmark_updates)
+
+    # Learning curves with the mirror symmetry
+    symmetry = subparsers.add_parser('symmetry', help = "Learning curves of Q-learning with and without the mirror symmetry of Q.")
+    symmetry.add_argument("--size", type = int, default = 14, help = "Width and height of the board (cells from 0 to size).")
+    symmetry.add_argument("--episodes", type = int, default = 3000, help = "Episodes of every run.")
+    symmetry.add_argument("--window", type = int, default = 250, help = "Episodes per point of the curves.")
+    symmetry.add_argument("--runs", type = int, default = 5, help = "Runs (seeds) averaged.")
+    symmetry.add_argument("--epsilon", type = float, default = 0.1, help = "Epsilon of the epsilon-greedy policy.")
+    symmetry.add_argument("--seed", type = int, default = 0, help = "Seed of the first run.")
+    symmetry.set_defaults(run = benchmark_symmetry)
+
+    # Learning curves of the lambda-return solvers
+    traces = subparsers.add_parser('traces', help = "Learning curves against time of Q-learning, n-step SARSA, SARSA(lambda) and Q(lambda).")
+    traces.add_argument("--size", type = int, default = 14, help = "Width and height of the board (cells from 0 to size).")
+    traces.add_argument("--episodes", type = int, default = 2000, help = "Episodes of every solver.")
+    traces.add_argument("--window", type = int, default = 250, help = "Episodes per point of the curves.")
+    traces.add_argument("--lam", type = float, default = 0.9, help = "Lambda of SARSA(lambda) and Q(lambda).")
+    traces.add_argument("--trace", type = str, default = 'replacing', choices = TRACE_MODES, help = "Replacing or accumulating traces.")
+    traces.add_argument("--n_steps", type = int, default = 3, help = "Steps of n-step SARSA.")
+    traces.add_argument("--epsilon", type = float, default = 0.1, help = "Epsilon of the epsilon-greedy policy.")
+    traces.add_argument("--seed", type = int, default = 0, help = "Seed for the food positions and the exploration.")
+    traces.set_defaults(run = benchmark_traces)
+
+    # Tree search over the environment
+    mcts = subparsers.add_parser('mcts', help = "Score and latency of the MCTS planner against the search budget.")
+    mcts.add_argument("--size", type = int, default = 14, help = "Width and height of the board (cells from 0 to size).")
+    mcts.add_argument("--simulations", type = int, nargs = '+', default = [0, 10, 50, 200], help = "Simulations per move to compare.")
+    mcts.add_argument("--milliseconds", type = float, default = None, help = "Time budget per move, on top of the simulations.")
+    mcts.add_argument("--rollout-steps", type = int, default = 0, help = "Greedy steps played from every new leaf.")
+    mcts.add_argument("--workers", type = int, default = 1, help = "Processes searching in parallel.")
+    mcts.add_argument("--games", type = int, default = 10, help = "Games per budget.")
+    mcts.add_argument("--max-moves", type = int, default = 2000, help = "Moves after which a game stops.")
+    mcts.add_argument("-c", "--checkpoint", type = str, default = None, help = "Q to load, learned with Q-learning before the games by default.")
+    mcts.add_argument("--train-steps", type = int, default = 200000, help = "Q-learning steps without a checkpoint.")
+    mcts.add_argument("-m", "--map", type = str, default = None, help = "Map file with fixed walls, replaces --size.")
+    mcts.add_argument("--seed", type = int, default = 0, help = "Seed for the food positions and the training.")
+    mcts.set_defaults(run = benchmark_mcts)
+
+    args = parser.parse_args()
+    args.run(args)
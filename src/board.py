@@ -0,0 +1,446 @@
+from array import array
+from collections import deque
+
+# Bits of the neighbour occupancy mask
+NORTH, SOUTH, WEST, EAST = 1, 2, 4, 8
+
+# Release time of the walls, they are never released
+WALL_STAMP = 1 << 30
+
+# Width of the border of walls around the board, with two cells the neighbours of a head that just left
+# the board are still on the board
+BORDER = 2
+
+
+class Bitboard():
+    """
+    Occupancy of a board of width x height cells packed in bits, shared by the pathfinder and the environment.
+
+    The board is surrounded by a border of wall cells, so out of bounds cells are just occupied cells and
+    neighbour checks need no bounds checks. The cell (X, Y) is the bit (Y + BORDER) * stride + X + BORDER.
+    The body is kept in a deque of bit indices (head first) and every cell remembers when it was pushed,
+    which gives the number of moves after which a segment leaves its cell. Fixed walls inside the board
+    (see walls.WallMap) are occupied cells just like the border.
+    """
+
+    def __init__(self, width: int, height: int, walls = ()):
+
+        self.width = width
+        self.height = height
+        self.stride = width + 2 * BORDER
+
+        size = self.stride * (height + 2 * BORDER)
+        self.size = size
+        self.bits = bytearray((size + 7) // 8)
+
+        # Walls (the border and the given cells) are occupied cells which are never released
+        self.walls = bytearray(size)
+        self.stamp = array('i', [0]) * size
+        border = list(range(BORDER * self.stride)) + list(range(size - BORDER * self.stride, size)) + \
+                 [ y * self.stride + x for y in range(BORDER, height + BORDER)
+                   for x in list(range(BORDER)) + list(range(width + BORDER, self.stride)) ]
+        for index in border + [ self.index(x, y) for x, y in walls ]:
+            self.walls [index] = 1
+            self.stamp [index] = WALL_STAMP
+            self.bits [index >> 3] |= 1 << (index & 7)
+
+        # Walls as a Python integer, for flood fills
+        self.wall_bits = self.to_int()
+
+        # Body of the snake, head first
+        self.body = deque()
+        self.pushes = 0
+
+        # Changes since the last snapshot and its key, restore undoes them (see snapshot)
+        self.journal = None
+        self.key = None
+
+    @classmethod
+    def from_body(cls, width: int, height: int, body, walls = ()):
+        """
+        Builds a board with the given body, a sequence of (X, Y) cells, head first.
+        """
+        board = cls(width, height, walls)
+        for x, y in reversed(body):
+            board.push_head(x, y)
+
+        return board
+
+    def index(self, x: int, y: int) -> int:
+        """
+        Returns the bit index of the cell (X, Y).
+        """
+        return (y + BORDER) * self.stride + x + BORDER
+
+    def cell(self, index: int) -> tuple:
+        """
+        Returns the cell (X, Y) of a bit index.
+        """
+        y, x = divmod(index, self.stride)
+        return x - BORDER, y - BORDER
+
+    def test(self, index: int) -> int:
+        """
+        Returns 1 if the bit index is occupied (body or wall), 0 otherwise.
+        """
+        return self.bits [index >> 3] >> (index & 7) & 1
+
+    def occupied(self, x: int, y: int) -> int:
+        """
+        Returns 1 if the cell (X, Y) is occupied by the body, a wall or out of the board, 0 otherwise.
+        """
+        index = (y + BORDER) * self.stride + x + BORDER
+        return self.bits [index >> 3] >> (index & 7) & 1
+
+    def push_head(self, x: int, y: int) -> bool:
+        """
+        Moves the head to the cell (X, Y).
+
+        Returns:
+            True if the new head collides with the body or leaves the board.
+        """
+        index = (y + BORDER) * self.stride + x + BORDER
+        self.body.appendleft(index)
+
+        collision = self.bits [index >> 3] >> (index & 7) & 1
+        journal = self.journal
+        if journal is not None:
+            journal.append((index, collision, self.stamp [index]))
+            # Every pop follows a push, the journal is at most twice the board
+            if len(journal) > self.size:
+                self.record(False)
+
+        if self.walls [index]:
+            return True
+
+        self.bits [index >> 3] |= 1 << (index & 7)
+        self.pushes += 1
+        self.stamp [index] = self.pushes
+
+        return bool(collision)
+
+    def pop_tail(self) -> tuple:
+        """
+        Removes the tail of the body and returns its cell (X, Y).
+        """
+        index = self.body.pop()
+        if self.journal is not None:
+            self.journal.append((index, self.bits [index >> 3] >> (index & 7) & 1, None))
+
+        if not self.walls [index]:
+            self.bits [index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+        return self.cell(index)
+
+    def clear(self):
+        """
+        Removes the whole body from the board.
+        """
+        while self.body:
+            self.pop_tail()
+
+    def snapshot(self, into: list = None) -> list:
+        """
+        Saves the body of the board and starts a journal of the pushes and pops that follow, restore undoes
+        them. Saving and restoring cost the length of the body and the moves in between, whatever the size of
+        the board. A previous snapshot can be passed to reuse its buffers.
+
+        return: List [body, stamps of the body, pushes, key].
+        """
+        if into is None:
+            into = [deque(), [], 0, None]
+
+        body = into [0]
+        body.clear()
+        body.extend(self.body)
+        into [1] [:] = map(self.stamp.__getitem__, self.body)
+        into [2] = self.pushes
+
+        self.record(True)
+        into [3] = self.key = object()
+
+        return into
+
+    def restore(self, snapshot: list):
+        """
+        Restores a snapshot of the board, it can be restored again afterwards. The last snapshot of the board
+        is restored by undoing its journal, any other one (an older one, or one of another board) by taking
+        the body off the board and pushing the saved one.
+        """
+        if snapshot [3] is self.key:
+            self.rollback()
+            return
+
+        self.record(False)
+        self.clear()
+        for index in reversed(snapshot [0]):
+            self.push_head(*self.cell(index))
+
+        stamp, walls = self.stamp, self.walls
+        for index, value in zip(snapshot [0], snapshot [1]):
+            if not walls [index]:
+                stamp [index] = value
+        self.pushes = snapshot [2]
+
+        self.record(True)
+        self.key = snapshot [3]
+
+    def record(self, on: bool):
+        """
+        Starts a new journal of the pushes and pops (on) or stops it, see snapshot.
+        """
+        if not on:
+            self.journal = self.key = None
+        elif self.journal is None:
+            self.journal = []
+        else:
+            self.journal.clear()
+
+    def rollback(self):
+        """
+        Undoes the pushes and pops of the journal, the newest first.
+        """
+        bits, stamp, walls, body = self.bits, self.stamp, self.walls, self.body
+        journal = self.journal
+
+        # Pops are the entries without the stamp to put back
+        for index, bit, old in reversed(journal):
+            if old is None:
+                body.append(index)
+            else:
+                body.popleft()
+
+            if walls [index]:
+                continue
+
+            if old is not None:
+                stamp [index] = old
+                self.pushes -= 1
+
+            if bit:
+                bits [index >> 3] |= 1 << (index & 7)
+            else:
+                bits [index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+        journal.clear()
+
+    def neighbour_mask(self, x: int, y: int) -> int:
+        """
+        Returns the occupancy of the cells around (X, Y) as a mask of NORTH, SOUTH, WEST and EAST bits.
+        """
+        index = (y + BORDER) * self.stride + x + BORDER
+        bits, stride = self.bits, self.stride
+
+        north, south = index - stride, index + stride
+        west, east = index - 1, index + 1
+
+        return (bits [north >> 3] >> (north & 7) & 1) * NORTH | (bits [south >> 3] >> (south & 7) & 1) * SOUTH | \
+               (bits [west >> 3] >> (west & 7) & 1) * WEST | (bits [east >> 3] >> (east & 7) & 1) * EAST
+
+    def popcount(self) -> int:
+        """
+        Returns the number of occupied bits: the body, the walls inside the board and the border.
+        """
+        return bin(self.to_int()).count('1')
+
+    def release(self, index: int) -> int:
+        """
+        Number of moves after which the bit index is free: 0 for free cells, 1 for the tail,
+        len(body) - 1 for the segment after the head. Walls are never released.
+        """
+        if not self.bits [index >> 3] >> (index & 7) & 1:
+            return 0
+
+        return self.stamp [index] - self.stamp [self.body [-1]] + 1
+
+    def to_int(self) -> int:
+        """
+        Returns the occupancy as a Python integer, bit i of the integer is the bit index i.
+        """
+        return int.from_bytes(self.bits, 'little')
+
+    def mask(self, indices) -> int:
+        """
+        Returns the given bit indices as a Python integer.
+        """
+        bits = bytearray(len(self.bits))
+        for index in indices:
+            bits [index >> 3] |= 1 << (index & 7)
+
+        return int.from_bytes(bits, 'little')
+
+    def flood_fill(self, index: int, free: int) -> int:
+        """
+        Returns the cells reachable from the bit index through the free cells, as a Python integer.
+
+        The whole frontier grows at once by shifting the region one cell in every direction, so every
+        iteration is a handful of big integer operations. The free cells must not include the border,
+        which keeps the shifts from wrapping around the rows.
+        """
+        stride = self.stride
+        region = 1 << index
+
+        while True:
+            grown = (region << 1 | region >> 1 | region << stride | region >> stride) & free | region
+            if grown == region:
+                return region
+
+            region = grown
+
+
+class FreeCellIndex():
+    """
+    Set of the free cells of a board with O(1) removal, insertion and uniform sampling.
+
+    Every cell that is not a wall is in the array cells: the first count cells are the free ones and the
+    rest are occupied. position gives where every cell is in the array, so removing a cell swaps it with
+    the last free cell and inserting it swaps it with the first occupied cell. A random free cell is
+    cells [randrange(count)], the same cost on an empty board as on a full one.
+    """
+
+    def __init__(self, size: int, walls: bytearray):
+        """
+        Args:
+            size (int): Number of cells (bit indices) of the board.
+            walls (bytearray): 1 on the cells that are never free (Bitboard.walls).
+        """
+        # Lists rather than arrays, indexing them does not box the integers
+        self.cells = [ index for index in range(size) if not walls [index] ]
+        self.position = [-1] * size
+        for position, index in enumerate(self.cells):
+            self.position [index] = position
+
+        self.count = len(self.cells)
+
+        # Positions of the removals (i) and additions (~i) since the last snapshot of the board, see rollback
+        self.journal = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, index: int) -> bool:
+        return 0 <= self.position [index] < self.count
+
+    def remove(self, index: int):
+        """
+        Marks the cell as occupied, nothing happens if it already is.
+        """
+        cells, position = self.cells, self.position
+        i = position [index]
+        if not 0 <= i < self.count:
+            return
+
+        self.count -= 1
+        last = cells [self.count]
+        cells [i], cells [self.count] = last, index
+        position [last], position [index] = i, self.count
+
+        if self.journal is not None:
+            self.journal.append(i)
+
+    def add(self, index: int):
+        """
+        Marks the cell as free, nothing happens if it already is (or if it is a wall).
+        """
+        cells, position = self.cells, self.position
+        i = position [index]
+        if i < self.count:
+            return
+
+        first = cells [self.count]
+        cells [i], cells [self.count] = first, index
+        position [first], position [index] = i, self.count
+        self.count += 1
+
+        if self.journal is not None:
+            self.journal.append(~i)
+
+    def record(self, on: bool):
+        """
+        Starts a new journal of the removals and additions (on) or stops it, see Bitboard.snapshot.
+        """
+        if not on:
+            self.journal = None
+        elif self.journal is None:
+            self.journal = []
+        else:
+            self.journal.clear()
+
+    def rollback(self):
+        """
+        Undoes the removals and additions of the journal, the newest first. Every one swapped the cell with
+        the first occupied one, so the cells go back to the same order and the same draws give the same cells.
+        """
+        cells, position = self.cells, self.position
+        journal = self.journal
+
+        for i in reversed(journal):
+            # Removals moved the count down and additions up, the cells are swapped back the other way
+            if i >= 0:
+                boundary = self.count
+                self.count += 1
+            else:
+                i = ~i
+                self.count -= 1
+                boundary = self.count
+
+            cells [i], cells [boundary] = cells [boundary], cells [i]
+            position [cells [i]], position [cells [boundary]] = i, boundary
+
+        journal.clear()
+
+    def sample(self, rng) -> int:
+        """
+        Returns a random free cell, rng is a random.Random (or the random module).
+        """
+        if not self.count:
+            raise ValueError('There are no free cells on the board')
+
+        return self.cells [rng.randrange(self.count)]
+
+
+class FreeCellBoard(Bitboard):
+    """
+    Bitboard that also keeps a FreeCellIndex of its free cells, updated with the head pushes and the tail
+    pops, so the food is placed with one random draw however full the board is. Used by the game loops,
+    the pathfinder boards do not pay for it.
+    """
+
+    def __init__(self, width: int, height: int, walls = ()):
+
+        super().__init__(width, height, walls)
+        self.free_cells = FreeCellIndex(self.size, self.walls)
+
+    def push_head(self, x: int, y: int) -> bool:
+
+        collision = super().push_head(x, y)
+
+        # On a collision the cell was not free already
+        if not collision:
+            self.free_cells.remove(self.body [0])
+
+        return collision
+
+    def pop_tail(self) -> tuple:
+
+        index = self.body [-1]
+        cell = super().pop_tail()
+        self.free_cells.add(index)
+
+        return cell
+
+    def record(self, on: bool):
+
+        super().record(on)
+        self.free_cells.record(on)
+
+    def rollback(self):
+
+        super().rollback()
+        self.free_cells.rollback()
+
+    def random_free(self, rng) -> tuple:
+        """
+        Returns a random free cell (X, Y).
+        """
+        return self.cell(self.free_cells.sample(rng))
@@ -0,0 +1,13 @@
+import os
+
+# Directory of the caches built from the board (Hamiltonian cycles, distances of the wall maps): the directory
+# in JORMUNGANDR_CACHE, otherwise jormungandr in the user cache directory ($XDG_CACHE_HOME or ~/.cache)
+CACHE_PATH = os.environ.get('JORMUNGANDR_CACHE') or \
+             os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'jormungandr')
+
+
+def cache_path(name: str) -> str:
+    """
+    Returns the directory of the cache with the given name, it is created when the first file is saved.
+    """
+    return os.path.join(CACHE_PATH, name)
@@ -0,0 +1,209 @@
+import os
+
+import numpy as np
+
+from cache import cache_path
+from Jormungandr import Jormungandr
+
+# Directory where the cycles are cached, one .npy file per board size
+CYCLES_PATH = cache_path('cycles')
+
+
+def hamiltonian_cycle(cols: int, rows: int) -> np.ndarray:
+    """
+    Builds a Hamiltonian cycle over a board of cols x rows cells.
+
+    The cycle goes right along the first row, zigzags down the rest of the board without using the
+    first column and comes back up the first column, which needs an even number of rows (the board
+    is transposed when only the number of columns is even).
+
+    return: Array with the position on the cycle of every cell, the cell (X, Y) is at index Y * cols + X.
+    """
+    if cols < 2 or rows < 2 or (cols % 2 and rows % 2):
+        raise ValueError('There is no hamiltonian cycle on a board of ' + str(cols) + 'x' + str(rows) + ' cells, one side must be even')
+
+    if rows % 2:
+        return hamiltonian_cycle(rows, cols).reshape(cols, rows).T.ravel()
+
+    path = [ (x, 0) for x in range(cols) ]
+    for y in range(1, rows):
+        columns = range(cols - 1, 0, -1) if y % 2 else range(1, cols)
+        path += [ (x, y) for x in columns ]
+    path += [ (0, y) for y in range(rows - 1, 0, -1) ]
+
+    order = np.empty(cols * rows, dtype = np.int32)
+    for position, (x, y) in enumerate(path):
+        order [y * cols + x] = position
+
+    return order
+
+
+def load_cycle(cols: int, rows: int, path: str = CYCLES_PATH) -> np.ndarray:
+    """
+    Returns the Hamiltonian cycle of the board size, it is built and saved on disk the first time.
+    """
+    file = os.path.join(path, 'hamiltonian_' + str(cols) + 'x' + str(rows) + '.npy')
+    if os.path.exists(file):
+        return np.load(file)
+
+    order = hamiltonian_cycle(cols, rows)
+    os.makedirs(path, exist_ok = True)
+    np.save(file, order)
+
+    return order
+
+
+class HamiltonianPlanner():
+    """
+    Follows a Hamiltonian cycle of the board, taking shortcuts towards the food.
+
+    While the body lies on the cycle in order (every segment is behind the previous one, going
+    backwards from the head to the tail), the cells ahead of the head on the cycle up to the tail are
+    free. Any neighbour of the head on that stretch is then a safe move, so the planner moves to the
+    one furthest along the cycle without going past the food. The body stays in order and the snake
+    survives until it fills the board, with O(1) work per move.
+
+    While the snake is shorter than switch_fill of the board A* plays (early game), with its paths checked
+    like in survival mode. Afterwards, until the body is in order, the snake follows the cycle if the cells
+    ahead are released in time and otherwise makes the first move of the A* path.
+    """
+
+    def __init__(self, snake: Jormungandr, switch_fill: float = 0.1, path: str = CYCLES_PATH):
+
+        if snake.wall_map is not None:
+            raise ValueError('The hamiltonian planner does not support wall maps')
+
+        self.snake = snake
+        self.cols = snake.COLS
+        self.rows = snake.ROWS
+        self.cells = self.cols * self.rows
+
+        # Position of every cell on the cycle and cell at every position
+        order = load_cycle(self.cols, self.rows, path)
+        self.order = order.tolist()
+        self.cycle = np.argsort(order).tolist()
+
+        # Length of the snake from which the cycle is used
+        self.switch_length = int(switch_fill * self.cells)
+
+        # Cell where the head gets with the last move taken on the cycle, -1 if it did not take one
+        self.expected = -1
+
+        # Nodes expanded by the last call to pathfind (A* only)
+        self.nodes_expanded = 0
+
+    def cell(self, board, index: int) -> int:
+        """
+        Returns the cell (Y * cols + X) of a bit index of the board.
+        """
+        x, y = board.cell(index)
+        return y * self.cols + x
+
+    def move(self, cell: int, next_cell: int) -> int:
+        """
+        Returns the move (1 up, 2 down, 3 left, 4 right) from a cell to its neighbour.
+        """
+        return {-self.cols: 1, self.cols: 2, -1: 3, 1: 4} [next_cell - cell]
+
+    def neighbours(self, cell: int):
+        """
+        Returns the cells above, below, to the left and to the right of the given cell.
+        """
+        cols = self.cols
+        row, col = divmod(cell, cols)
+        result = []
+        if row > 0:
+            result.append(cell - cols)
+        if row < self.rows - 1:
+            result.append(cell + cols)
+        if col > 0:
+            result.append(cell - 1)
+        if col < cols - 1:
+            result.append(cell + 1)
+
+        return result
+
+    def ordered(self, board) -> bool:
+        """
+        Checks that the body lies on the cycle in order, the positions of the segments relative to the
+        tail strictly decrease from the head to the tail.
+        """
+        order, cells = self.order, self.cells
+        tail = order [self.cell(board, board.body [-1])]
+
+        previous = cells
+        for index in board.body:
+            position = (order [self.cell(board, index)] - tail) % cells
+            if position >= previous:
+                return False
+            previous = position
+
+        return True
+
+    def clear_ahead(self, board) -> bool:
+        """
+        Checks that the snake can follow the cycle for a whole body length, every cell ahead is free or
+        released before the head gets to it. After that the body is in order.
+        """
+        cols = self.cols
+        head = self.order [self.cell(board, board.body [0])]
+
+        for steps in range(1, len(board.body) + 1):
+            x, y = divmod(self.cycle [(head + steps) % self.cells], cols) [::-1]
+            if board.release(board.index(x, y)) >= steps:
+                return False
+
+        return True
+
+    def pathfind(self, snake_body, food_pos: list):
+        """
+        Plans the next moves, same interface as Jormungandr.pathfind.
+
+        Args:
+            snake_body (list or Bitboard): List with snake's body (pixel coordinates, head first) or a Bitboard with it.
+            food_pos (list): Position of the food.
+
+        return: List with the action sequence
+        """
+        snake, order, cells = self.snake, self.order, self.cells
+        board = snake.as_board(snake_body)
+        head = self.cell(board, board.body [0])
+        self.nodes_expanded = 0
+
+        # The head is where the last cycle move left it, the body is still in order
+        if head != self.expected:
+
+            self.expected = -1
+
+            # Early game, A* paths are checked like in survival mode
+            if len(board.body) < self.switch_length:
+                path = snake.survive(board, food_pos, snake.search_path(board, food_pos))
+                self.nodes_expanded = snake.nodes_expanded
+                return path
+
+            # Getting the body in order, one move at a time
+            if not self.ordered(board):
+                if self.clear_ahead(board):
+                    next_cell = self.cycle [(order [head] + 1) % cells]
+                    return [self.move(head, next_cell)]
+
+                path = snake.survive(board, food_pos, snake.search_path(board, food_pos))
+                self.nodes_expanded = snake.nodes_expanded
+                return path [:1]
+
+        # Distances along the cycle to the tail and to the food, the cells before the tail are free
+        position = order [head]
+        to_tail = (order [self.cell(board, board.body [-1])] - position) % cells
+        to_food = (order [(food_pos [1] // 10) * self.cols + food_pos [0] // 10] - position) % cells
+
+        # Next cell on the cycle, or a shortcut that does not pass the tail nor the food
+        best = self.cycle [(position + 1) % cells]
+        best_distance = 1
+        for cell in self.neighbours(head):
+            distance = (order [cell] - position) % cells
+            if best_distance < distance < to_tail and distance <= to_food:
+                best, best_distance = cell, distance
+
+        self.expected = best
+
+        return [self.move(head, best)]
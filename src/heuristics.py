@@ -0,0 +1,139 @@
+from array import array
+from collections import OrderedDict
+from math import sqrt
+
+import numpy as np
+
+from utils import manhattan_distance, euclidean_distance, chebyshev_distance, octile_distance
+
+# Available heuristics and their distance function on a pair of (X, Y) positions
+HEURISTICS = {
+    'manhattan': manhattan_distance,
+    'euclidean': euclidean_distance,
+    'chebyshev': chebyshev_distance,
+    'octile': octile_distance,
+}
+
+# Same distances on the arrays of |dX| and |dY| of a whole board, they give the exact same values
+FIELDS = {
+    'manhattan': lambda dx, dy: dx + dy,
+    'euclidean': lambda dx, dy: np.sqrt(dx ** 2 + dy ** 2),
+    'chebyshev': lambda dx, dy: np.maximum(dx, dy),
+    'octile': lambda dx, dy: np.maximum(dx, dy) + (sqrt(2) - 1) * np.minimum(dx, dy),
+}
+
+
+# Same distances on one pair of |dX| and |dY| (floats), with the operations of FIELDS in the same order
+POINTS = {
+    'manhattan': lambda dx, dy: dx + dy,
+    'euclidean': lambda dx, dy: sqrt(dx * dx + dy * dy),
+    'chebyshev': max,
+    'octile': lambda dx, dy: max(dx, dy) + (sqrt(2) - 1) * min(dx, dy),
+}
+
+
+class LazyField():
+    """
+    Field of a heuristic whose values are computed when they are read, for the targets seen only once: a
+    search reads h of the nodes it generates, usually a small part of the board.
+    """
+
+    def __init__(self, heuristic: str, target: tuple, cols: int, rows: int, border: int = 0):
+
+        self.point = POINTS [heuristic]
+        self.stride = cols + 2 * border
+
+        # |dX| of every column and |dY| of every row, as floats like the values of a field
+        self.dx = [ float(abs(x - border - target [0])) for x in range(self.stride) ]
+        self.dy = [ float(abs(y - border - target [1])) for y in range(rows + 2 * border) ]
+
+    def __getitem__(self, index: int) -> float:
+
+        y, x = divmod(index, self.stride)
+        return self.point(self.dx [x], self.dy [y])
+
+
+class HeuristicCache():
+    """
+    Heuristic distance fields, the value of the heuristic from every cell of a board to a target.
+
+    A field is computed at once with NumPy and is then read with a single index per node instead of calling
+    the distance function. Fields are stored as array('d') (indexing a NumPy array from Python is slower than
+    a list) and the last used ones are kept in a LRU keyed by (heuristic, target, cols, rows, border), limited
+    by the bytes of the fields.
+
+    On a big board computing a field costs more than a greedy search and the food rarely spawns twice on the
+    same cell, so the first time a target is seen a LazyField is returned and the field is only built when the
+    same target comes again (batches of positions, the Hamiltonian planner). Fields of small boards cost less
+    than reading a LazyField and are built right away.
+    """
+
+    def __init__(self, max_bytes: int = 4 << 20, seen_size: int = 4096, eager_cells: int = 4096):
+        """
+        Args:
+            max_bytes (int): Maximum size of the fields kept, 8 bytes per cell.
+            seen_size (int): Number of targets remembered to know if a target comes again.
+            eager_cells (int): Fields with at most this many cells are built the first time.
+        """
+        self.max_bytes = max_bytes
+        self.eager_cells = eager_cells
+        self.bytes = 0
+        self.fields = OrderedDict()
+
+        # Targets seen once, their field is built the next time
+        self.seen_size = seen_size
+        self.seen = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.lazy = 0
+
+    def field(self, heuristic: str, target: tuple, cols: int, rows: int, border: int = 0):
+        """
+        Returns the field of the heuristic to the target cell on a board of cols x rows cells.
+
+        Args:
+            heuristic (str): Name of the heuristic, one of HEURISTICS.
+            target (tuple): Target cell (X, Y).
+            cols, rows (int): Size of the board in cells.
+            border (int): Cells added around the board, the value of the cell (X, Y) is then at
+                (Y + border) * (cols + 2 * border) + X + border (the layout of the Bitboard).
+
+        return: array('d') with the value of the heuristic for every cell, row by row, or a LazyField with
+            the same values the first time the target is seen.
+        """
+        key = (heuristic, target, cols, rows, border)
+        field = self.fields.get(key)
+
+        if field is not None:
+            self.hits += 1
+            self.fields.move_to_end(key)
+            return field
+
+        if heuristic not in FIELDS:
+            raise ValueError('Unknown heuristic, avaliable values: ' + ', '.join(HEURISTICS))
+
+        cells = (cols + 2 * border) * (rows + 2 * border)
+        size = 8 * cells
+        if size > self.max_bytes or (cells > self.eager_cells and key not in self.seen):
+            self.lazy += 1
+            self.seen [key] = None
+            self.seen.move_to_end(key)
+            if len(self.seen) > self.seen_size:
+                self.seen.popitem(last = False)
+
+            return LazyField(heuristic, target, cols, rows, border)
+
+        self.seen.pop(key, None)
+        self.misses += 1
+        dx = np.abs(np.arange(-border, cols + border) - target [0])
+        dy = np.abs(np.arange(-border, rows + border) - target [1]) [:, None]
+        field = array('d', np.asarray(FIELDS [heuristic](dx, dy), dtype = np.float64).tobytes())
+
+        self.fields [key] = field
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, old = self.fields.popitem(last = False)
+            self.bytes -= 8 * len(old)
+
+        return field
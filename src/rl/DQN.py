@@ -2,14 +2,45 @@ from collections import namedtuple, deque
 import random
 import numpy as np
 
-from .environments import SnakeGame
+from .environments import SnakeGame, FEATURES, as_array
 
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 
 Transition = namedtuple('Transition',('state', 'action', 'next_state', 'reward'))
 
+def input_layers(grid_shape: tuple = None):
+    """
+    First layers of the networks for the observation mode of the environment: none for the 11 features, two
+    convolutions and a flatten for the (C, H, W) grids.
+
+    return: Tuple (layers, number of features they output).
+    """
+    if grid_shape is None:
+        return [], len(FEATURES)
+
+    channels, height, width = grid_shape
+    layers = [nn.Conv2d(channels, 16, kernel_size = 3, padding = 1), nn.ReLU(),
+              nn.Conv2d(16, 32, kernel_size = 3, padding = 1), nn.ReLU(),
+              nn.Flatten()]
+
+    return layers, 32 * height * width
+
+def as_input(state):
+    """
+    Returns a state (features or grid, NumPy or torch) as a float tensor, the grids get a batch dimension.
+    """
+    if not isinstance(state, torch.Tensor):
+        state = torch.from_numpy(as_array(state))
+
+    state = state.float()
+    if state.dim() == 3:
+        state = state.unsqueeze(0)
+
+    return state
+
 # DQN uses a replay memory, defined like this
 class ReplayMemory(object):
     def __init__(self, capacity):
@@ -28,12 +59,11 @@ class ReplayMemory(object):
 
 class DQN(nn.Module):
 
-  def __init__(self, hidden_layers: list = [100,100,100]):
+  def __init__(self, hidden_layers: list = [100,100,100], grid_shape: tuple = None):
         super().__init__()
 
-        # 11 is the input size
-        prev_features = 11
-        layers = []
+        # The 11 features, or the grid (C, H, W) through convolutions
+        layers, prev_features = input_layers(grid_shape)
         for hidden in hidden_layers:
             layers.append(nn.Linear(in_features = prev_features, out_features = hidden))
             layers.append(nn.ReLU())
@@ -50,17 +80,20 @@ class DQN(nn.Module):
   def forward(self, state):
 
         # Initialize gradient on the state
-        state = torch.from_numpy(state).float().requires_grad_(True)
+        state = as_input(state).requires_grad_(True)
 
         return self.layers(state)   
 
 class DQNSolver():
 
     def __init__(self, environment, batch_size: int,  hidden_layers: list = [100,100,100], tau = 0.001):
+
+        # Shape of the grids when the environment observes them
+        grid_shape = environment.grid.shape if environment.observation == 'grid' else None
         
         # Policy and Target networks
-        self.policy_net = DQN(hidden_layers)
-        self.target_net = DQN(hidden_layers)
+        self.policy_net = DQN(hidden_layers, grid_shape)
+        self.target_net = DQN(hidden_layers, grid_shape)
 
         # Copy policy target's weights into target net
         self.target_net.load_state_dict(self.policy_net.state_dict())
@@ -88,15 +121,15 @@ class DQNSolver():
         # to Transition of batch-arrays.
         batch = Transition(*zip(*transitions))
 
-        # Compute a mask of non-final states and concatenate the batch elements
+        # Compute a mask of non-final states and stack the batch elements, the states are NumPy arrays
+        # (features or grids) and the actions and rewards numbers
         # (a final state would've been the one after which simulation ended)
         non_final_mask = torch.tensor(tuple(map(lambda s: s is not None,
                                                 batch.next_state)), dtype=torch.bool)
-        non_final_next_states = torch.cat([s for s in batch.next_state
-                                                    if s is not None])
-        state_batch = torch.cat(batch.state)
-        action_batch = torch.cat(batch.action)
-        reward_batch = torch.cat(batch.reward)
+        non_final_next_states = [s for s in batch.next_state if s is not None]
+        state_batch = torch.from_numpy(np.stack(batch.state))
+        action_batch = torch.tensor(batch.action, dtype=torch.int64).unsqueeze(1)
+        reward_batch = torch.tensor(batch.reward, dtype=torch.float32)
 
         # Compute Q(s_t, a) - the model computes Q(s_t), then we select the
         # columns of actions taken.
@@ -108,8 +141,9 @@ class DQNSolver():
         # This is merged based on the mask, such that we'll have either the expected
         # state value or 0 in case the state was final.
         next_state_values = torch.zeros(self.batch_size)
-        with torch.no_grad():
-            next_state_values[non_final_mask] = self.tautarget_net(non_final_next_states).max(1).values
+        if non_final_next_states:
+            with torch.no_grad():
+                next_state_values[non_final_mask] = self.target_net(torch.from_numpy(np.stack(non_final_next_states))).max(1).values
 
         # Compute the expected Q values (no gamma)
         expected_state_action_values = next_state_values+ reward_batch
@@ -137,8 +171,12 @@ class DQNSolver():
 
         while not terminal:
 
-            # Get action
-            action = self.policy_net(np.array(list(self.environment.state.values())))
+            # The grid is updated in place by the step, keep a copy of the current one
+            state = as_array(self.environment.state).copy()
+
+            # Get action, the one with the highest Q
+            with torch.no_grad():
+                action = int(self.policy_net(state).argmax())
 
             # Get reward and next state
             terminal, reward, next_state = self.environment.step(action)
@@ -146,10 +184,10 @@ class DQNSolver():
 
             if terminal:
                 # Save into replay memory (but next state is none)
-                self.replay_memory.push((self.environment.state.values(), action, reward, None))
+                self.replay_memory.push(state, action, None, reward)
             else:
                 # Save into replay memory
-                self.replay_memory.push((self.environment.state.values(), action, reward, next_state.values()))
+                self.replay_memory.push(state, action, as_array(next_state).copy(), reward)
             
             self.environment.state = next_state
             
@@ -157,9 +195,52 @@ class DQNSolver():
             self.optimize_model()
 
             # Update target net
-            target_net_state_dict = self.target_net.state_dict()
-            policy_net_state_dict = self.policy_net.state_dict()
-            for key in policy_net_state_dict:
-                target_net_state_dict[key] = policy_net_state_dict[key] * self.tau + target_net_state_dict[key] * (1 - self.tau)
-            self.target_net.load_state_dict(target_net_state_dict)
+            self.update_target()
+        return
+
+    def update_target(self):
+        """
+        Soft update of the target net, a tau fraction of the way to the policy net.
+        """
+        target_net_state_dict = self.target_net.state_dict()
+        policy_net_state_dict = self.policy_net.state_dict()
+        for key in policy_net_state_dict:
+            target_net_state_dict[key] = policy_net_state_dict[key] * self.tau + target_net_state_dict[key] * (1 - self.tau)
+        self.target_net.load_state_dict(target_net_state_dict)
+
+    def run_vectorized(self, environment, steps: int):
+        """
+        Trains on the boards of a vector environment (VecSnakeGame or SubprocVecSnakeGame with features or
+        grids) for the given number of steps of every board. The policy net is optimized while the boards play
+        the next step.
+        """
+        if environment.observation == 'int':
+            raise ValueError('Unknown observation mode for DQN, avaliable values: dict, grid')
+
+        states = environment.states
+        with torch.no_grad():
+            actions = self.policy_net(states).argmax(1).numpy()
+        environment.step_async(actions)
+        self.reward_sum = 0
+
+        for step in range(steps):
+
+            # Observe R and S' and choose the next actions (S' after the resets)
+            terminal, reward, next_state = environment.step_wait()
+            next_states = environment.states
+            with torch.no_grad():
+                next_actions = self.policy_net(next_states).argmax(1).numpy()
+            if step + 1 < steps:
+                environment.step_async(next_actions)
+
+            # Save into replay memory (the next state of the terminal ones is none) and optimize while the boards move
+            self.reward_sum += int(reward.sum())
+            for board in range(len(states)):
+                self.replay_memory.push(states [board], int(actions [board]), None if terminal [board] else next_state [board], int(reward [board]))
+
+            self.optimize_model()
+            self.update_target()
+
+            states, actions = next_states, next_actions
+
         return
\ No newline at end of file
@@ -13,6 +13,7 @@ class EpsilonGreedy():
         self.epsilon_start = epsilon_start
         self.epsilon_end = epsilon_end
         self.epsilon_decay = epsilon_decay
+        self.epsilon = epsilon_start
 
         self.steps = 0
         self.reduce_on_steps = reduce_on_steps
@@ -1,19 +1,19 @@
 import numpy as np  
 
-from .environments import SnakeGame
+from .environments import SnakeGame, as_array
+from .DQN import input_layers, as_input
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
 
-class ActorCriticNN():
-    def __init__(self, actor_hidden_layers: list, critic_hidden_layers: list) -> None:
+class ActorCriticNN(nn.Module):
+    def __init__(self, actor_hidden_layers: list, critic_hidden_layers: list, grid_shape: tuple = None) -> None:
         super().__init__()
 
-        # 11 is the input size
-        prev_features = 11
-        actor_layers = []
+        # The 11 features, or the grid (C, H, W) through convolutions
+        actor_layers, prev_features = input_layers(grid_shape)
         for hidden in actor_hidden_layers:
             actor_layers.append(nn.Linear(in_features = prev_features, out_features = hidden))
             actor_layers.append(nn.ReLU())
@@ -21,13 +21,12 @@ class ActorCriticNN():
 
         # Hard coded 3 because we only have 3 actions, no need to parametrize
         actor_layers.append(nn.Linear(in_features = prev_features, out_features = 3))
-        actor_layers.append(nn.Softmax())
+        actor_layers.append(nn.Softmax(dim = -1))
 
         # Actor NN
         self.actor = nn.Sequential(*actor_layers)
 
-        prev_features = 11
-        critic_layers = []
+        critic_layers, prev_features = input_layers(grid_shape)
         for hidden in critic_hidden_layers:
             critic_layers.append(nn.Linear(in_features = prev_features, out_features = hidden))
             critic_layers.append(nn.ReLU())
@@ -43,7 +42,7 @@ class ActorCriticNN():
     def forward(self, state):
 
         # Initialize gradient on the state
-        state = torch.from_numpy(state).float().requires_grad_(True)
+        state = as_input(state).requires_grad_(True)
 
         # Value function
         value = self.critic(state)
@@ -58,8 +57,11 @@ class ActorCritic():
 
         self.environment = environment
 
+        # Shape of the grids when the environment observes them
+        grid_shape = environment.grid.shape if environment.observation == 'grid' else None
+
         # Neural Network and optimizer
-        self.actor_critic = ActorCriticNN(actor_hidden_layers = actor_hidden_layers, critic_hidden_layers = critic_hidden_layers)
+        self.actor_critic = ActorCriticNN(actor_hidden_layers = actor_hidden_layers, critic_hidden_layers = critic_hidden_layers, grid_shape = grid_shape)
         self.ac_optimizer = optim.AdamW(self.actor_critic.parameters(), lr=1e-3)
 
         # Reward sum for plotting
@@ -71,6 +73,7 @@ class ActorCritic():
         values = []
         rewards = []
         
+        entropy_term = 0
         terminal = False
 
         self.environment.reset()
@@ -79,8 +82,8 @@ class ActorCritic():
         while not terminal:
 
             # Get value function and action probs
-            value, action_probs = self.actor_critic.forward(np.array(list(self.environment.state.values())))
-            value = value.detach().numpy()[0]
+            value, action_probs = self.actor_critic.forward(as_array(self.environment.state))
+            value = value.detach().numpy().item()
             probs = action_probs.detach().numpy() 
 
             # Select action (not greedy to maintain exploration)
@@ -104,8 +107,8 @@ class ActorCritic():
             self.environment.state = next_state
 
             if terminal:
-                Qval, _ = self.actor_critic.forward(np.array(list(next_state.values())))
-                Qval = Qval.detach().numpy()[0]
+                Qval, _ = self.actor_critic.forward(as_array(next_state))
+                Qval = Qval.detach().numpy().item()
 
         # compute Q values
         Qvals = np.zeros_like(values)
@@ -1,19 +1,128 @@
 import numpy as np
 
 from .action_selection import EpsilonGreedy
+from .environments import FEATURES, N_STATES, encode_state
+
+# Left/right mirror of the states: the board seen in a mirror swaps the dangers on the left and on the right,
+# west and east and turning left and right (actions 1 and 2), the rest stays. MIRROR_STATES [S] is the mirror
+# of the integer state S and MIRROR_ENTRIES the mirror of every entry S * 3 + A of the flat Q
+MIRROR_FEATURES = (('DangerLeft', 'DangerRight'), ('GoingWest', 'GoingEast'), ('FoodWest', 'FoodEast'))
+MIRROR_ACTIONS = np.array([0, 2, 1])
+
+def mirror_state(code: int) -> int:
+    """
+    Returns the integer state seen in a mirror, see MIRROR_FEATURES.
+    """
+    for a, b in MIRROR_FEATURES:
+        bit_a, bit_b = len(FEATURES) - 1 - FEATURES.index(a), len(FEATURES) - 1 - FEATURES.index(b)
+        if (code >> bit_a & 1) != (code >> bit_b & 1):
+            code ^= 1 << bit_a | 1 << bit_b
+
+    return code
+
+MIRROR_STATES = np.array([ mirror_state(code) for code in range(N_STATES) ], dtype = np.intp)
+MIRROR_ENTRIES = (MIRROR_STATES [:, None] * 3 + MIRROR_ACTIONS).ravel()
+
+# Ways a visit changes the trace of an entry: set to 1 or add 1
+TRACE_MODES = ('replacing', 'accumulating')
+
+class EligibilityTraces():
+    """
+    Eligibility traces of the entries S * 3 + A of the flat Q, only the ones above a threshold.
+
+    The active entries and their traces are the first count items of two arrays, and position maps every
+    entry of Q to its item (-1 when it has no trace). A visit is O(1), and updating Q, decaying the traces and
+    dropping the ones under the threshold cost O(active traces): with gamma * lambda = 0.9 and the default
+    threshold a trace lives for about 65 steps, whatever the size of Q. The arrays double when they are full.
+    """
+
+    def __init__(self, entries: int, gamma: float = 1.0, lam: float = 0.9, mode: str = 'replacing', threshold: float = 1e-3, capacity: int = 64):
+        """
+        Args:
+            entries (int): Entries of Q (states * actions).
+            gamma (float): Discount, the traces decay by gamma * lam every step.
+            lam (float): Lambda of the lambda-returns.
+            mode (str): 'replacing' or 'accumulating', see TRACE_MODES.
+            threshold (float): Traces under it are dropped.
+            capacity (int): Initial size of the arrays.
+        """
+        if mode not in TRACE_MODES:
+            raise ValueError('Unknown trace mode, avaliable values: ' + ', '.join(TRACE_MODES))
+
+        self.decay_rate = gamma * lam
+        self.accumulating = mode == 'accumulating'
+        self.threshold = threshold
+
+        self.entries = np.zeros(capacity, dtype = np.intp)
+        self.traces = np.zeros(capacity)
+        self.position = np.full(entries, -1, dtype = np.intp)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def active(self):
+        """
+        Returns the entries with a trace and their traces (views, valid until the next call).
+        """
+        return self.entries [:self.count], self.traces [:self.count]
+
+    def visit(self, entry: int):
+        """
+        Sets the trace of the entry to 1 (replacing) or adds 1 to it (accumulating).
+        """
+        item = self.position [entry]
+        if item >= 0:
+            self.traces [item] = self.traces [item] + 1 if self.accumulating else 1.0
+            return
+
+        if self.count == len(self.entries):
+            self.entries = np.concatenate((self.entries, np.zeros_like(self.entries)))
+            self.traces = np.concatenate((self.traces, np.zeros_like(self.traces)))
+
+        self.entries [self.count] = entry
+        self.traces [self.count] = 1.0
+        self.position [entry] = self.count
+        self.count += 1
+
+    def decay(self):
+        """
+        Multiplies the traces by gamma * lambda and drops the ones under the threshold.
+        """
+        entries, traces = self.active()
+        traces *= self.decay_rate
+
+        alive = traces >= self.threshold
+        if alive.all():
+            return
+
+        self.position [entries [~alive]] = -1
+        count = int(np.count_nonzero(alive))
+        entries [:count], traces [:count] = entries [alive], traces [alive]
+        self.position [entries [:count]] = np.arange(count)
+        self.count = count
+
+    def clear(self):
+        """
+        Drops every trace (end of the episode, Watkins cut-off).
+        """
+        self.position [self.entries [:self.count]] = -1
+        self.count = 0
 
 class Jormungandr():
     """
     Implements the agent of our game, the snake Jormungandr.
     """
 
-    def __init__(self, alpha, action_selector: EpsilonGreedy, environment, checkpoint: str):
+    def __init__(self, alpha, action_selector: EpsilonGreedy, environment, checkpoint: str, mmap: bool = False, symmetric: bool = False):
 
-        # Q function
+        # Q function, one row per state indexed by the integer states (checkpoints of shape (2, ..., 2, 3) are
+        # flattened in the same order). A memory mapped checkpoint is copy on write: the pages are read from the
+        # file when they are used and the updates stay in memory
         if checkpoint is not None:
-            self.Q = np.load(checkpoint)
+            self.Q = np.load(checkpoint, mmap_mode = 'c' if mmap else None).reshape(N_STATES, 3)
         else:
-            self.Q = np.zeros((2,2,2,2,2,2,2,2,2,2,2,3))
+            self.Q = np.zeros((N_STATES, 3))
 
         # Action selector
         self.action_selector = action_selector
@@ -24,15 +133,42 @@ class Jormungandr():
         # Environment the agent interacts with
         self.environment = environment
 
-    def get_Q(self, state):
+        # Mirror symmetry: Q(S,A) and Q of their mirrors (MIRROR_STATES, MIRROR_ACTIONS) are kept equal, every
+        # update trains both, so the agent learns half as many values. A loaded Q starts as the mean of both
+        self.symmetric = symmetric
+        if symmetric:
+            flat = self.Q.reshape(-1)
+            self.Q = ((flat + flat [MIRROR_ENTRIES]) / 2).reshape(N_STATES, 3)
+
+    def state_index(self, state) -> int:
         """
-        Returns Q(S)
+        Returns the row of Q of a state, an integer state already is its row.
+        """
+        if isinstance(state, dict):
+            return encode_state(state)
+
+        return state
+
+    def state_indices(self, states) -> np.ndarray:
+        """
+        Returns the rows of Q of many states (integers, or dictionaries) as an array.
         """
+        if isinstance(states, np.ndarray) and states.dtype != object:
+            return states.astype(np.intp, copy = False)
+
+        return np.fromiter(map(self.state_index, states), dtype = np.intp, count = len(states))
 
-        # Get the state
-        state = list(state.values())
+    def tie(self, index: int, action: int):
+        """
+        Copies Q(S,A) to the mirror of S and A (symmetric agents).
+        """
+        self.Q [MIRROR_STATES [index], MIRROR_ACTIONS [action]] = self.Q [index, action]
 
-        return self.Q[*state]
+    def get_Q(self, state):
+        """
+        Returns Q(S)
+        """
+        return self.Q[self.state_index(state)]
     
     def get_V(self, state):
         """
@@ -54,12 +190,17 @@ class Jormungandr():
         Q(S,A) = Q(S,A) + alpha * [R + Q(S',A') - Q(S,A)]
         """
         
+        Q, index = self.Q, self.state_index(state)
+
         # If we are on a terminal state, we don't have S' and A', therefore we update only with the current state
         if terminal:
-            self.Q[*state.values()][action] = self.Q[*state.values()][action] + self.alpha * (reward - self.Q[*state.values()][action])
+            Q[index, action] = Q[index, action] + self.alpha * (reward - Q[index, action])
         
         else:
-            self.Q[*state.values()][action] = self.Q[*state.values()][action] + self.alpha * (reward + self.Q[*next_state.values()][next_action] - self.Q[*state.values()][action])
+            Q[index, action] = Q[index, action] + self.alpha * (reward + Q[self.state_index(next_state), next_action] - Q[index, action])
+
+        if self.symmetric:
+            self.tie(index, action)
 
         return 
 
@@ -69,11 +210,18 @@ class Jormungandr():
         Q(S,A) = Q(S,A) + alpha * [R + max_a Q(S',a) - Q(S,A)]
         """
 
+        Q, index = self.Q, self.state_index(state)
+
         if terminal:
-            self.Q[*state.values()][action] = self.Q[*state.values()][action] + self.alpha * (reward - self.Q[*state.values()][action])
+            Q[index, action] = Q[index, action] + self.alpha * (reward - Q[index, action])
 
         else:
-            self.Q[*state.values()][action] = self.Q[*state.values()][action] + self.alpha * (reward + self.Q[*next_state.values()][self.action_selector.get_greedy_action(self.get_Q(next_state))] - self.Q[*state.values()][action])
+            next_Q = Q[self.state_index(next_state)]
+            Q[index, action] = Q[index, action] + self.alpha * (reward + next_Q[self.action_selector.get_greedy_action(next_Q)] - Q[index, action])
+
+        if self.symmetric:
+            self.tie(index, action)
+
         return 
     
     def update_n_step_sarsa(self, state, action, gain):
@@ -81,7 +229,11 @@ class Jormungandr():
         Updates Q according to n_step_sarsa update rule
         Q(S,A) = Q(S,A) + alpha * [G - Q(S,A)]
         """
-        self.Q[*state.values()][action] = self.Q[*state.values()][action] + self.alpha * (gain - self.Q[*state.values()][action])
+        Q, index = self.Q, self.state_index(state)
+        Q[index, action] = Q[index, action] + self.alpha * (gain - Q[index, action])
+
+        if self.symmetric:
+            self.tie(index, action)
 
         return 
     
@@ -90,6 +242,122 @@ class Jormungandr():
         Updates Q according to n_step_offpolicy update rule
         Q(S,A) = Q(S,A) + alpha * sampling_ratio * [G - Q(S,A)]
         """
-        self.Q[*state.values()][action] = self.Q[*state.values()][action] + self.alpha * sampling_ratio * (gain - self.Q[*state.values()][action])
+        Q, index = self.Q, self.state_index(state)
+        Q[index, action] = Q[index, action] + self.alpha * sampling_ratio * (gain - Q[index, action])
+
+        if self.symmetric:
+            self.tie(index, action)
+
+        return
+
+    def update_batch(self, states, actions, targets, weights = None):
+        """
+        Applies a batch of updates Q(S,A) = Q(S,A) + alpha * weight * [target - Q(S,A)] with a few NumPy calls.
+
+        The updates of the same (S,A) are applied in the order of the batch, the result is the same as calling
+        update_n_step_offpolicy (or update_n_step_sarsa without weights) once per update. The batch is sorted
+        by entry (stable), so the updates of every entry are a segment: after them
+        Q(S,A) = Q(S,A) * prod(1 - rate) + sum(rate_i * target_i * prod(1 - rate_j) for the j after i),
+        the products are built with log2(updates per entry) passes of doubling and the sums with one reduceat.
+
+        Args:
+            states (np.ndarray or list): States of the updates (rows of Q, or dictionaries).
+            actions (np.ndarray or list): Actions of the updates.
+            targets (np.ndarray or list): Value every Q(S,A) moves towards.
+            weights (np.ndarray or float): Multiplies alpha, the sampling ratios of n_step_OffPolicy.
+        """
+        entries = self.state_indices(states) * self.Q.shape [1] + np.asarray(actions, dtype = np.intp)
+        if not len(entries):
+            return
+
+        # An entry and its mirror are the same value, they update the first of both
+        if self.symmetric:
+            entries = np.minimum(entries, MIRROR_ENTRIES [entries])
+
+        rate = np.broadcast_to(self.alpha if weights is None else self.alpha * np.asarray(weights, dtype = float), entries.shape)
+        order = np.argsort(entries, kind = 'stable')
+        entries, rate, targets = entries [order], rate [order], np.asarray(targets, dtype = float) [order]
+
+        # Segments of the same entry: starts and (exclusive) ends
+        Q = self.Q.reshape(-1)
+        starts = np.flatnonzero(np.concatenate(([True], entries [1:] != entries [:-1])))
+        if len(starts) == len(entries):
+            Q [entries] += rate * (targets - Q [entries])
+            if self.symmetric:
+                Q [MIRROR_ENTRIES [entries]] = Q [entries]
+            return
+
+        ends = np.append(starts [1:], len(entries))
+        end = np.repeat(ends, ends - starts)
+
+        # keep [i] becomes the product of (1 - rate) from i to the end of its segment
+        keep = 1 - rate
+        position = np.arange(len(entries))
+        step = 1
+        while step < (ends - starts).max():
+            inside = position + step < end
+            keep = keep.copy()
+            keep [inside] *= keep [position [inside] + step]
+            step *= 2
+
+        # Product of (1 - rate) after every update, 1 for the last one of its segment
+        after = np.ones(len(entries))
+        inside = position + 1 < end
+        after [inside] = keep [position [inside] + 1]
+
+        first = entries [starts]
+        Q [first] = Q [first] * keep [starts] + np.add.reduceat(rate * targets * after, starts)
+        if self.symmetric:
+            Q [MIRROR_ENTRIES [first]] = Q [first]
+
+        return
+
+    def update_Sarsa_batch(self, states, actions, rewards, next_states, next_actions, terminal):
+        """
+        update_Sarsa for a batch of steps, see update_batch. All the targets R + Q(S',A') are computed
+        with Q before the batch.
+        """
+        Q = self.Q
+        rewards = np.asarray(rewards, dtype = float)
+        terminal = np.asarray(terminal, dtype = bool)
+
+        targets = rewards + np.where(terminal, 0, Q [self.state_indices(next_states), np.asarray(next_actions, dtype = np.intp)])
+        self.update_batch(states, actions, targets)
+
+        return
+
+    def update_QLearning_batch(self, states, actions, rewards, next_states, terminal):
+        """
+        update_QLearning for a batch of steps, see update_batch. All the targets R + max_a Q(S',a) are
+        computed with Q before the batch.
+        """
+        Q = self.Q
+        rewards = np.asarray(rewards, dtype = float)
+        terminal = np.asarray(terminal, dtype = bool)
+
+        targets = rewards + np.where(terminal, 0, Q [self.state_indices(next_states)].max(axis = 1))
+        self.update_batch(states, actions, targets)
+
+        return
+
+    def entry(self, state, action) -> int:
+        """
+        Returns the entry of Q(S,A) in the flat Q, the first of it and its mirror for symmetric agents.
+        """
+        entry = self.state_index(state) * self.Q.shape [1] + action
+        if self.symmetric:
+            entry = min(entry, MIRROR_ENTRIES [entry])
+
+        return entry
+
+    def update_traces(self, traces: EligibilityTraces, delta: float):
+        """
+        Updates Q for every entry with a trace, Q(S,A) = Q(S,A) + alpha * delta * e(S,A).
+        """
+        entries, values = traces.active()
+        Q = self.Q.reshape(-1)
+        Q [entries] += self.alpha * delta * values
+        if self.symmetric:
+            Q [MIRROR_ENTRIES [entries]] = Q [entries]
 
-        return 
\ No newline at end of file
+        return
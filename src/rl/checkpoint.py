@@ -0,0 +1,200 @@
+import atexit, glob, os, shutil, threading, time
+
+import numpy as np
+
+
+def solver_checkpoints(checkpoints, save_path: str, test: bool):
+    """
+    Returns the checkpoint manager of a solver: the one it was given, otherwise a new one saving to save_path,
+    or None when testing or without a save path (nothing is saved then).
+    """
+    if checkpoints is not None or test or save_path is None:
+        return checkpoints
+
+    return CheckpointManager(save_path)
+
+
+class CheckpointManager():
+    """
+    Saves the Q table in the background every few episodes or seconds.
+
+    The training thread only copies Q when a checkpoint is due (the (2048, 3) table takes microseconds to copy,
+    and the copy is what gets written, whatever the training does to Q in the meantime). A writer thread saves
+    the copies: first to a temporary file, which is then renamed over the checkpoint, so a crash in the middle
+    of a write never leaves a broken or missing checkpoint. The previous K - 1 checkpoints are kept as path.1.npy
+    (the newest) to path.(K-1).npy. If the writer is still busy when a new copy arrives, only the newest copy is
+    written. The last Q is saved when the manager is closed, which happens at exit at the latest.
+    """
+
+    def __init__(self, path: str, episodes: int = 100, seconds: float = 60.0, keep: int = 1):
+        """
+        Args:
+            path (str): File of the checkpoint, like np.save '.npy' is added when it is missing.
+            episodes (int): Save after this many episodes, None for no limit.
+            seconds (float): Save when this many seconds went by since the last checkpoint, None for no limit.
+            keep (int): Number of checkpoints kept, the current one and the K - 1 before it.
+        """
+        if keep < 1:
+            raise ValueError('At least one checkpoint must be kept, keep = ' + str(keep))
+
+        self.path = path if path.endswith('.npy') else path + '.npy'
+        self.episodes = episodes
+        self.seconds = seconds
+        self.keep = keep
+
+        # Episodes and time since the last checkpoint, and the table of the last episode (saved when closing)
+        self.episodes_since = 0
+        self.last = time.monotonic()
+        self.Q = None
+
+        # Copy waiting for the writer, None when there is nothing to write
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closing = False
+        self.error = None
+        self.writes = 0
+
+        self.remove_stale()
+
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def episode(self, Q: np.ndarray):
+        """
+        Counts an episode, Q is saved if a checkpoint is due.
+        """
+        self.Q = Q
+        self.episodes_since += 1
+
+        if (self.episodes is not None and self.episodes_since >= self.episodes) or \
+           (self.seconds is not None and time.monotonic() - self.last >= self.seconds):
+            self.save(Q)
+
+    def save(self, Q: np.ndarray):
+        """
+        Copies Q and gives the copy to the writer, it returns without waiting for the write.
+        """
+        if self.error is not None:
+            raise self.error
+
+        snapshot = np.array(Q)
+        with self.condition:
+            self.pending = snapshot
+            self.condition.notify()
+
+        self.episodes_since = 0
+        self.last = time.monotonic()
+
+    def run(self):
+        """
+        Loop of the writer thread.
+        """
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closing:
+                    self.condition.wait()
+
+                snapshot, self.pending = self.pending, None
+                if snapshot is None:
+                    return
+
+            try:
+                self.write(snapshot)
+            except Exception as error:
+                self.error = error
+
+    def version(self, number: int) -> str:
+        """
+        Returns the file of a checkpoint, 0 is the current one and K - 1 the oldest kept.
+        """
+        return self.path if number == 0 else self.path [:-len('.npy')] + '.' + str(number) + '.npy'
+
+    def temporary(self, number: int, pid: int = None) -> str:
+        """
+        Returns the temporary file of a version written by the process pid (this one by default).
+        """
+        return self.version(number) + '.' + str(os.getpid() if pid is None else pid) + '.tmp'
+
+    def remove_stale(self):
+        """
+        Removes the temporary files left by the processes that were killed in the middle of a write, the ones
+        of running processes are still being written.
+        """
+        for number in (0, 1):
+            for file in glob.glob(glob.escape(self.version(number)) + '.*.tmp'):
+                pid = file [len(self.version(number)) + 1:-len('.tmp')]
+                if not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    os.remove(file)
+                except OSError:
+                    pass
+
+    def write(self, Q: np.ndarray):
+        """
+        Writes Q to a temporary file and renames it over the checkpoint, the older ones are kept one version back.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        partial, previous = self.temporary(0), self.temporary(1)
+        try:
+            with open(partial, 'wb') as file:
+                np.save(file, Q)
+                file.flush()
+                os.fsync(file.fileno())
+
+            # The older versions move one back and the current checkpoint is linked (or copied) as version 1
+            # before the new one replaces it, so there is a current checkpoint at any time
+            for number in range(self.keep - 1, 1, -1):
+                if os.path.exists(self.version(number - 1)):
+                    os.replace(self.version(number - 1), self.version(number))
+
+            if self.keep > 1 and os.path.exists(self.path):
+                if os.path.exists(previous):
+                    os.remove(previous)
+                try:
+                    os.link(self.path, previous)
+                except OSError:
+                    shutil.copyfile(self.path, previous)
+                os.replace(previous, self.version(1))
+
+            os.replace(partial, self.path)
+            self.writes += 1
+
+        # A failed or interrupted write leaves no temporary file behind
+        finally:
+            for file in (partial, previous):
+                if os.path.exists(file):
+                    os.remove(file)
+
+    def close(self):
+        """
+        Saves the last Q if it changed since the last checkpoint and waits for the writer to finish.
+        """
+        if self.closing:
+            return
+
+        if self.Q is not None and self.episodes_since:
+            self.save(self.Q)
+
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+
+        self.thread.join()
+        atexit.unregister(self.close)
+
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
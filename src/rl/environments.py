@@ -1,8 +1,11 @@
 import random
-from collections import defaultdict
+from collections import deque
 
+import numpy as np
 import pygame
 
+from board import FreeCellBoard, NORTH, SOUTH, WEST, EAST, BORDER
+
 BLACK = pygame.Color(0, 0, 0)
 WHITE = pygame.Color(255, 255, 255)
 RED = pygame.Color(255, 0, 0)
@@ -66,12 +69,86 @@ DIRECTION_DICT = {
     },
 }
 
+# Neighbour mask bits of the front, left and right of the snake for every direction
+DANGER_MASKS = {
+    'N': (NORTH, WEST, EAST),
+    'S': (SOUTH, EAST, WEST),
+    'W': (WEST, SOUTH, NORTH),
+    'E': (EAST, NORTH, SOUTH),
+}
+
+# Features of the states, in the order of the state dictionaries (and of the axes of the Q tables)
+FEATURES = ('DangerFront', 'DangerLeft', 'DangerRight', 'GoingNorth', 'GoingSouth', 'GoingWest', 'GoingEast',
+            'FoodNorth', 'FoodSouth', 'FoodWest', 'FoodEast')
+
+# Number of different states
+N_STATES = 1 << len(FEATURES)
+
+# Observation modes: the state dictionary, or the features packed in an integer, bit 10 is DangerFront and
+# bit 0 is FoodEast. The integer is the index of the state in a Q table of shape (N_STATES, 3), the same
+# order as flattening a (2, 2, ..., 2, 3) table indexed by the values of the dictionary. 'grid' is the
+# whole board as planes of cells, see GRID_PLANES.
+OBSERVATIONS = ('dict', 'int', 'grid')
+
+# Planes of the grid observation, (C, H, W) with a 1 on the cells of the body, of the head, of the food and
+# of the walls, and on the head in the plane of the direction the snake is going
+GRID_PLANES = ('Body', 'Head', 'Food', 'Walls', 'GoingNorth', 'GoingSouth', 'GoingWest', 'GoingEast')
+DIRECTION_PLANES = { 'N': 4, 'S': 5, 'W': 6, 'E': 7 }
+
+def encode_state(state: dict) -> int:
+    """
+    Packs a state dictionary in an integer.
+    """
+    code = 0
+    for feature in FEATURES:
+        code = code << 1 | state [feature]
+
+    return code
+
+def decode_state(code: int) -> dict:
+    """
+    Unpacks an integer state in a state dictionary.
+    """
+    return { feature: int(code) >> (len(FEATURES) - 1 - i) & 1 for i, feature in enumerate(FEATURES) }
+
+def as_array(state) -> np.ndarray:
+    """
+    Returns a state of any observation mode as the input of the networks: the 11 features of a dictionary
+    or an integer, a grid as it is (no copy).
+    """
+    if isinstance(state, np.ndarray):
+        return state
+
+    if isinstance(state, dict):
+        return np.array(list(state.values()))
+
+    return VEC_STATES [state]
+
 class SnakeGame():
 
-    def __init__(self, game_window, width = 5, height = 5, display: bool = False):
+    def __init__(self, game_window, width = 5, height = 5, display: bool = False, wall_map = None, observation: str = 'dict', seed: int = None):
+
+        # A map (walls.WallMap) sets the size of the board, cells from 0 to width and from 0 to height
+        if wall_map is not None:
+            width, height = wall_map.cols - 1, wall_map.rows - 1
 
         if width < 5 or height < 5:
             raise ValueError("Both height and width must be higher than 5")
+
+        if observation not in OBSERVATIONS:
+            raise ValueError('Unknown observation mode, avaliable values: ' + ', '.join(OBSERVATIONS))
+
+        # States as dictionaries, integers or grids (see OBSERVATIONS)
+        self.observation = observation
+
+        # Grid observation, built once the body and the food are placed
+        self.grid = None
+
+        # Random generator of the food positions, its state is saved with the snapshots. It only moves when the
+        # food spawns, which replaces rng_version with a new object, so the snapshots copy the state (the
+        # slowest part of them) only when it changed
+        self.rng = random.Random(seed)
+        self.rng_version = object()
         
         # Game window for visualization
         self.game_window = game_window
@@ -85,16 +162,28 @@ class SnakeGame():
         # Whether to display the game in PyGame
         self.display = display
 
-        # Snake starts at the middle of the board
-        self.x = width // 2
-        self.y = height // 2
+        # Fixed walls of the map, cells (X, Y)
+        self.wall_map = wall_map
+        self.walls = set(wall_map.walls) if wall_map is not None else set()
+
+        # Snake starts at the middle of the board (the middle of the free cells on a map)
+        self.start_x, self.start_y = wall_map.start() [0] if wall_map is not None else (width // 2, height // 2)
+        self.x = self.start_x
+        self.y = self.start_y
 
         # Variable to control the resets
         self.food_before = False
 
         # Create the snake body, first the head, and the tail, by the default, the snake
-        # starts with a body of length 3 growing towards south.
-        self.snake_body = [(self.x, self.y), (self.x, self.y + 1), (self.x, self.y + 2)]
+        # starts with a body of length 3 growing towards south. A deque, the head is pushed
+        # and the tail popped in constant time.
+        self.snake_body = deque([(self.x, self.y), (self.x, self.y + 1), (self.x, self.y + 2)])
+
+        # Occupancy and free cells of the board (cells from 0 to width and from 0 to height), updated with the
+        # head pushes and the tail pops so the danger, death and food checks and the food spawns cost the same
+        # whatever the length of the snake
+        self.board = FreeCellBoard.from_body(width + 1, height + 1, self.snake_body, self.walls)
+        self.collision = False
 
         # Spawn food and get the direction to it
         self.spawn_food()
@@ -119,20 +208,69 @@ class SnakeGame():
             'FoodEast': food_east,
         }
 
+        if observation == 'int':
+            self.state = encode_state(self.state)
+
         # Internal variable to help V function computing
         self.current_direction = 'N'
+
+        # The grid is kept from step to step and only the cells that change are written. The state is a
+        # read only view of it, the same array after every step: copy it to keep it.
+        if observation == 'grid':
+            self.grid = np.zeros((len(GRID_PLANES), height + 1, width + 1), dtype = np.uint8)
+            for x, y in self.walls:
+                self.grid [3, y, x] = 1
+            self.grid [2, self.food_y, self.food_x] = 1
+            self.draw_grid_body(1)
+
+            self.view = self.grid.view()
+            self.view.flags.writeable = False
+            self.state = self.view
         
         return
 
+    def on_board(self, x: int, y: int) -> bool:
+        """
+        Checks if the cell (X, Y) is on the board.
+        """
+        return 0 <= x <= self.width and 0 <= y <= self.height
+
+    def draw_grid_body(self, value: int):
+        """
+        Writes (1) or erases (0) the body, the head and its direction on the grid, O(length of the snake).
+        """
+        grid = self.grid
+        for x, y in self.snake_body:
+            if self.on_board(x, y):
+                grid [0, y, x] = value
+
+        x, y = self.grid_head = self.snake_body [0]
+        if self.on_board(x, y):
+            grid [1, y, x] = value
+            grid [DIRECTION_PLANES [self.current_direction], y, x] = value
+
+    def grid_tensor(self):
+        """
+        Returns the grid as a torch tensor sharing its memory, it follows the steps without copies.
+        """
+        import torch
+
+        return torch.from_numpy(self.grid)
+
     
     def spawn_food(self):
         """
         Spawns food on the board.
         """
-        self.food_x, self.food_y = random.randint(0, self.width), random.randint(0, self.height)
+        # One draw from the free cells of the board, however full it is
+        if self.grid is not None:
+            self.grid [2, self.food_y, self.food_x] = 0
 
-        while (self.food_x, self.food_y) in self.snake_body:
-            self.food_x, self.food_y = random.randint(0, self.width), random.randint(0, self.height)
+        self.food_x, self.food_y = self.board.random_free(self.rng)
+        self.rng_version = object()
+
+        if self.grid is not None:
+            self.grid [2, self.food_y, self.food_x] = 1
 
         return
     
@@ -142,32 +280,33 @@ class SnakeGame():
         into itself
         """
 
-        # To avoid KeyError exceptions, we use a defaultdict with default value bool (False)
-        # this is a little programming trick to optimize the if selection flow.
-        snake_body =  defaultdict(bool,{tuple(key):True for key in self.snake_body})
-
         if going_north:
-            danger_front = 1 if self.y - 1 < 0 or snake_body[(self.x, self.y - 1)] else 0
-            danger_left = 1 if self.x - 1 < 0 or snake_body[(self.x - 1, self.y)] else 0
-            danger_right = 1 if self.x + 1 > self.width or snake_body[(self.x + 1, self.y)] else 0
+            direction = 'N'
 
-        # If the snake faces south
         elif going_south:
-            danger_front = 1 if self.y + 1 > self.height or snake_body[(self.x, self.y + 1)] else 0
-            danger_left = 1 if self.x + 1 > self.width or snake_body[(self.x + 1, self.y)] else 0
-            danger_right = 1 if self.x - 1 < 0 or snake_body[(self.x - 1, self.y)] else 0
+            direction = 'S'
 
-        # If the snake faces west
         elif going_west:
-            danger_front = 1 if self.x - 1 < 0 or snake_body[(self.x - 1, self.y)] else 0
-            danger_left = 1 if self.y + 1 > self.height or snake_body[(self.x, self.y + 1)] else 0
-            danger_right = 1 if self.y - 1 < 0 or snake_body[(self.x, self.y - 1)] else 0 
+            direction = 'W'
 
-        # If the snake faces east
         else:
-            danger_front = 1 if self.x + 1 > self.width or snake_body[(self.x + 1, self.y)] else 0
-            danger_left = 1 if self.y - 1 < 0 or snake_body[(self.x, self.y - 1)] else 0 
-            danger_right = 1 if self.y + 1 > self.height or snake_body[(self.x, self.y + 1)] else 0 
+            direction = 'E'
+
+        # The board has a border of walls, so leaving the board is just another occupied neighbour
+        mask = self.board.neighbour_mask(self.x, self.y)
+
+        # A head that just left the board keeps the old bounds checks, sideways cells are only
+        # a danger if they are out of the board on their own axis
+        if not 0 <= self.x <= self.width:
+            mask = mask & (WEST | EAST) | NORTH * (self.y == 0) | SOUTH * (self.y == self.height)
+        elif not 0 <= self.y <= self.height:
+            mask = mask & (NORTH | SOUTH) | WEST * (self.x == 0) | EAST * (self.x == self.width)
+
+        front, left, right = DANGER_MASKS[direction]
+
+        danger_front = 1 if mask & front else 0
+        danger_left = 1 if mask & left else 0
+        danger_right = 1 if mask & right else 0
 
         return danger_front, danger_left, danger_right
     
@@ -179,51 +318,51 @@ class SnakeGame():
         Returns:
             bool
         """
-        # Check if the head is inside the board
-        if not (self.x <= self.width and self.x >= 0 and self.y <= self.height and self.y >= 0):
-            return False
+        # The new head collided with a wall (it left the board) or with the snake body when it was pushed
+        return not self.collision
     
-        # Check if the head is touching the snake body, if inside snake_body there are
-        # two equals positions the dictionary will not have the same length and the list, 
-        # which means that the snake has touched itself.
-        if len(self.snake_body) != len(set([tuple(elem) for elem in self.snake_body])):
-            return False
-        
-        return True
-    
-    def move(self, action):
+    def heading(self) -> str:
         """
-        Moves the snake given the action.
+        Returns the direction the snake faces in the current state, 'N', 'S', 'W' or 'E'.
         """
-        # If the snake faces north
-        if self.state['GoingNorth']:
+        state = self.state
 
-            # Get move increment
-            incr_x, incr_y = MOVE_DICT['N'][action]
+        if self.observation == 'int':
+            return 'N' if state & 0x80 else 'S' if state & 0x40 else 'W' if state & 0x20 else 'E'
 
-        # If the snake faces south
-        elif self.state['GoingSouth']:
+        if self.observation == 'grid':
+            return self.current_direction
 
-            # Get move increment
-            incr_x, incr_y = MOVE_DICT['S'][action]
+        return 'N' if state['GoingNorth'] else 'S' if state['GoingSouth'] else 'W' if state['GoingWest'] else 'E'
 
-        # If the snake faces west
-        elif self.state['GoingWest']:
+    def state_dict(self) -> dict:
+        """
+        Returns the current state as a dictionary, whatever the observation mode. The grids have no features,
+        they are computed from the board (after the tail moved, step checks the dangers before).
+        """
+        if self.observation == 'grid':
+            direction = self.current_direction
+            danger_front, danger_left, danger_right = self.check_danger(direction == 'N', direction == 'S', direction == 'W')
+            food_north, food_south, food_west, food_east = self.get_food_direction()
 
-            # Get move increment
-            incr_x, incr_y = MOVE_DICT['W'][action]
+            return dict(zip(FEATURES, (danger_front, danger_left, danger_right, int(direction == 'N'), int(direction == 'S'),
+                                       int(direction == 'W'), int(direction == 'E'), food_north, food_south, food_west, food_east)))
 
-        # If the snake faces east
-        else:
+        return decode_state(self.state) if self.observation == 'int' else self.state
 
-            # Get move increment
-            incr_x, incr_y = MOVE_DICT['E'][action]
+    def move(self, action):
+        """
+        Moves the snake given the action.
+        """
+        # Get move increment
+        incr_x, incr_y = MOVE_DICT[self.heading()][action]
 
         self.x += incr_x
         self.y += incr_y
 
         # Insert the new head, but don't delete the tail position yet
-        self.snake_body.insert(0, [self.x, self.y])
+        self.snake_body.appendleft((self.x, self.y))
+        self.collision = self.board.push_head(self.x, self.y)
         
         return 
     
@@ -234,21 +373,7 @@ class SnakeGame():
 
         going_north, going_south, going_west, going_east = 0, 0, 0, 0
 
-        # If the snake faces north
-        if self.state['GoingNorth']:
-            direction = DIRECTION_DICT['N'][action]
-
-        # If the snake faces south
-        elif self.state['GoingSouth']:
-            direction = DIRECTION_DICT['S'][action]
-
-        # If the snake faces west
-        elif self.state['GoingWest']:
-            direction = DIRECTION_DICT['W'][action]
-
-        # If the snake faces east
-        else:
-            direction = DIRECTION_DICT['E'][action]
+        direction = DIRECTION_DICT[self.heading()][action]
         
         # Update internal variable
         self.current_direction = direction
@@ -300,7 +425,7 @@ class SnakeGame():
         Returns:
             terminal (bool): Whether the state is a terminal state or not
             reward (int): Reward for step
-            new_state (dict): The new state
+            new_state (dict or int): The new state, see OBSERVATIONS
         """
 
         # Move the snake
@@ -309,9 +434,30 @@ class SnakeGame():
         # Check the new direction the snake is heading
         going_north, going_south, going_west, going_east = self.get_direction(action)
 
+        # Move the head on the grid, the tail and the food are updated where they change
+        if self.grid is not None:
+            grid = self.grid
+            x, y = self.grid_head
+            grid [1, y, x] = 0
+            grid [4:, y, x] = 0
+
+            if self.on_board(self.x, self.y):
+                self.grid_head = (self.x, self.y)
+                grid [0, self.y, self.x] = 1
+                grid [1, self.y, self.x] = 1
+                grid [DIRECTION_PLANES [self.current_direction], self.y, self.x] = 1
+
+            return self.finish_step(self.state)
+
         # Now, check for danger and the new direction of the food
         danger_front, danger_left, danger_right = self.check_danger(going_north, going_south, going_west)
         food_north, food_south, food_west, food_east = self.get_food_direction()
+
+        # Create new state, packed in an integer without building the dictionary
+        if self.observation == 'int':
+            next_state = danger_front << 10 | danger_left << 9 | danger_right << 8 | going_north << 7 | going_south << 6 | \
+                         going_west << 5 | going_east << 4 | food_north << 3 | food_south << 2 | food_west << 1 | food_east
+            return self.finish_step(next_state)
         
 
         # Create new state
@@ -328,7 +474,13 @@ class SnakeGame():
             'FoodWest': food_west,
             'FoodEast': food_east,
         }
-        
+
+        return self.finish_step(next_state)
+
+    def finish_step(self, next_state):
+        """
+        Second half of step, once the next state is built: checks for death, food and the step limit.
+        """
         self.steps += 1
 
         if self.display:
@@ -350,7 +502,11 @@ class SnakeGame():
             return True, -1, next_state
         
         # The last position of the list no longer exists, since the snake moves
-        self.snake_body.pop()
+        x, y = self.snake_body.pop()
+        self.board.pop_tail()
+
+        if self.grid is not None:
+            self.grid [0, y, x] = 0
 
         #return False, -0.01 * manhattan_distance((self.x, self.y), (self.food_x, self.food_y)), next_state
         return False, -1, next_state
@@ -365,10 +521,24 @@ class SnakeGame():
         if not self.food_before:
 
             # Snake starts at the middle of the board
-            self.x = self.width // 2
-            self.y = self.height // 2
+            self.x = self.start_x
+            self.y = self.start_y
 
-            # Spawn food and get the direction to it
+            if self.grid is not None:
+                self.draw_grid_body(0)
+
+            # By default the snake starts by facing north
+            self.current_direction = 'N'
+            self.snake_body = deque([(self.x, self.y), (self.x, self.y + 1), (self.x, self.y + 2)])
+
+            if self.grid is not None:
+                self.draw_grid_body(1)
+
+            self.board.clear()
+            for x, y in reversed(self.snake_body):
+                self.board.push_head(x, y)
+
+            # Spawn food (away from the new body) and get the direction to it
             self.spawn_food()
             food_north, food_south, food_west, food_east = self.get_food_direction()
         
@@ -387,7 +557,11 @@ class SnakeGame():
                 'FoodEast': food_east,
             }
 
-            self.snake_body = [(self.x, self.y), (self.x, self.y + 1), (self.x, self.y + 2)]
+            if self.observation == 'int':
+                self.state = encode_state(self.state)
+
+            elif self.observation == 'grid':
+                self.state = self.view
             
         else:
 
@@ -395,10 +569,14 @@ class SnakeGame():
             self.spawn_food()
             food_north, food_south, food_west, food_east = self.get_food_direction()
 
-            self.state['FoodNorth'] = food_north
-            self.state['FoodSouth'] = food_south
-            self.state['FoodWest'] = food_west
-            self.state['FoodEast'] = food_east
+            if self.observation == 'int':
+                self.state = self.state & ~0xF | food_north << 3 | food_south << 2 | food_west << 1 | food_east
+
+            elif self.observation == 'dict':
+                self.state['FoodNorth'] = food_north
+                self.state['FoodSouth'] = food_south
+                self.state['FoodWest'] = food_west
+                self.state['FoodEast'] = food_east
 
             self.food_before = False
         # Reset number of episode steps
@@ -406,6 +584,63 @@ class SnakeGame():
 
         return
     
+    def snapshot(self, into: list = None) -> list:
+        """
+        Saves the state of the game: head, direction, body, food, counters and the state of the random
+        generator, without the game window. The board keeps a journal of the moves that follow and the grid is
+        drawn from the body, so saving and restoring cost the length of the snake and the moves in between,
+        not the size of the board. Pass a previous snapshot of the same game to reuse its buffers, a rollout
+        planner can then save and restore the game thousands of times per move without allocating.
+
+        return: List [board snapshot, body, (x, y, state, direction, food x, food y, steps, food before,
+            collision, food eaten, deaths), random generator state, random generator version, grid head].
+        """
+        state = dict(self.state) if self.observation == 'dict' else self.state
+        values = (self.x, self.y, state, self.current_direction, self.food_x, self.food_y, self.steps,
+                  self.food_before, self.collision, self.food_eaten, self.deaths)
+        grid_head = self.grid_head if self.grid is not None else None
+
+        if into is None:
+            return [self.board.snapshot(), deque(self.snake_body), values, self.rng.getstate(), self.rng_version, grid_head]
+
+        self.board.snapshot(into [0])
+        body = into [1]
+        body.clear()
+        body.extend(self.snake_body)
+        into [2] = values
+        if into [4] is not self.rng_version:
+            into [3] = self.rng.getstate()
+            into [4] = self.rng_version
+        into [5] = grid_head
+
+        return into
+
+    def restore(self, snapshot: list):
+        """
+        Restores the game to a snapshot, the snapshot can be restored again afterwards.
+        """
+        # The body and the food are erased from the grid and drawn again once restored
+        if self.grid is not None:
+            self.draw_grid_body(0)
+            self.grid [2, self.food_y, self.food_x] = 0
+
+        self.board.restore(snapshot [0])
+        self.snake_body.clear()
+        self.snake_body.extend(snapshot [1])
+
+        self.x, self.y, state, self.current_direction, self.food_x, self.food_y, self.steps, \
+            self.food_before, self.collision, self.food_eaten, self.deaths = snapshot [2]
+        self.state = dict(state) if self.observation == 'dict' else state
+
+        if self.grid is not None:
+            self.draw_grid_body(1)
+            self.grid [2, self.food_y, self.food_x] = 1
+            self.grid_head = snapshot [5]
+
+        if self.rng_version is not snapshot [4]:
+            self.rng.setstate(snapshot [3])
+            self.rng_version = snapshot [4]
+
     def show_scores(self):
 
         score_font = pygame.font.SysFont('times new roman', 17)
@@ -427,19 +662,22 @@ class SnakeGame():
 
         debug_font = pygame.font.SysFont('times new roman', 10)
 
-        danger_front = debug_font.render('Danger front', True, GREEN if self.state['DangerFront'] else RED)
-        danger_left = debug_font.render('Danger left', True, GREEN if self.state['DangerLeft'] else RED)
-        danger_right = debug_font.render('Danger right', True, GREEN if self.state['DangerRight'] else RED)
+        # The dictionary is only built here when the states are integers
+        state = self.state_dict()
+
+        danger_front = debug_font.render('Danger front', True, GREEN if state['DangerFront'] else RED)
+        danger_left = debug_font.render('Danger left', True, GREEN if state['DangerLeft'] else RED)
+        danger_right = debug_font.render('Danger right', True, GREEN if state['DangerRight'] else RED)
 
-        food_north = debug_font.render('Food north', True, GREEN if self.state['FoodNorth'] else RED)
-        food_south = debug_font.render('Food south', True, GREEN if self.state['FoodSouth'] else RED)
-        food_west = debug_font.render('Food west', True, GREEN if self.state['FoodWest'] else RED)
-        food_east = debug_font.render('Food east', True, GREEN if self.state['FoodEast'] else RED)
+        food_north = debug_font.render('Food north', True, GREEN if state['FoodNorth'] else RED)
+        food_south = debug_font.render('Food south', True, GREEN if state['FoodSouth'] else RED)
+        food_west = debug_font.render('Food west', True, GREEN if state['FoodWest'] else RED)
+        food_east = debug_font.render('Food east', True, GREEN if state['FoodEast'] else RED)
 
-        going_north = debug_font.render('Going north', True, GREEN if self.state['GoingNorth'] else RED)
-        going_south = debug_font.render('Going south', True, GREEN if self.state['GoingSouth'] else RED)
-        going_west = debug_font.render('Going west', True, GREEN if self.state['GoingWest'] else RED)
-        going_east = debug_font.render('Going east', True, GREEN if self.state['GoingEast'] else RED)
+        going_north = debug_font.render('Going north', True, GREEN if state['GoingNorth'] else RED)
+        going_south = debug_font.render('Going south', True, GREEN if state['GoingSouth'] else RED)
+        going_west = debug_font.render('Going west', True, GREEN if state['GoingWest'] else RED)
+        going_east = debug_font.render('Going east', True, GREEN if state['GoingEast'] else RED)
 
         food_x = debug_font.render('Food X: ' + str(self.food_x), True, BLUE)
         food_y = debug_font.render('Food Y: ' + str(self.food_y), True, BLUE)
@@ -540,7 +778,289 @@ class SnakeGame():
             # xy-coordinate -> .Rect(x, y, size_x, size_y)
             pygame.draw.rect(self.game_window, GREEN, pygame.Rect(pos[0], pos[1], 10, 10))
 
+        # Walls of the map
+        for x, y in self.walls:
+            pygame.draw.rect(self.game_window, BLUE, pygame.Rect(x, y, 10, 10))
+
         # Snake food
         pygame.draw.rect(self.game_window, WHITE, pygame.Rect(self.food_x, self.food_y, 10, 10))
 
-        return
\ No newline at end of file
+        return
+
+
+# Directions of VecSnakeGame, clockwise so that turning left is -1 and turning right is +1
+VEC_DIRECTIONS = ('N', 'E', 'S', 'W')
+VEC_DX = np.array([0, 1, 0, -1])
+VEC_DY = np.array([-1, 0, 1, 0])
+
+# Turn of every action (front, left, right)
+VEC_TURNS = np.array([0, 3, 1])
+
+# Column of the Going* feature of every direction
+VEC_GOING = np.array([FEATURES.index('GoingNorth'), FEATURES.index('GoingEast'), FEATURES.index('GoingSouth'), FEATURES.index('GoingWest')])
+
+# States are assembled as 11 bit codes (the first feature is the highest bit) and expanded with this table,
+# gathering whole rows is much faster than writing the columns one by one
+VEC_STATES = ((np.arange(N_STATES) [:, None] >> np.arange(len(FEATURES) - 1, -1, -1)) & 1).astype(np.uint8)
+VEC_GOING_BITS = 1 << (len(FEATURES) - 1 - VEC_GOING)
+
+class VecSnakeGame():
+    """
+    N boards of SnakeGame stepped at once, the state of all of them lives in NumPy arrays.
+
+    Every board follows the rules of SnakeGame: the same actions, rewards (-10 dying, +10 eating, -1 otherwise)
+    and terminal states, the head may not enter the cell the tail is leaving, and eating ends the episode but
+    keeps the snake. States are rows of the 11 features of FEATURES (0 or 1), in the order of the state
+    dictionaries, or with observation = 'int' the integers of SnakeGame (see OBSERVATIONS), which index a
+    (N_STATES, 3) Q table directly.
+
+    Occupancy is a flat array per board with a border of walls like the Bitboard, the bodies are ring buffers
+    of cell indices and finished boards are reset inside step. The RNG is a NumPy generator, so the food
+    positions do not follow the ones of SnakeGame.
+    """
+
+    def __init__(self, n: int, width: int = 5, height: int = 5, wall_map = None, seed: int = None, observation: str = 'dict'):
+        """
+        Args:
+            n (int): Number of boards.
+            width, height (int): Cells go from 0 to width and from 0 to height, like in SnakeGame.
+            wall_map (WallMap): Fixed walls of the boards, it sets their size.
+            seed (int): Seed of the food positions.
+            observation (str): 'dict' for states as rows of features, 'int' for states as integers (no grids).
+        """
+        if wall_map is not None:
+            width, height = wall_map.cols - 1, wall_map.rows - 1
+
+        if width < 5 or height < 5:
+            raise ValueError("Both height and width must be higher than 5")
+
+        if observation not in OBSERVATIONS [:2]:
+            raise ValueError('Unknown observation mode, avaliable values: ' + ', '.join(OBSERVATIONS [:2]))
+
+        self.observation = observation
+
+        self.n = n
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+
+        # Cell (X, Y) is at (Y + BORDER) * stride + X + BORDER, the border and the walls are occupied
+        self.stride = width + 1 + 2 * BORDER
+        template = np.ones((height + 1 + 2 * BORDER, self.stride), dtype = np.uint8)
+        template [BORDER:height + 1 + BORDER, BORDER:width + 1 + BORDER] = 0
+        walls = wall_map.walls if wall_map is not None else []
+        for x, y in walls:
+            template [y + BORDER, x + BORDER] = 1
+        self.template = template.ravel()
+        self.cells = (width + 1) * (height + 1) - len(walls)
+
+        # Cells of the four neighbours, in the order of VEC_DIRECTIONS
+        self.deltas = np.array([-self.stride, 1, self.stride, -1])
+
+        # Snake starts at the middle of the board growing towards south (the middle of the free cells on a map)
+        start = wall_map.start() if wall_map is not None else [ (width // 2, height // 2 + i) for i in range(3) ]
+        self.start = np.array([ (y + BORDER) * self.stride + x + BORDER for x, y in reversed(start) ])
+        self.start_x, self.start_y = start [0]
+
+        # Bodies, ring buffers of cells (indices of flat_occupancy) from body [i, tail [i]] to body [i, head [i]]
+        self.capacity = (width + 1) * (height + 1) + 1
+        self.occupancy = np.empty((n, len(self.template)), dtype = np.uint8)
+        self.body = np.zeros((n, self.capacity), dtype = np.int64)
+        self.head = np.zeros(n, dtype = np.int64)
+        self.tail = np.zeros(n, dtype = np.int64)
+
+        # Flat views, fancy indexing one dimension is much faster than two: board i starts at offsets [i]
+        self.flat_occupancy = self.occupancy.reshape(-1)
+        self.flat_body = self.body.reshape(-1)
+        self.offsets = np.arange(n) * len(self.template)
+        self.body_offsets = np.arange(n) * self.capacity
+
+        self.x = np.zeros(n, dtype = np.int64)
+        self.y = np.zeros(n, dtype = np.int64)
+        self.direction = np.zeros(n, dtype = np.int64)
+        self.food_x = np.zeros(n, dtype = np.int64)
+        self.food_y = np.zeros(n, dtype = np.int64)
+        self.steps = np.zeros(n, dtype = np.int64)
+
+        # Current state of every board as an integer, see states
+        self.codes = np.zeros(n, dtype = np.intp)
+
+        self.food_eaten = 0
+        self.deaths = 0
+
+        self.reset()
+
+    def reset(self, boards = None):
+        """
+        Starts a new game on the given boards (indices or boolean mask), all of them by default.
+        """
+        boards = np.arange(self.n) [boards] if boards is not None else np.arange(self.n)
+        if not len(boards):
+            return
+
+        self.occupancy [boards] = self.template
+        self.occupancy [boards [:, None], self.start] = 1
+        self.body [boards, :len(self.start)] = self.offsets [boards, None] + self.start
+        self.head [boards] = len(self.start) - 1
+        self.tail [boards] = 0
+
+        self.x [boards] = self.start_x
+        self.y [boards] = self.start_y
+        self.direction [boards] = 0
+        self.steps [boards] = 0
+        self.spawn_food(boards)
+
+        # Same initial state as SnakeGame, facing north and no danger around the middle of the board
+        self.codes [boards] = VEC_GOING_BITS [0] | self.food_bits(boards)
+
+    def spawn_food(self, boards: np.ndarray):
+        """
+        Spawns food on a random free cell of every given board.
+        """
+        stride, width, height = self.stride, self.width, self.height
+
+        # Rejection sampling for all the boards at once, the last ones get a free cell picked among all of them
+        pending = boards
+        for _ in range(8):
+            x = self.rng.integers(0, width + 1, len(pending))
+            y = self.rng.integers(0, height + 1, len(pending))
+            free = self.occupancy [pending, (y + BORDER) * stride + x + BORDER] == 0
+            self.food_x [pending [free]] = x [free]
+            self.food_y [pending [free]] = y [free]
+
+            pending = pending [~free]
+            if not len(pending):
+                return
+
+        for board in pending:
+            cells = np.flatnonzero(self.occupancy [board] == 0)
+            y, x = np.divmod(cells [self.rng.integers(len(cells))], stride) if len(cells) else (self.start_y + BORDER, self.start_x + BORDER)
+            self.food_x [board], self.food_y [board] = x - BORDER, y - BORDER
+
+    def food_bits(self, boards: np.ndarray) -> np.ndarray:
+        """
+        Returns the FoodNorth, FoodSouth, FoodWest and FoodEast bits of the states of the given boards.
+        """
+        x, y, food_x, food_y = self.x [boards], self.y [boards], self.food_x [boards], self.food_y [boards]
+        return (food_y < y).astype(np.intp) << 3 | (food_y > y).astype(np.intp) << 2 | (food_x < x).astype(np.intp) << 1 | (food_x > x)
+
+    @property
+    def states(self) -> np.ndarray:
+        """
+        Current state of every board, after the resets of the last step.
+        """
+        return self.codes.copy() if self.observation == 'int' else np.take(VEC_STATES, self.codes, axis = 0)
+
+    def step(self, actions):
+        """
+        Performs one step on every board, finished boards are reset afterwards.
+
+        Args:
+            actions (np.ndarray): Action of every board (0 front, 1 left, 2 right).
+
+        Returns:
+            terminal (np.ndarray): Whether the step ended the episode of every board.
+            reward (np.ndarray): Reward of every board.
+            next_state (np.ndarray): States reached by the step, (n, 11) features or (n,) integers. The state
+                of the boards that were reset is then in self.states, like SnakeGame.state after reset.
+        """
+        n, stride, capacity, deltas = self.n, self.stride, self.capacity, self.deltas
+        occupancy = self.flat_occupancy
+
+        # Move the heads
+        direction = (self.direction + VEC_TURNS [actions]) & 3
+        x = self.x + VEC_DX [direction]
+        y = self.y + VEC_DY [direction]
+        self.direction, self.x, self.y = direction, x, y
+
+        # The tail is still on the board, so moving to its cell is a collision
+        cell = self.offsets + (y + BORDER) * stride + x + BORDER
+        died = occupancy [cell] == 1
+        occupancy [cell] = 1
+
+        head = self.head
+        head += 1
+        head [head == capacity] = 0
+        self.flat_body [self.body_offsets + head] = cell
+
+        # Danger on the front, left and right of the heads, direction and direction of the food
+        food_x, food_y = self.food_x, self.food_y
+        code = occupancy [cell + deltas [direction]].astype(np.intp) << 10
+        code |= occupancy [cell + deltas [(direction + 3) & 3]].astype(np.intp) << 9
+        code |= occupancy [cell + deltas [(direction + 1) & 3]].astype(np.intp) << 8
+        code |= VEC_GOING_BITS [direction]
+        code |= (food_y < y).astype(np.intp) << 3
+        code |= (food_y > y).astype(np.intp) << 2
+        code |= (food_x < x).astype(np.intp) << 1
+        code |= food_x > x
+
+        # A head that just left the board keeps the bounds checks of SnakeGame, sideways cells are only a
+        # danger if they are out of the board on their own axis
+        off = np.flatnonzero((x < 0) | (x > self.width) | (y < 0) | (y > self.height))
+        if len(off):
+            off_x = (x [off] < 0) | (x [off] > self.width)
+            around = occupancy [cell [off, None] + deltas].astype(np.intp)
+            around [:, 0] = np.where(off_x, y [off] == 0, around [:, 0])
+            around [:, 2] = np.where(off_x, y [off] == self.height, around [:, 2])
+            around [:, 3] = np.where(off_x, around [:, 3], x [off] == 0)
+            around [:, 1] = np.where(off_x, around [:, 1], x [off] == self.width)
+
+            rows, turn = np.arange(len(off)), direction [off]
+            code [off] = code [off] & 0xFF | around [rows, turn] << 10 | around [rows, (turn + 3) & 3] << 9 | \
+                         around [rows, (turn + 1) & 3] << 8
+
+        next_state = code.copy() if self.observation == 'int' else np.take(VEC_STATES, code, axis = 0)
+
+        self.steps += 1
+
+        eaten = (x == food_x) & (y == food_y) & ~died
+        timeout = (self.steps == MAX_STEPS) & ~died & ~eaten
+        terminal = died | eaten | timeout
+
+        reward = np.full(n, -1)
+        reward [died] = -10
+        reward [eaten] = 10
+
+        self.deaths += int(np.count_nonzero(died))
+        self.food_eaten += int(np.count_nonzero(eaten))
+
+        # The tail leaves its cell unless the episode ended
+        moving = np.flatnonzero(~terminal)
+        tail = self.tail
+        occupancy [self.flat_body [self.body_offsets [moving] + tail [moving]]] = 0
+        tail [moving] += 1
+        tail [tail == capacity] = 0
+
+        # Eating keeps the snake and spawns new food, the other terminal states start a new game
+        self.codes = code
+        fed = np.flatnonzero(eaten)
+        if len(fed):
+            self.steps [fed] = 0
+            self.spawn_food(fed)
+            code [fed] = code [fed] & ~0xF | self.food_bits(fed)
+
+        if len(moving) + len(fed) < n:
+            self.reset(died | timeout)
+
+        return terminal, reward, next_state
+
+    def step_async(self, actions):
+        """
+        Keeps the actions for step_wait, same interface as SubprocVecSnakeGame (the step runs in step_wait).
+        """
+        self.actions = actions
+
+    def step_wait(self):
+        """
+        Performs the step of the actions given to step_async, see step.
+        """
+        return self.step(self.actions)
+
+    def as_dict(self, state) -> dict:
+        """
+        Returns a state (row of features or integer) as the state dictionary of SnakeGame.
+        """
+        if self.observation == 'int':
+            return decode_state(state)
+
+        return dict(zip(FEATURES, map(int, state)))
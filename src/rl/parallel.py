@@ -0,0 +1,467 @@
+import multiprocessing, queue, random, traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .agent import Jormungandr
+from .environments import SnakeGame, FEATURES, GRID_PLANES, OBSERVATIONS, N_STATES, decode_state
+from .solvers import SARSA, QLearning, n_step_SARSA, n_step_OffPolicy, SARSALambda, QLambda
+
+# Messages of the pipes between SubprocVecSnakeGame and its workers, the data goes through the shared memory
+STEP, CLOSE, DONE = b's', b'c', b'd'
+
+
+def shared_arrays(buffer, n: int, workers: int, state_shape: tuple, state_dtype) -> dict:
+    """
+    Lays out the arrays exchanged with the workers on a shared memory buffer, the same way in every process.
+    Pass None as the buffer to get the number of bytes needed.
+
+    return: Dictionary of arrays (views of the buffer), or the size of the buffer.
+    """
+    layout = (('actions', (n,), np.int64), ('terminal', (n,), np.bool_), ('reward', (n,), np.int64),
+              ('next_state', (n,) + state_shape, state_dtype), ('states', (n,) + state_shape, state_dtype),
+              ('counters', (workers, 2), np.int64))
+
+    arrays, offset = {}, 0
+    for name, shape, dtype in layout:
+        dtype = np.dtype(dtype)
+
+        # Every array starts on a multiple of 8 bytes
+        offset = (offset + 7) & ~7
+        size = int(np.prod(shape)) * dtype.itemsize
+        if buffer is not None:
+            arrays [name] = np.ndarray(shape, dtype = dtype, buffer = buffer, offset = offset)
+        offset += size
+
+    return arrays if buffer is not None else offset
+
+
+def state_row(state):
+    """
+    Returns a state of SnakeGame as its row of the shared states: the features of a dictionary, the integer or
+    the grid.
+    """
+    if isinstance(state, dict):
+        return list(state.values())
+
+    return state
+
+
+def run_worker(pipe, name: str, n: int, workers: int, state_shape: tuple, state_dtype, worker: int, start: int, stop: int, config: dict):
+    """
+    Loop of a worker process of SubprocVecSnakeGame, steps the boards [start, stop) every time it gets STEP.
+    """
+    memory = shared_memory.SharedMemory(name = name)
+    arrays = shared_arrays(memory.buf, n, workers, state_shape, state_dtype)
+    actions, terminal, reward = arrays ['actions'], arrays ['terminal'], arrays ['reward']
+    next_state, states, counters = arrays ['next_state'], arrays ['states'], arrays ['counters']
+
+    try:
+        seed = config.pop('seed')
+        games = [ SnakeGame(None, seed = None if seed is None else seed + board, **config) for board in range(start, stop) ]
+        for board, game in enumerate(games, start):
+            states [board] = state_row(game.state)
+
+        pipe.send_bytes(DONE)
+        while pipe.recv_bytes() == STEP:
+            try:
+                for board, game in enumerate(games, start):
+                    done, reward [board], state = game.step(int(actions [board]))
+                    terminal [board] = done
+                    next_state [board] = state_row(state)
+
+                    # Finished boards start again (eating keeps the snake), the solvers set the state themselves
+                    if done:
+                        game.reset()
+                        states [board] = state_row(game.state)
+                    else:
+                        game.state = state
+                        states [board] = next_state [board]
+
+                counters [worker, 0] = sum(game.food_eaten for game in games)
+                counters [worker, 1] = sum(game.deaths for game in games)
+
+            except Exception:
+                pipe.send_bytes(traceback.format_exc().encode())
+                continue
+
+            pipe.send_bytes(DONE)
+
+    finally:
+        del arrays, actions, terminal, reward, next_state, states, counters
+        memory.close()
+
+
+class SubprocVecSnakeGame():
+    """
+    N boards of SnakeGame stepped by worker processes, with the interface of VecSnakeGame.
+
+    Every worker owns a slice of the boards, plain SnakeGame games with their own seeds. The actions, rewards,
+    terminal flags and states are arrays on a single block of shared memory: step_async writes the actions
+    and wakes the workers up with one byte through their pipes, step_wait waits for their bytes back and
+    copies the results out, so nothing is pickled. Between both calls the learner can do its own work (the
+    updates of the last step) while the boards move.
+
+    States are rows of the 11 features (0 or 1), integers, or grids (C, H, W) with the observation modes of
+    SnakeGame. Finished boards are reset in the workers, like in VecSnakeGame. Call close (or use the object as
+    a context manager) to stop the workers and free the memory.
+    """
+
+    def __init__(self, n: int, workers: int = None, width: int = 5, height: int = 5, wall_map = None, seed: int = None, observation: str = 'dict', context: str = None):
+        """
+        Args:
+            n (int): Number of boards.
+            workers (int): Number of worker processes, one per CPU by default (never more than the boards).
+            width, height (int): Cells go from 0 to width and from 0 to height, like in SnakeGame.
+            wall_map (WallMap): Fixed walls of the boards, it sets their size.
+            seed (int): Seed of the food positions, board i is seeded with seed + i.
+            observation (str): 'dict', 'int' or 'grid', see OBSERVATIONS.
+            context (str): Start method of the processes ('fork', 'spawn', ...), the default of the platform by default.
+        """
+        if wall_map is not None:
+            width, height = wall_map.cols - 1, wall_map.rows - 1
+
+        if width < 5 or height < 5:
+            raise ValueError("Both height and width must be higher than 5")
+
+        if observation not in OBSERVATIONS:
+            raise ValueError('Unknown observation mode, avaliable values: ' + ', '.join(OBSERVATIONS))
+
+        self.n = n
+        self.width = width
+        self.height = height
+        self.observation = observation
+        self.workers = max(1, min(n, workers or multiprocessing.cpu_count()))
+
+        # Shape of a state in the shared arrays
+        if observation == 'dict':
+            state_shape, state_dtype = (len(FEATURES),), np.uint8
+        elif observation == 'int':
+            state_shape, state_dtype = (), np.intp
+        else:
+            state_shape, state_dtype = (len(GRID_PLANES), height + 1, width + 1), np.uint8
+
+        layout = (n, self.workers, state_shape, state_dtype)
+        self.memory = shared_memory.SharedMemory(create = True, size = shared_arrays(None, *layout))
+        arrays = shared_arrays(self.memory.buf, *layout)
+        self.actions, self.terminal, self.reward = arrays ['actions'], arrays ['terminal'], arrays ['reward']
+        self.next_state, self.shared_states, self.counters = arrays ['next_state'], arrays ['states'], arrays ['counters']
+        self.counters [:] = 0
+        self.closed = False
+
+        # Boards of every worker, as even as possible
+        bounds = np.linspace(0, n, self.workers + 1).astype(int)
+        config = { 'width': width, 'height': height, 'wall_map': wall_map, 'observation': observation, 'seed': seed }
+
+        context = multiprocessing.get_context(context)
+        self.pipes, self.processes = [], []
+        for worker in range(self.workers):
+            pipe, child = context.Pipe()
+            process = context.Process(target = run_worker, daemon = True,
+                                      args = (child, self.memory.name, *layout, worker, bounds [worker], bounds [worker + 1], dict(config)))
+            process.start()
+            child.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+        # The workers answer once their boards are built
+        self.waiting = True
+        self.step_wait_workers()
+
+    def step_wait_workers(self):
+        """
+        Waits until every worker answered, raises the error of the first worker that failed.
+        """
+        try:
+            errors = [ pipe.recv_bytes() for pipe in self.pipes ]
+        except EOFError:
+            raise RuntimeError('A worker of SubprocVecSnakeGame stopped') from None
+        finally:
+            self.waiting = False
+
+        for error in errors:
+            if error != DONE:
+                raise RuntimeError('A worker of SubprocVecSnakeGame failed:\n' + error.decode())
+
+    @property
+    def states(self) -> np.ndarray:
+        """
+        Current state of every board, after the resets of the last step.
+        """
+        if self.waiting:
+            raise RuntimeError('The boards are moving, call step_wait first')
+
+        return self.shared_states.copy()
+
+    @property
+    def food_eaten(self) -> int:
+        return int(self.counters [:, 0].sum())
+
+    @property
+    def deaths(self) -> int:
+        return int(self.counters [:, 1].sum())
+
+    def step_async(self, actions):
+        """
+        Starts one step on every board and returns without waiting for it, see step_wait.
+
+        Args:
+            actions (np.ndarray): Action of every board (0 front, 1 left, 2 right).
+        """
+        if self.waiting:
+            raise RuntimeError('The boards are moving, call step_wait first')
+
+        self.actions [:] = actions
+        self.waiting = True
+        for pipe in self.pipes:
+            pipe.send_bytes(STEP)
+
+    def step_wait(self):
+        """
+        Waits for the step started by step_async.
+
+        Returns:
+            terminal, reward, next_state (np.ndarray): Like VecSnakeGame.step, copies that the next steps
+                do not overwrite.
+        """
+        self.step_wait_workers()
+
+        return self.terminal.copy(), self.reward.copy(), self.next_state.copy()
+
+    def step(self, actions):
+        """
+        Performs one step on every board, finished boards are reset afterwards. See VecSnakeGame.step.
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def as_dict(self, state) -> dict:
+        """
+        Returns a state (row of features or integer) as the state dictionary of SnakeGame.
+        """
+        if self.observation == 'int':
+            return decode_state(state)
+
+        return dict(zip(FEATURES, map(int, state)))
+
+    def close(self):
+        """
+        Stops the workers and frees the shared memory.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        if self.waiting:
+            try:
+                self.step_wait_workers()
+            except RuntimeError:
+                pass
+
+        for pipe in self.pipes:
+            try:
+                pipe.send_bytes(CLOSE)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout = 5)
+            if process.is_alive():
+                process.terminate()
+        for pipe in self.pipes:
+            pipe.close()
+
+        del self.actions, self.terminal, self.reward, self.next_state, self.shared_states, self.counters
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
+
+
+# Solvers the Hogwild workers can run, by the names of -la
+HOGWILD_SOLVERS = { 'sarsa': SARSA, 'qlearning': QLearning, 'nstepsarsa': n_step_SARSA, 'nstepoffpolicy': n_step_OffPolicy,
+                    'sarsalambda': SARSALambda, 'qlambda': QLambda }
+
+
+def run_hogwild_worker(results, name: str, worker: int, config: dict, episodes: int, chunk: int):
+    """
+    Loop of a worker process of Hogwild: its own SnakeGame and solver, updating the shared Q without locks.
+    Every chunk episodes it puts (worker, reward sums, food eaten, deaths) on the results queue, and None
+    with the traceback (or nothing) when it ends.
+    """
+    memory = shared_memory.SharedMemory(name = name)
+    Q = np.ndarray((N_STATES, 3), dtype = np.float64, buffer = memory.buf)
+    agent = None
+
+    try:
+        # The forked workers would explore with the same random numbers otherwise
+        seed = None if config ['seed'] is None else config ['seed'] + worker
+        random.seed(seed)
+        np.random.seed(seed)
+
+        environment = SnakeGame(None, seed = seed, observation = 'int', **config ['environment'])
+        agent = Jormungandr(config ['alpha'], config ['action_selector'], environment, checkpoint = None, symmetric = config ['symmetric'])
+        agent.Q = Q
+
+        solver = config ['solver']
+        if solver in ('sarsalambda', 'qlambda'):
+            arguments = { 'lam': config ['lam'], 'trace': config ['trace'] }
+        elif solver in ('nstepsarsa', 'nstepoffpolicy'):
+            arguments = { 'n_steps': config ['n_steps'], 'planner': None }
+        else:
+            arguments = { 'planner': None }
+        solver = HOGWILD_SOLVERS [solver](agent = agent, environment = environment, save_path = None, test = False, **arguments)
+
+        rewards = []
+        for episode in range(1, episodes + 1):
+            solver.run_episode()
+            rewards.append(solver.reward_sum)
+
+            if len(rewards) == chunk or episode == episodes:
+                results.put((worker, rewards, environment.food_eaten, environment.deaths))
+                rewards = []
+
+        results.put((worker, None, None, None))
+
+    except Exception:
+        results.put((worker, None, traceback.format_exc(), None))
+
+    finally:
+        del Q, agent
+        memory.close()
+
+
+class Hogwild():
+    """
+    Tabular training with many processes on a single Q table, without locks.
+
+    Q lives on shared memory and every worker process runs its own SnakeGame and solver (SARSA, Q-learning, the
+    n-step or the lambda-return ones, without planner) on it, reading and writing the entries with no synchronization at all.
+    Two workers rarely update the same entry at the same time, and when they do one of the updates is lost,
+    which costs much less than locking every update (Hogwild!). The coordinator, in the main process,
+    collects the reward sums, foods eaten and deaths the workers send every few episodes and counts the
+    episodes on the checkpoint manager, which saves copies of the shared table.
+
+    After train, agent.Q is a private copy of the shared table again.
+    """
+
+    def __init__(self, agent: Jormungandr, learning_algorithm: str, workers: int = None, width: int = 5, height: int = 5, wall_map = None,
+                 n_steps: int = 3, lam: float = 0.9, trace: str = 'replacing', checkpoints = None, seed: int = None, context: str = None):
+        """
+        Args:
+            agent (Jormungandr): Agent with the initial Q, its alpha, action selector and symmetry are used by every worker.
+            learning_algorithm (str): Solver of the workers, see HOGWILD_SOLVERS.
+            workers (int): Number of worker processes, one per CPU by default.
+            width, height (int): Size of the board of the SnakeGame of every worker.
+            wall_map (WallMap): Fixed walls of the boards, it sets their size.
+            n_steps (int): Steps of the n-step solvers.
+            lam (float), trace (str): Lambda and trace mode of the lambda-return solvers.
+            checkpoints (CheckpointManager): Saves the shared Q, nothing is saved by default.
+            seed (int): Seed of the worker i (food and exploration) is seed + i.
+            context (str): Start method of the processes ('fork', 'spawn', ...), the default of the platform by default.
+        """
+        learning_algorithm = learning_algorithm.lower()
+        if learning_algorithm not in HOGWILD_SOLVERS:
+            raise ValueError('Unknown learning algorithm, avaliable values: ' + ', '.join(HOGWILD_SOLVERS))
+
+        self.agent = agent
+        self.workers = max(1, workers or multiprocessing.cpu_count())
+        self.checkpoints = checkpoints
+        self.context = multiprocessing.get_context(context)
+        self.config = { 'solver': learning_algorithm, 'alpha': agent.alpha, 'action_selector': agent.action_selector, 'symmetric': agent.symmetric,
+                        'n_steps': n_steps, 'lam': lam, 'trace': trace, 'seed': seed, 'environment': { 'width': width, 'height': height, 'wall_map': wall_map } }
+
+        # Reward sum of every episode, in the order the coordinator got them, and the last counters of every worker
+        self.reward_sums = []
+        self.worker_food_eaten = [0] * self.workers
+        self.worker_deaths = [0] * self.workers
+
+    @property
+    def food_eaten(self) -> int:
+        return sum(self.worker_food_eaten)
+
+    @property
+    def deaths(self) -> int:
+        return sum(self.worker_deaths)
+
+    def train(self, episodes: int, chunk: int = 10, progress = None) -> list:
+        """
+        Runs the given number of episodes, split among the workers.
+
+        Args:
+            episodes (int): Episodes of all the workers together.
+            chunk (int): Episodes between two reports of a worker.
+            progress (callable): Called with the number of episodes of every report (tqdm.update).
+
+        return: Reward sums of the episodes of this call.
+        """
+        agent, workers = self.agent, self.workers
+        memory = shared_memory.SharedMemory(create = True, size = agent.Q.nbytes)
+        Q = np.ndarray((N_STATES, 3), dtype = np.float64, buffer = memory.buf)
+        Q [:] = agent.Q
+        agent.Q = Q
+
+        results = self.context.Queue()
+        processes = []
+        first = len(self.reward_sums)
+        error = None
+
+        try:
+            for worker in range(workers):
+                share = episodes // workers + (worker < episodes % workers)
+                process = self.context.Process(target = run_hogwild_worker, daemon = True,
+                                               args = (results, memory.name, worker, self.config, share, chunk))
+                process.start()
+                processes.append(process)
+
+            running = workers
+            while running:
+                try:
+                    worker, rewards, food_eaten, deaths = results.get(timeout = 1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        error = error or 'The Hogwild workers stopped without reporting'
+                        break
+                    continue
+
+                if rewards is None:
+                    running -= 1
+                    error = error or food_eaten
+                    continue
+
+                self.reward_sums.extend(rewards)
+                self.worker_food_eaten [worker], self.worker_deaths [worker] = food_eaten, deaths
+                if progress is not None:
+                    progress(len(rewards))
+
+                if self.checkpoints is not None:
+                    for _ in rewards:
+                        self.checkpoints.episode(Q)
+
+            for process in processes:
+                process.join()
+
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+            agent.Q = np.array(Q)
+            if self.checkpoints is not None:
+                self.checkpoints.Q = agent.Q
+
+            del Q
+            memory.close()
+            memory.unlink()
+
+        if error is not None:
+            raise RuntimeError('A Hogwild worker failed:\n' + error)
+
+        return self.reward_sums [first:]
@@ -1,6 +1,12 @@
+import math, time
+from concurrent.futures import ProcessPoolExecutor
 from random import sample
 from queue import PriorityQueue
 
+import numpy as np
+
+from utils import softmax
+
 from .agent import Jormungandr
 from .environments import SnakeGame
 
@@ -48,21 +54,26 @@ class DynaQ():
         k = self.planning_steps if self.planning_steps <= len(self.model) else len(self.model)
         samples = sample(self.model, k = k)
 
+        if not samples:
+            return
+
+        # All the samples in one batch update, the targets use Q before the planning
+        columns = list(zip(*samples))
         if self.learning_algorithm == 'sarsa':
-            for state, action, reward, next_state, next_action in samples:
-                self.agent.update_Sarsa(state, action, reward, next_state, next_action, terminal=False)
+            state, action, reward, next_state, next_action = columns
+            self.agent.update_Sarsa_batch(state, action, reward, next_state, next_action, np.zeros(k, dtype = bool))
 
         elif self.learning_algorithm == 'qlearning':
-            for state, action, reward, next_state in samples:
-                self.agent.update_QLearning(state, action, reward, next_state, terminal=False)
+            state, action, reward, next_state = columns
+            self.agent.update_QLearning_batch(state, action, reward, next_state, np.zeros(k, dtype = bool))
 
         elif self.learning_algorithm == 'nStepSarsa':
-            for state, action, gain in samples:
-                self.agent.update_n_step_sarsa(state, action, gain)
+            state, action, gain = columns
+            self.agent.update_batch(state, action, gain)
 
         elif self.learning_algorithm == 'nStepOffPolicy':
-            for state, action, sampling_ratio, gain in samples:
-                self.agent.update_n_step_offpolicy(state, action, sampling_ratio, gain)
+            state, action, sampling_ratio, gain = columns
+            self.agent.update_batch(state, action, gain, sampling_ratio)
 
         return
 
@@ -111,19 +122,20 @@ class DynaQWithPriority():
 
         if self.learning_algorithm == 'sarsa':
             state, action, reward, next_state, next_action = features
-            priority = -1 * abs(reward + self.agent.Q[*next_state.values()][next_action] - self.agent.Q[*state.values()][action])
+            priority = -1 * abs(reward + self.agent.get_Q(next_state)[next_action] - self.agent.get_Q(state)[action])
             try:
-                self.transitions[*next_state.values()].append([state, action, reward, next_action])
+                self.transitions[self.agent.state_index(next_state)].append([state, action, reward, next_action])
             except:
-                self.transitions[*next_state.values()] = [[state, action, reward, next_action]]
+                self.transitions[self.agent.state_index(next_state)] = [[state, action, reward, next_action]]
 
         elif self.learning_algorithm == 'qlearning':
             state, action, reward, next_state = features
-            priority = -1 * abs(reward + self.agent.Q[*next_state.values()][self.agent.action_selector.get_greedy_action(self.agent.get_Q(next_state))] - self.agent.Q[*state.values()][action])
+            next_Q = self.agent.get_Q(next_state)
+            priority = -1 * abs(reward + next_Q[self.agent.action_selector.get_greedy_action(next_Q)] - self.agent.get_Q(state)[action])
             try:
-                self.transitions[*next_state.values()].append([state, action, reward])
+                self.transitions[self.agent.state_index(next_state)].append([state, action, reward])
             except:
-                self.transitions[*next_state.values()] = [[state, action, reward]]
+                self.transitions[self.agent.state_index(next_state)] = [[state, action, reward]]
         
         # Put it in priority queue
         if abs(priority) > self.threshold:
@@ -143,11 +155,11 @@ class DynaQWithPriority():
 
                 # For all states that lead to S
                 try:
-                    transitions = self.transitions[*state.values()]
+                    transitions = self.transitions[self.agent.state_index(state)]
 
                     # Here we take the previous states that lead to the current state
                     for prev_state, prev_action, curr_reward, curr_state, curr_action in transitions:
-                        priority = -1 * abs(curr_reward + self.agent.Q[*curr_state.values()][curr_action] - self.agent.Q[*prev_state.values()][prev_action])
+                        priority = -1 * abs(curr_reward + self.agent.get_Q(curr_state)[curr_action] - self.agent.get_Q(prev_state)[prev_action])
 
                         if abs(priority) > self.threshold:
                             self.prioqueue.put((priority, features))
@@ -160,11 +172,12 @@ class DynaQWithPriority():
 
                 # For all states that lead to S
                 try:
-                    transitions = self.transitions[*state.values()]
+                    transitions = self.transitions[self.agent.state_index(state)]
 
                     # Here we take the previous states that lead to the current state
                     for prev_state, prev_action, curr_reward, curr_state in transitions:
-                        priority = -1 * abs(curr_reward + self.agent.Q[*curr_state.values()][self.agent.action_selector.get_greedy_action(self.agent.get_Q(curr_state))] - self.agent.Q[*prev_state.values()][prev_action])
+                        curr_Q = self.agent.get_Q(curr_state)
+                        priority = -1 * abs(curr_reward + curr_Q[self.agent.action_selector.get_greedy_action(curr_Q)] - self.agent.get_Q(prev_state)[prev_action])
 
                         if abs(priority) > self.threshold:
                             self.prioqueue.put((priority, features))
@@ -173,4 +186,321 @@ class DynaQWithPriority():
 
             steps += 1
         
-        return
\ No newline at end of file
+        return
+
+
+class Node():
+    """
+    State of the MCTS tree with the statistics of its three actions.
+    """
+
+    def __init__(self, prior: list, estimates: list, key: tuple):
+
+        # Probability of every action (softmax of Q) and Q(S, A), the value of the actions not tried yet
+        self.prior = prior
+        self.estimates = estimates
+
+        # Visits and sum of the returns of every action
+        self.visits = [0, 0, 0]
+        self.returns = [0.0, 0.0, 0.0]
+        self.total = 0
+
+        # Reward of every action, whether it ends the game (death or step limit) and the state it leads to
+        self.rewards = [0, 0, 0]
+        self.terminal = [False, False, False]
+        self.children = [None, None, None]
+
+        # Head, food, length and steps of the environment, checked before reusing the node as the root
+        self.key = key
+
+    def mean(self, action: int) -> float:
+        """
+        Mean return of the action, its Q while it has not been tried.
+        """
+        visits = self.visits [action]
+        return self.returns [action] / visits if visits else self.estimates [action]
+
+
+class MCTS():
+    """
+    Online Monte Carlo Tree Search from the current state of a SnakeGame, using the Q of a tabular agent.
+
+    Every simulation restores a snapshot of the real game, walks down the tree choosing the actions with
+    PUCT (the prior of the actions is the softmax of Q and the actions not tried yet are worth their Q),
+    playing them on the environment, adds the first new state to the tree and evaluates it with max Q (after
+    an optional greedy rollout). The food spawns from the random generator saved in the snapshot, so the
+    game is deterministic from the root, eating goes on with the next food and only deaths end a branch.
+
+    The action taken is the most visited one and its subtree is the root of the next search when the game
+    got where the tree expected. With workers > 1 more processes search from the same snapshot with noise on
+    their root priors and their root visits are added to the local ones (root parallelization).
+    """
+
+    def __init__(self, agent: Jormungandr, environment: SnakeGame, simulations: int = 100, milliseconds: float = None,
+                 c_puct: float = 2.0, gamma: float = 0.95, temperature: float = 1.0, rollout_steps: int = 0,
+                 workers: int = 1, noise: float = 0.0, seed: int = None) -> None:
+        """
+        Args:
+            agent (Jormungandr): Tabular agent, its Q is the prior and the evaluation of the leaves.
+            environment (SnakeGame): Real game, the search plays on it and restores it afterwards.
+            simulations (int): Simulations per move, None for no limit (then milliseconds is the budget).
+            milliseconds (float): Time budget per move, None for no limit.
+            c_puct (float): Weight of the exploration term.
+            gamma (float): Discount of the rewards along the tree.
+            temperature (float): Temperature of the softmax of Q of the priors.
+            rollout_steps (int): Greedy steps played from every new leaf before evaluating it with Q.
+            workers (int): Processes searching in parallel, this one included.
+            noise (float): Fraction of Dirichlet noise mixed in the priors of the root.
+            seed (int): Seed of the noise.
+        """
+        if simulations is None and milliseconds is None:
+            raise ValueError('The search needs a budget, simulations or milliseconds')
+
+        self.agent = agent
+        self.environment = environment
+
+        # Budget per move
+        self.simulations = simulations
+        self.milliseconds = milliseconds
+
+        self.c_puct = c_puct
+        self.gamma = gamma
+        self.temperature = temperature
+        self.rollout_steps = rollout_steps
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+        # Arguments to build the same planner in the worker processes
+        self.workers = workers
+        self.config = (environment.width, environment.height, environment.wall_map, environment.observation,
+                       c_puct, gamma, temperature, rollout_steps)
+        self.executor = None
+
+        # Root of the next search, and snapshot of the game reused by every search
+        self.root = None
+        self.snapshot = None
+
+        # Simulations of the last search, whether it started from the previous subtree, and its root visits
+        # and returns (workers included)
+        self.simulations_run = 0
+        self.reused = False
+        self.visits = [0, 0, 0]
+        self.returns = [0.0, 0.0, 0.0]
+
+        # Reward sum of the last episode (run_episode)
+        self.reward_sum = 0
+
+        return
+
+    def key(self) -> tuple:
+        """
+        Identifies the state of the environment for the reuse of the subtrees.
+        """
+        environment = self.environment
+        return (environment.x, environment.y, environment.food_x, environment.food_y, environment.steps, len(environment.snake_body))
+
+    def node(self) -> Node:
+        """
+        Builds the node of the current state of the environment.
+        """
+        Q = self.agent.get_Q(self.environment.state)
+        return Node(softmax(Q / self.temperature).tolist(), Q.tolist(), self.key())
+
+    def play(self, action: int) -> tuple:
+        """
+        Plays an action like the solvers do, after eating the game goes on with the next food.
+
+        return: Tuple (reward, terminal), terminal when the snake died or reached the step limit.
+        """
+        environment = self.environment
+        terminal, reward, environment.state = environment.step(action)
+
+        if terminal and environment.food_before:
+            environment.reset()
+            return reward, False
+
+        return reward, terminal
+
+    def select(self, node: Node) -> int:
+        """
+        Returns the action of the node with the highest PUCT score.
+        """
+        exploration = self.c_puct * math.sqrt(node.total + 1)
+        prior, visits = node.prior, node.visits
+
+        best, best_score = 0, -math.inf
+        for action in range(3):
+            score = node.mean(action) + exploration * prior [action] / (1 + visits [action])
+            if score > best_score:
+                best, best_score = action, score
+
+        return best
+
+    def evaluate(self, node: Node) -> float:
+        """
+        Value of a new leaf, max Q after the greedy rollout.
+        """
+        if not self.rollout_steps:
+            return max(node.estimates)
+
+        agent, gamma = self.agent, self.gamma
+        value, discount = 0.0, 1.0
+        Q = node.estimates
+        for _ in range(self.rollout_steps):
+            reward, terminal = self.play(int(np.argmax(Q)))
+            value += discount * reward
+            discount *= gamma
+            if terminal:
+                return value
+
+            Q = agent.get_Q(self.environment.state)
+
+        return value + discount * max(Q)
+
+    def simulate(self, root: Node, snapshot: list):
+        """
+        Runs one simulation from the root, the environment is at the snapshot of the root.
+        """
+        self.environment.restore(snapshot)
+        node, path = root, []
+
+        while True:
+            action = self.select(node)
+            path.append((node, action))
+
+            # A known death, nothing to play
+            if node.terminal [action]:
+                value = 0.0
+                break
+
+            reward, terminal = self.play(action)
+            child = node.children [action]
+
+            if child is None:
+                node.rewards [action] = reward
+                if terminal:
+                    node.terminal [action] = True
+                    value = 0.0
+                else:
+                    child = node.children [action] = self.node()
+                    value = self.evaluate(child)
+                break
+
+            node = child
+
+        # Backup of the discounted returns
+        gamma = self.gamma
+        for node, action in reversed(path):
+            value = node.rewards [action] + gamma * value
+            node.visits [action] += 1
+            node.returns [action] += value
+            node.total += 1
+
+    def search(self) -> int:
+        """
+        Searches from the current state of the environment within the budget and returns the action to take.
+        The environment is left as it was.
+        """
+        environment = self.environment
+        display, environment.display = environment.display, False
+
+        snapshot = self.snapshot = environment.snapshot(self.snapshot)
+        key = self.key()
+
+        self.reused = self.root is not None and self.root.key == key
+        root = self.root if self.reused else self.node()
+
+        if self.noise:
+            noise = self.rng.dirichlet([0.3] * 3)
+            root.prior = [ (1 - self.noise) * p + self.noise * n for p, n in zip(root.prior, noise) ]
+
+        # The other processes search while this one does
+        futures = []
+        if self.workers > 1:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers = self.workers - 1)
+
+            futures = [ self.executor.submit(search_root, self.config, self.agent.Q, snapshot, self.simulations,
+                                             self.milliseconds, int(self.rng.integers(1 << 31)))
+                        for _ in range(self.workers - 1) ]
+
+        deadline = None if self.milliseconds is None else time.perf_counter() + self.milliseconds / 1000
+        simulations = 0
+        while (self.simulations is None or simulations < self.simulations) and (deadline is None or time.perf_counter() < deadline):
+            self.simulate(root, snapshot)
+            simulations += 1
+
+        environment.restore(snapshot)
+        environment.display = display
+
+        visits, returns = list(root.visits), list(root.returns)
+        for future in futures:
+            worker_visits, worker_returns = future.result()
+            visits = [ a + b for a, b in zip(visits, worker_visits) ]
+            returns = [ a + b for a, b in zip(returns, worker_returns) ]
+
+        self.simulations_run = simulations
+        self.visits, self.returns = visits, returns
+
+        # Most visited action, the best mean (or Q) breaks the ties
+        action = max(range(3), key = lambda a: (visits [a], returns [a] / visits [a] if visits [a] else root.estimates [a]))
+        self.root = root.children [action]
+
+        return action
+
+    def run_episode(self):
+        """
+        Plays an episode choosing every action with search, like the solvers (Q is not updated).
+        """
+        environment = self.environment
+        environment.reset()
+
+        terminal = False
+        self.reward_sum = 0
+
+        while not terminal:
+            action = self.search()
+            terminal, reward, environment.state = environment.step(action)
+            self.reward_sum += reward
+
+        return
+
+    def close(self):
+        """
+        Shuts down the worker processes.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+# Planners of a worker process of MCTS, one per configuration
+worker_planners = {}
+
+
+def search_root(config: tuple, Q: np.ndarray, snapshot: list, simulations: int, milliseconds: float, seed: int) -> tuple:
+    """
+    Task of the worker processes of MCTS, searches from the snapshot with noise on the root priors.
+
+    return: Tuple (visits, returns) of the actions of the root.
+    """
+    width, height, wall_map, observation, c_puct, gamma, temperature, rollout_steps = config
+
+    # The map arrives as a new object with every task, its layout identifies it
+    key = (width, height, wall_map.key if wall_map is not None else None) + config [3:]
+    planner = worker_planners.get(key)
+    if planner is None:
+        environment = SnakeGame(None, width, height, wall_map = wall_map, observation = observation)
+        agent = Jormungandr(alpha = 0, action_selector = None, environment = environment, checkpoint = None)
+        planner = worker_planners [key] = MCTS(agent, environment, simulations, milliseconds, c_puct, gamma,
+                                               temperature, rollout_steps, noise = 0.25)
+
+    planner.agent.Q = Q
+    planner.simulations, planner.milliseconds = simulations, milliseconds
+    planner.rng = np.random.default_rng(seed)
+    planner.root = None
+
+    planner.environment.restore(snapshot)
+    planner.search()
+
+    return planner.visits, planner.returns
@@ -1,17 +1,27 @@
-from .agent import Jormungandr
+from .agent import Jormungandr, EligibilityTraces
+from .checkpoint import CheckpointManager, solver_checkpoints
 from .environments import SnakeGame
 from .planner import DynaQ, DynaQWithPriority
-import numpy as np
-import time
 
 from random import sample
 
+def check_vectorized(environment):
+	"""
+	Checks that the tabular solvers can train on a vector environment (integer states index Q).
+
+	return: The current states of its boards.
+	"""
+	if environment.observation != 'int':
+		raise ValueError('Unknown observation mode for the tabular solvers, avaliable values: int')
+
+	return environment.states
+
 class SARSA():
 	"""
 	Trains the agent using on-policy SARSA to estimate Q
 	"""
 
-	def __init__(self, agent: Jormungandr, environment: SnakeGame, planner: DynaQ, save_path: str, test: bool):
+	def __init__(self, agent: Jormungandr, environment: SnakeGame, planner: DynaQ, save_path: str, test: bool, checkpoints: CheckpointManager = None):
 
 		# Agent
 		self.agent = agent
@@ -25,6 +35,9 @@ class SARSA():
 		# Whether to train or test
 		self.test = test
 
+		# Saves Q in the background every few episodes
+		self.checkpoints = solver_checkpoints(checkpoints, save_path, test)
+
 		# Planner
 		self.planner = planner
 
@@ -66,8 +79,8 @@ class SARSA():
 			self.environment.state = next_state
 			action = next_action
 
-		if not self.test:
-			np.save(self.save_path, self.agent.Q)
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
 
 		# Plan ahead
 		if self.planner is not None:
@@ -75,12 +88,46 @@ class SARSA():
 
 		return
 
+	def run_vectorized(self, environment, steps: int):
+		"""
+		Trains on the boards of a vector environment (VecSnakeGame or SubprocVecSnakeGame with integer states)
+		for the given number of steps of every board, without the planner. The updates of a step are done while
+		the boards play the next one.
+		"""
+		states = check_vectorized(environment)
+		agent = self.agent
+
+		actions = [ agent.select_action(state) for state in states ]
+		environment.step_async(actions)
+		self.reward_sum = 0
+
+		for step in range(steps):
+
+			# Act on the enviroments, observe R and S' and choose the next actions (S' after the resets)
+			terminal, reward, next_state = environment.step_wait()
+			next_states = environment.states
+			next_actions = [ agent.select_action(state) for state in next_states ]
+			if step + 1 < steps:
+				environment.step_async(next_actions)
+
+			# Update Q while the boards move, A' of the boards that did not finish is the next action
+			self.reward_sum += int(reward.sum())
+			if not self.test:
+				agent.update_Sarsa_batch(states, actions, reward, next_state, next_actions, terminal)
+
+			states, actions = next_states, next_actions
+
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
+
+		return
+
 class QLearning():
 	"""
 	Implements off-policy Q-Learning to estimate Q
 	"""
 
-	def __init__(self, agent: Jormungandr, environment: SnakeGame, planner: DynaQ, save_path: str, test: bool):
+	def __init__(self, agent: Jormungandr, environment: SnakeGame, planner: DynaQ, save_path: str, test: bool, checkpoints: CheckpointManager = None):
 
 		# Agent
 		self.agent = agent
@@ -94,6 +141,9 @@ class QLearning():
 		# Whether to test or train
 		self.test = test
 
+		# Saves Q in the background every few episodes
+		self.checkpoints = solver_checkpoints(checkpoints, save_path, test)
+
 		# Planner
 		self.planner = planner
 		return
@@ -128,8 +178,8 @@ class QLearning():
 			# Update S 
 			self.environment.state = next_state
 		
-		if not self.test:
-			np.save(self.save_path, self.agent.Q)
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
 
 		# Plan ahead
 		if self.planner is not None:
@@ -137,11 +187,45 @@ class QLearning():
 
 		return
 
+	def run_vectorized(self, environment, steps: int):
+		"""
+		Trains on the boards of a vector environment (VecSnakeGame or SubprocVecSnakeGame with integer states)
+		for the given number of steps of every board, without the planner. The updates of a step are done while
+		the boards play the next one.
+		"""
+		states = check_vectorized(environment)
+		agent = self.agent
+
+		actions = [ agent.select_action(state) for state in states ]
+		environment.step_async(actions)
+		self.reward_sum = 0
+
+		for step in range(steps):
+
+			# Act on the enviroments, observe R and S', the next actions start the next step
+			terminal, reward, next_state = environment.step_wait()
+			next_states = environment.states
+			next_actions = [ agent.select_action(state) for state in next_states ]
+			if step + 1 < steps:
+				environment.step_async(next_actions)
+
+			# Update Q while the boards move
+			self.reward_sum += int(reward.sum())
+			if not self.test:
+				agent.update_QLearning_batch(states, actions, reward, next_state, terminal)
+
+			states, actions = next_states, next_actions
+
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
+
+		return
+
 class n_step_SARSA():
 	"""
 	Implements on-policy n-step SARSA to estimate Q
 	"""
-	def __init__(self, n_steps: int, agent: Jormungandr, environment, planner: DynaQ, save_path: str, test: bool) -> None:
+	def __init__(self, n_steps: int, agent: Jormungandr, environment, planner: DynaQ, save_path: str, test: bool, checkpoints: CheckpointManager = None) -> None:
 		
 		# Number of steps
 		self.n_steps = n_steps
@@ -158,6 +242,9 @@ class n_step_SARSA():
 		# Whether to test or train
 		self.test = test
 
+		# Saves Q in the background every few episodes
+		self.checkpoints = solver_checkpoints(checkpoints, save_path, test)
+
 		# Planner (DynaQWithPriority not currently implemented for nStep)
 		self.planner = planner if isinstance(planner, DynaQ) else None
 
@@ -240,8 +327,8 @@ class n_step_SARSA():
 
 			t += 1
 		
-		if not self.test:
-			np.save(self.save_path, self.agent.Q)
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
 
 		# Plan ahead
 		if self.planner is not None:
@@ -252,7 +339,7 @@ class n_step_OffPolicy():
 	"""
 	Implements off-policy n-step SARSA to estimate Q
 	"""
-	def __init__(self, n_steps: int, agent: Jormungandr, environment, planner: DynaQ, save_path: str, test: bool) -> None:
+	def __init__(self, n_steps: int, agent: Jormungandr, environment, planner: DynaQ, save_path: str, test: bool, checkpoints: CheckpointManager = None) -> None:
 		
 		# Number of steps
 		self.n_steps = n_steps
@@ -269,6 +356,9 @@ class n_step_OffPolicy():
 		# Whether to test or train
 		self.test = test
 
+		# Saves Q in the background every few episodes
+		self.checkpoints = solver_checkpoints(checkpoints, save_path, test)
+
 		# Planner (DynaQWithPriority not currently implemented for nStep)
 		self.planner = planner if isinstance(planner, DynaQ) else None
 
@@ -360,10 +450,117 @@ class n_step_OffPolicy():
 
 			t += 1
 		
-		if not self.test:
-			np.save(self.save_path, self.agent.Q)
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
 			
 		# Plan ahead
 		if self.planner is not None:
 			self.planner.plan()
-		return
\ No newline at end of file
+		return
+
+class LambdaSolver():
+	"""
+	Episode loop of the solvers with sparse eligibility traces, SARSALambda and QLambda, which only differ in update
+	"""
+
+	def __init__(self, agent: Jormungandr, environment, save_path: str, test: bool, lam: float = 0.9, gamma: float = 1.0, trace: str = 'replacing', checkpoints: CheckpointManager = None) -> None:
+
+		# Agent
+		self.agent = agent
+
+		# Environment to solve
+		self.environment = environment
+
+		# Path to save Q
+		self.save_path = save_path
+
+		# Whether to test or train
+		self.test = test
+
+		# Discount (the other solvers do not discount)
+		self.gamma = gamma
+
+		# Traces of the recently visited (S,A), replacing or accumulating
+		self.traces = EligibilityTraces(agent.Q.size, gamma = gamma, lam = lam, mode = trace)
+
+		# Saves Q in the background every few episodes
+		self.checkpoints = solver_checkpoints(checkpoints, save_path, test)
+
+	def run_episode(self):
+
+		# Reset environment and traces
+		self.environment.reset()
+		self.traces.clear()
+
+		# Get first action
+		action = self.agent.select_action(self.environment.state)
+
+		terminal = False
+		self.reward_sum = 0
+
+		while not terminal:
+
+			# Act on the enviroment, observe R and S', and choose A'
+			terminal, reward, next_state = self.environment.step(action)
+			self.reward_sum += reward
+			next_action = self.agent.select_action(next_state)
+
+			if not self.test:
+				self.update(self.environment.state, action, reward, next_state, next_action, terminal)
+
+			# Update S and A
+			self.environment.state = next_state
+			action = next_action
+
+		if not self.test and self.checkpoints is not None:
+			self.checkpoints.episode(self.agent.Q)
+
+		return
+
+	def update(self, state, action, reward, next_state, next_action, terminal):
+		"""
+		Updates Q and the traces after the step from S with A to S', where A' was chosen
+		"""
+		raise NotImplementedError
+
+class SARSALambda(LambdaSolver):
+	"""
+	Implements on-policy SARSA(lambda) to estimate Q, with sparse eligibility traces
+	"""
+
+	def update(self, state, action, reward, next_state, next_action, terminal):
+
+		# TD error, R + gamma * Q(S',A') - Q(S,A) (R - Q(S,A) at the end)
+		delta = reward - self.agent.get_Q(state)[action]
+		if not terminal:
+			delta += self.gamma * self.agent.get_Q(next_state)[next_action]
+
+		# Every (S,A) with a trace moves with delta, then the traces decay
+		self.traces.visit(self.agent.entry(state, action))
+		self.agent.update_traces(self.traces, delta)
+		self.traces.decay()
+
+class QLambda(LambdaSolver):
+	"""
+	Implements off-policy Watkins's Q(lambda) to estimate Q, with sparse eligibility traces
+	"""
+
+	def update(self, state, action, reward, next_state, next_action, terminal):
+
+		# Greedy action of S', A' if it ties with the best
+		next_Q = self.agent.get_Q(next_state)
+		greedy = next_action if next_Q[next_action] == next_Q.max() else self.agent.action_selector.get_greedy_action(next_Q)
+
+		# TD error, R + gamma * max_a Q(S',a) - Q(S,A) (R - Q(S,A) at the end)
+		delta = reward - self.agent.get_Q(state)[action]
+		if not terminal:
+			delta += self.gamma * next_Q[greedy]
+
+		self.traces.visit(self.agent.entry(state, action))
+		self.agent.update_traces(self.traces, delta)
+
+		# Watkins: the traces only follow the greedy policy, an exploratory action cuts them
+		if next_action == greedy:
+			self.traces.decay()
+		else:
+			self.traces.clear()
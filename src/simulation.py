@@ -0,0 +1,292 @@
+import contextlib, io, random, time
+
+import numpy as np
+import pygame
+
+from board import FreeCellBoard
+from utils import BLACK, WHITE, RED, GREEN, BLUE
+
+# Ways a game can end
+OUTCOMES = ('died', 'full', 'stalled', 'max foods')
+
+
+class PygameRenderer():
+    """
+    Draws the games of a Simulation on a pygame window, optional add-on of the simulation loop.
+    """
+
+    def __init__(self, game_window, width: int, height: int, fps: int = 25, game_over_seconds: float = 3, stats = None, walls = ()):
+
+        self.game_window = game_window
+        self.width = width
+        self.height = height
+        self.game_over_seconds = game_over_seconds
+
+        # FPS (frames per second) controller
+        self.fps = fps
+        self.fps_controller = pygame.time.Clock()
+
+        # SearchStats of the pathfinder, its summary is shown at the bottom of the frames
+        self.stats = stats
+
+        # Cells (X, Y) of the walls of the map
+        self.walls = walls
+
+    def show_score(self, score: int, color, position: tuple):
+
+        score_font = pygame.font.SysFont('times new roman', 20)
+        score_surface = score_font.render('Score : ' + str(score), True, color)
+        score_rect = score_surface.get_rect()
+        score_rect.midtop = position
+        self.game_window.blit(score_surface, score_rect)
+
+    def draw(self, snake_body: list, food_pos: list, score: int):
+        """
+        Draws a frame and waits for the next one.
+        """
+        # Keep the window responsive
+        pygame.event.pump()
+
+        self.game_window.fill(BLACK)
+        for x, y in self.walls:
+            pygame.draw.rect(self.game_window, BLUE, pygame.Rect(x * 10, y * 10, 10, 10))
+
+        for pos in snake_body:
+            pygame.draw.rect(self.game_window, GREEN, pygame.Rect(pos [0], pos [1], 10, 10))
+
+        pygame.draw.rect(self.game_window, WHITE, pygame.Rect(food_pos [0], food_pos [1], 10, 10))
+
+        self.show_score(score, WHITE, (self.width / 10, 15))
+
+        if self.stats is not None:
+            stats_font = pygame.font.SysFont('consolas', 12)
+            stats_surface = stats_font.render(self.stats.summary(), True, WHITE)
+            stats_rect = stats_surface.get_rect()
+            stats_rect.bottomleft = (5, self.height - 5)
+            self.game_window.blit(stats_surface, stats_rect)
+
+        pygame.display.update()
+        self.fps_controller.tick(self.fps)
+
+    def game_over(self, score: int, outcome: str):
+        """
+        Shows the game over screen.
+        """
+        my_font = pygame.font.SysFont('times new roman', 90)
+        game_over_surface = my_font.render('YOU DIED' if outcome == 'died' else 'GAME OVER', True, RED)
+        game_over_rect = game_over_surface.get_rect()
+        game_over_rect.midtop = (self.width / 2, self.height / 4)
+
+        self.game_window.fill(BLACK)
+        self.game_window.blit(game_over_surface, game_over_rect)
+        self.show_score(score, RED, (self.width / 2, self.height / 1.25))
+        pygame.display.flip()
+        time.sleep(self.game_over_seconds)
+
+
+class Simulation():
+    """
+    Headless games of the A* agent, as fast as the CPU allows.
+
+    The game loop is the -a loop of Snake_game.py without the display: the planner (a Jormungandr or any
+    object with the same pathfind method and nodes_expanded counter) plans, the moves are played on a
+    Bitboard and the food is placed with a seeded random generator, so runs are reproducible. Every call
+    to pathfind is timed and the results of all the games are kept to report throughput, pathfind latency
+    percentiles, nodes expanded and the score distribution.
+
+    Drawing the frames and the game over screen are optional, pass a renderer (PygameRenderer).
+    """
+
+    def __init__(self, make_planner, cols: int, rows: int, max_foods: int = None, start: list = None, renderer = None, quiet: bool = True, wall_map = None):
+        """
+        Args:
+            make_planner (callable): Returns a new planner, called at the start of every game.
+            cols, rows (int): Size of the board in cells.
+            max_foods (int): The game ends after eating this many foods, no limit by default.
+            start (list): Body of the snake at the start of the games (pixel coordinates, head first), by default
+                three cells at the middle of the board growing towards south.
+            renderer: Draws the games, None to run headless.
+            quiet (bool): Silences the messages of the planner ("No way!").
+            wall_map (WallMap): Fixed walls of the board, the planners must be built with the same map.
+        """
+        self.make_planner = make_planner
+        self.cols = cols
+        self.rows = rows
+        self.max_foods = max_foods
+        self.wall_map = wall_map
+        self.walls = wall_map.walls if wall_map is not None else []
+
+        if start is None:
+            start = [ (x * 10, y * 10) for x, y in wall_map.start() ] if wall_map is not None else \
+                    [ [cols // 2 * 10, rows // 2 * 10 + 10 * i] for i in range(3) ]
+        self.start = start
+        self.renderer = renderer
+        self.quiet = quiet
+
+        # A game stalls when the snake goes this many moves without eating (a planner chasing its tail forever)
+        self.max_hungry = cols * rows * 4
+
+        # The board is full when the body covers every free cell
+        self.cells = cols * rows - len(self.walls)
+
+        # Results of every game played
+        self.scores = []
+        self.outcomes = []
+
+        # Seconds and nodes expanded of every call to pathfind
+        self.latencies = []
+        self.nodes = []
+
+        self.moves = 0
+        self.elapsed = 0.0
+
+    def spawn_food(self, rng: random.Random, board: FreeCellBoard) -> list:
+        """
+        Places the food on a random free cell, one draw from the free cells of the board.
+        """
+        x, y = board.random_free(rng)
+
+        return [x * 10, y * 10]
+
+    def play_game(self, rng: random.Random):
+        """
+        Plays a game until the snake dies, fills the board, stalls or eats max_foods foods.
+
+        return: Tuple (score, outcome).
+        """
+        if self.quiet:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return self.play(rng)
+
+        return self.play(rng)
+
+    def play(self, rng: random.Random):
+        """
+        Game loop of play_game.
+        """
+        cols, rows, renderer = self.cols, self.rows, self.renderer
+        latencies, nodes = self.latencies, self.nodes
+
+        planner = self.make_planner()
+        snake_body = [ list(pos) for pos in self.start ]
+        board = FreeCellBoard.from_body(cols, rows, [ (x // 10, y // 10) for x, y in snake_body ], self.walls)
+        food_pos = self.spawn_food(rng, board)
+
+        score, moves, hungry = 0, 0, 0
+        outcome = None
+        start = time.perf_counter()
+
+        while outcome is None:
+
+            call = time.perf_counter()
+            move_sequence = planner.pathfind(board, food_pos)
+            latencies.append(time.perf_counter() - call)
+            nodes.append(planner.nodes_expanded)
+
+            for move in move_sequence:
+                x, y = snake_body [0]
+                x += 10 * ((move == 4) - (move == 3))
+                y += 10 * ((move == 2) - (move == 1))
+                moves += 1
+                hungry += 1
+
+                # Snake body growing mechanism, the tail leaves its cell before the head gets in
+                snake_body.insert(0, [x, y])
+                eaten = x == food_pos [0] and y == food_pos [1]
+                if not eaten:
+                    snake_body.pop()
+                    board.pop_tail()
+
+                # Getting out of bounds or touching the snake body
+                if board.push_head(x // 10, y // 10):
+                    outcome = 'died'
+                    break
+
+                if eaten:
+                    score += 1
+                    hungry = 0
+                    if len(snake_body) == self.cells:
+                        outcome = 'full'
+                    elif self.max_foods is not None and score >= self.max_foods:
+                        outcome = 'max foods'
+                    else:
+                        food_pos = self.spawn_food(rng, board)
+
+                if renderer is not None:
+                    renderer.draw(snake_body, food_pos, score)
+
+                if outcome is not None:
+                    break
+
+                if hungry >= self.max_hungry:
+                    outcome = 'stalled'
+                    break
+
+                # The rest of the moves went to the food that was just eaten
+                if eaten:
+                    break
+
+        self.elapsed += time.perf_counter() - start
+        self.moves += moves
+        self.scores.append(score)
+        self.outcomes.append(outcome)
+
+        if renderer is not None:
+            renderer.game_over(score, outcome)
+
+        return score, outcome
+
+    def run(self, games: int, seed: int = None) -> dict:
+        """
+        Plays the given number of games, the food positions only depend on the seed.
+
+        return: The summary of all the games played so far.
+        """
+        rng = random.Random(seed)
+        for _ in range(games):
+            self.play_game(rng)
+
+        return self.summary()
+
+    def summary(self) -> dict:
+        """
+        Returns the statistics of all the games played.
+        """
+        latencies = np.array(self.latencies) * 1000
+        scores = np.array(self.scores)
+        nodes = int(sum(self.nodes))
+        pathfind_seconds = float(sum(self.latencies))
+
+        return {
+            'games': len(self.scores),
+            'outcomes': { outcome: self.outcomes.count(outcome) for outcome in OUTCOMES },
+            'moves': self.moves,
+            'seconds': self.elapsed,
+            'moves_per_second': self.moves / self.elapsed if self.elapsed else 0.0,
+            'pathfind_calls': len(self.latencies),
+            'latency_ms': { 'p50': float(np.percentile(latencies, 50)), 'p90': float(np.percentile(latencies, 90)),
+                            'p99': float(np.percentile(latencies, 99)), 'max': float(latencies.max()) } if len(latencies) else {},
+            'nodes_expanded': nodes,
+            'nodes_per_call': nodes / len(self.nodes) if self.nodes else 0.0,
+            'nodes_per_second': nodes / pathfind_seconds if pathfind_seconds else 0.0,
+            'score': { 'mean': float(scores.mean()), 'min': int(scores.min()), 'p10': float(np.percentile(scores, 10)),
+                       'p50': float(np.percentile(scores, 50)), 'p90': float(np.percentile(scores, 90)),
+                       'max': int(scores.max()) } if len(scores) else {},
+        }
+
+    def print_summary(self):
+        """
+        Prints the statistics of all the games played.
+        """
+        summary = self.summary()
+        outcomes = ', '.join(f'{outcome} {count}' for outcome, count in summary ['outcomes'].items())
+        latency, score = summary ['latency_ms'], summary ['score']
+
+        print(f"Games: {summary ['games']} ({outcomes})")
+        print(f"Moves: {summary ['moves']:,} in {summary ['seconds']:.2f} s, {summary ['moves_per_second']:,.0f} moves/s")
+        print(f"Pathfind: {summary ['pathfind_calls']:,} calls, latency p50 {latency ['p50']:.3f} ms, p90 {latency ['p90']:.3f} ms, "
+              f"p99 {latency ['p99']:.3f} ms, max {latency ['max']:.3f} ms")
+        print(f"Nodes expanded: {summary ['nodes_expanded']:,}, {summary ['nodes_per_call']:,.1f} per call, "
+              f"{summary ['nodes_per_second']:,.0f} per second")
+        print(f"Score: mean {score ['mean']:.1f}, min {score ['min']}, p10 {score ['p10']:.0f}, p50 {score ['p50']:.0f}, "
+              f"p90 {score ['p90']:.0f}, max {score ['max']}")
@@ -0,0 +1,114 @@
+import json
+
+# Counters recorded for every call to pathfind
+METRICS = ('expanded', 'generated', 'frontier_peak', 'path_length', 'latency_us')
+
+
+class Histogram():
+    """
+    Counts of non negative values in power of two buckets, bucket 0 holds the zeros and bucket b > 0 the
+    values in [2^(b-1), 2^b). Adding a value is O(1) and the size does not grow with the number of values.
+    """
+
+    def __init__(self):
+
+        self.buckets = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value: int):
+
+        bucket = int(value).bit_length()
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+
+        self.buckets [bucket] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> int:
+        """
+        Upper bound of the bucket of the q-th percentile (0 <= q <= 100).
+        """
+        if not self.count:
+            return 0
+
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min((1 << bucket) - 1, self.max)
+
+        return self.max
+
+    def to_dict(self) -> dict:
+
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': { ('0' if bucket == 0 else f'{1 << (bucket - 1)}-{(1 << bucket) - 1}'): count
+                         for bucket, count in enumerate(self.buckets) if count },
+        }
+
+
+class SearchStats():
+    """
+    Counters of the work done by every call to Jormungandr.pathfind: nodes expanded, nodes generated, peak
+    size of the frontier, length of the path and wall time, aggregated in histograms.
+
+    The pathfinder only records when it is given a SearchStats, the searches just keep two integers more.
+    One SearchStats can be shared by several pathfinders to aggregate a whole run.
+    """
+
+    def __init__(self):
+
+        self.calls = 0
+        self.failures = 0
+        self.histograms = { metric: Histogram() for metric in METRICS }
+
+    def record(self, expanded: int, generated: int, frontier_peak: int, path_length: int, seconds: float, found: bool):
+        """
+        Records a call to pathfind, found is False when no path to the food was found.
+        """
+        histograms = self.histograms
+        self.calls += 1
+        self.failures += not found
+
+        histograms ['expanded'].add(expanded)
+        histograms ['generated'].add(generated)
+        histograms ['frontier_peak'].add(frontier_peak)
+        histograms ['path_length'].add(path_length)
+        histograms ['latency_us'].add(int(seconds * 1e6))
+
+    def to_dict(self) -> dict:
+
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'histograms': { metric: histogram.to_dict() for metric, histogram in self.histograms.items() },
+        }
+
+    def dump(self, path: str):
+        """
+        Writes the counters and histograms to a JSON file.
+        """
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent = 4)
+
+    def summary(self) -> str:
+        """
+        One line summary, shown live in the -a loop.
+        """
+        histograms = self.histograms
+        latency, expanded = histograms ['latency_us'], histograms ['expanded']
+
+        return (f"calls {self.calls} (no way {self.failures}) | expanded p50 {expanded.percentile(50)} max {expanded.max} | "
+                f"frontier max {histograms ['frontier_peak'].max} | latency p50 {latency.percentile(50)} us p99 {latency.percentile(99)} us")
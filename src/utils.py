@@ -30,6 +30,27 @@ def euclidean_distance(v1, v2):
     dist = sqrt(sum([(a - b)**2 for a, b in zip(v1, v2)]))
     return dist
 
+def chebyshev_distance(v1, v2):
+    """
+    Computes chebyshev distance, the highest difference on any coordinate.
+    Since there is no cost for traveling from node to node, we ignore it ( it's like if the cost was equal to zero).
+
+    return dist: The chebyshev distance between v1 and v2
+    """
+    dist = max([abs(a - b) for a, b in zip(v1, v2)])
+    return dist
+
+def octile_distance(v1, v2):
+    """
+    Computes octile distance, straight moves cost 1 and diagonal moves cost sqrt(2).
+    Since there is no cost for traveling from node to node, we ignore it ( it's like if the cost was equal to zero).
+
+    return dist: The octile distance between v1 and v2
+    """
+    dx, dy = abs(v1[0] - v2[0]), abs(v1[1] - v2[1])
+    dist = max(dx, dy) + (sqrt(2) - 1) * min(dx, dy)
+    return dist
+
 def game_over(frame_size_x, frame_size_y, game_window):
     my_font = pygame.font.SysFont('times new roman', 90)
     game_over_surface = my_font.render('YOU DIED', True, RED)
@@ -0,0 +1,251 @@
+import hashlib, os
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from cache import cache_path
+
+# Characters of the map files, one line per row of the board
+WALL, FREE = '#', '.'
+
+# Directory where the distances of every map are cached, one .npy file per layout
+DISTANCES_PATH = cache_path('distances')
+
+# Largest map (in cells) whose matrix of all the distances is built, 32 MB of uint16. Bigger maps compute the
+# distances to a target with a search when the target is used
+MATRIX_CELLS = 4096
+
+# Distance from and to the walls
+UNREACHABLE = np.iinfo(np.uint16).max
+
+
+def breadth_first(free: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Breadth first search from many cells at once.
+
+    The frontiers of all the sources are a single boolean array which grows one cell in every direction
+    per iteration, so every iteration is a handful of NumPy operations whatever the number of sources.
+
+    Args:
+        free (np.ndarray): Boolean array (rows, cols), True on the cells that can be walked.
+        sources (np.ndarray): Cells (Y * cols + X) where the searches start, nothing is reached from the walls.
+
+    return: Array (len(sources), rows * cols) with the distance from every source to every cell,
+        UNREACHABLE for the walls and the cells that can not be reached.
+    """
+    rows, cols = free.shape
+    batch = len(sources)
+
+    distances = np.full((batch, rows * cols), UNREACHABLE, dtype = np.uint16)
+    frontier = np.zeros((batch, rows, cols), dtype = bool)
+    frontier.reshape(batch, -1) [np.arange(batch), sources] = True
+    frontier &= free
+    visited = frontier.copy()
+
+    distance = 0
+    while frontier.any():
+        distances [frontier.reshape(batch, -1)] = distance
+
+        grown = np.zeros_like(frontier)
+        grown [:, 1:] |= frontier [:, :-1]
+        grown [:, :-1] |= frontier [:, 1:]
+        grown [:, :, 1:] |= frontier [:, :, :-1]
+        grown [:, :, :-1] |= frontier [:, :, 1:]
+
+        frontier = grown & free & ~visited
+        visited |= frontier
+        distance += 1
+
+    return distances
+
+
+def load_map(path: str, distances_path: str = DISTANCES_PATH):
+    """
+    Reads a map file, one line per row of the board with '#' for the walls and '.' for the free cells.
+    Empty lines are ignored.
+    """
+    with open(path) as file:
+        lines = [ line.rstrip() for line in file if line.strip() ]
+
+    return WallMap.from_lines(lines, distances_path)
+
+
+class WallMap():
+    """
+    Board with fixed walls inside it and the true shortest path distances between its cells.
+
+    The walls never change, so the distances between every pair of cells (going around the walls, without
+    the snake) are computed once per layout with breadth_first and saved to disk. The matrix is then opened
+    as a memory mapped file: only the rows of the targets that are used are read, and the processes of
+    pathfind_many share the pages of the file. The matrix grows with the square of the cells, so maps with
+    more than MATRIX_CELLS cells search the distances to a target the first time it is used instead. The
+    distances to a target are the exact heuristic of the search and, when the body does not block any of the
+    moves, give the shortest path without searching.
+    """
+
+    def __init__(self, cols: int, rows: int, walls, path: str = DISTANCES_PATH, size: int = 64):
+        """
+        Args:
+            cols, rows (int): Size of the board in cells.
+            walls (iterable): Cells (X, Y) of the walls.
+            path (str): Directory where the distances are cached.
+            size (int): Maximum number of distance fields kept, see field.
+        """
+        self.cols = cols
+        self.rows = rows
+        self.walls = sorted(set( (int(x), int(y)) for x, y in walls ))
+
+        self.free = np.ones((rows, cols), dtype = bool)
+        for x, y in self.walls:
+            if not (0 <= x < cols and 0 <= y < rows):
+                raise ValueError('The wall (' + str(x) + ', ' + str(y) + ') is out of the board')
+            self.free [y, x] = False
+
+        # Every free cell must be reachable from the others, otherwise the food could spawn where the snake
+        # can never get
+        cells = np.flatnonzero(self.free)
+        if not len(cells):
+            raise ValueError('The map has no free cells')
+        if (breadth_first(self.free, cells [:1]) [0, cells] == UNREACHABLE).any():
+            raise ValueError('The free cells of the map must be connected')
+
+        # Layout of the map, names the file of its distances
+        self.key = hashlib.sha1(np.packbits(self.free).tobytes() + bytes(str((cols, rows)), 'ascii')).hexdigest() [:16]
+        self.path = path
+
+        # Distance matrix, opened the first time it is used
+        self.matrix = None
+
+        # Distances to the last targets, laid out like the bits of a board
+        self.size = size
+        self.fields = OrderedDict()
+
+    @classmethod
+    def from_lines(cls, lines: list, path: str = DISTANCES_PATH):
+        """
+        Builds a map from its rows, strings of '#' (walls) and '.' (free cells).
+        """
+        if not lines:
+            raise ValueError('The map is empty')
+
+        cols = len(lines [0])
+        walls = []
+        for y, line in enumerate(lines):
+            if len(line) != cols:
+                raise ValueError('Every row of the map must have ' + str(cols) + ' cells, row ' + str(y) + ' has ' + str(len(line)))
+
+            for x, char in enumerate(line):
+                if char == WALL:
+                    walls.append((x, y))
+                elif char != FREE:
+                    raise ValueError('Unknown map cell ' + repr(char) + ', avaliable values: ' + WALL + ' (wall), ' + FREE + ' (free)')
+
+        return cls(cols, len(lines), walls, path)
+
+    def __getstate__(self):
+
+        # The distances are opened again from disk after unpickling (pathfind_many workers)
+        state = self.__dict__.copy()
+        state ['matrix'] = None
+        state ['fields'] = OrderedDict()
+
+        return state
+
+    def is_wall(self, x: int, y: int) -> bool:
+        """
+        Checks if the cell (X, Y) is a wall.
+        """
+        return not self.free [y, x]
+
+    def start(self, length: int = 3) -> list:
+        """
+        Returns the free cells closest to the middle of the board where a snake of the given length fits,
+        head first and growing towards south.
+        """
+        middle_x, middle_y = self.cols // 2, self.rows // 2
+        cells = sorted(( (x, y) for y in range(self.rows - length + 1) for x in range(self.cols) ),
+                       key = lambda cell: abs(cell [0] - middle_x) + abs(cell [1] - middle_y))
+
+        for x, y in cells:
+            if self.free [y:y + length, x].all():
+                return [ (x, y + i) for i in range(length) ]
+
+        raise ValueError('A snake of length ' + str(length) + ' does not fit on the map')
+
+    def distances(self) -> np.ndarray:
+        """
+        Returns the matrix (cells, cells) of distances, the distance from the cell A to the cell B (cells as
+        Y * cols + X) is at [A, B]. It is built and saved on disk the first time.
+        """
+        if self.matrix is not None:
+            return self.matrix
+
+        if self.cols * self.rows > MATRIX_CELLS:
+            raise ValueError('The map has ' + str(self.cols * self.rows) + ' cells, the matrix of distances is only built up to ' + str(MATRIX_CELLS))
+
+        file = os.path.join(self.path, 'distances_' + str(self.cols) + 'x' + str(self.rows) + '_' + self.key + '.npy')
+        if not os.path.exists(file):
+            cells = self.cols * self.rows
+            os.makedirs(self.path, exist_ok = True)
+
+            # The searches run in batches of sources to bound the memory, the file is renamed when it is
+            # complete so other processes never open half of it
+            partial = file + '.' + str(os.getpid()) + '.tmp'
+            matrix = np.lib.format.open_memmap(partial, mode = 'w+', dtype = np.uint16, shape = (cells, cells))
+            batch = max(1, (1 << 22) // cells)
+            for start in range(0, cells, batch):
+                sources = np.arange(start, min(start + batch, cells))
+                matrix [start:start + batch] = breadth_first(self.free, sources)
+
+            matrix.flush()
+            del matrix
+            os.replace(partial, file)
+
+        self.matrix = np.load(file, mmap_mode = 'r')
+        return self.matrix
+
+    def target_distances(self, target: tuple) -> np.ndarray:
+        """
+        Returns the distances from every cell (Y * cols + X) to the target cell (X, Y), a row of the matrix or
+        a search from the target on the maps too big for it.
+        """
+        cell = target [1] * self.cols + target [0]
+        if self.cols * self.rows > MATRIX_CELLS:
+            return breadth_first(self.free, np.array([cell])) [0]
+
+        return self.distances() [cell]
+
+    def distance(self, a: tuple, b: tuple) -> int:
+        """
+        Returns the length of the shortest path between the cells A and B (X, Y), UNREACHABLE if one of them
+        is a wall.
+        """
+        if self.cols * self.rows > MATRIX_CELLS:
+            value = self.field(b) [a [1] * self.cols + a [0]]
+            return UNREACHABLE if value == np.inf else int(value)
+
+        return int(self.distances() [a [1] * self.cols + a [0], b [1] * self.cols + b [0]])
+
+    def field(self, target: tuple, border: int = 0) -> array:
+        """
+        Returns the distances from every cell to the target cell (X, Y), same layout as HeuristicCache.field.
+        The walls and the border are at infinite distance.
+        """
+        key = (target, border)
+        field = self.fields.get(key)
+
+        if field is not None:
+            self.fields.move_to_end(key)
+            return field
+
+        row = np.asarray(self.target_distances(target), dtype = np.float64)
+        row [row == UNREACHABLE] = np.inf
+        row = np.pad(row.reshape(self.rows, self.cols), border, constant_values = np.inf)
+        field = array('d', row.tobytes())
+
+        self.fields [key] = field
+        if len(self.fields) > self.size:
+            self.fields.popitem(last = False)
+
+        return field
@@ -0,0 +1,111 @@
+import os, sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from rl.agent import EligibilityTraces, Jormungandr, TRACE_MODES, MIRROR_ACTIONS, MIRROR_ENTRIES, MIRROR_FEATURES, MIRROR_STATES
+from rl.environments import N_STATES, decode_state, encode_state
+
+
+def random_agent(seed: int, symmetric: bool = False) -> Jormungandr:
+    """
+    Agent with a random Q, symmetric agents start with the mean of Q and its mirror like a loaded Q.
+    """
+    agent = Jormungandr(alpha = 0.3, action_selector = None, environment = None, checkpoint = None, symmetric = symmetric)
+    flat = np.random.default_rng(seed).normal(size = N_STATES * 3)
+    if symmetric:
+        flat = (flat + flat [MIRROR_ENTRIES]) / 2
+    agent.Q = flat.reshape(N_STATES, 3)
+
+    return agent
+
+
+def test_update_batch_matches_sequential_updates():
+    rng = np.random.default_rng(0)
+
+    for symmetric in (False, True):
+        for weighted in (False, True):
+            batched, sequential = random_agent(1, symmetric), random_agent(1, symmetric)
+
+            # Few states, so most (state, action) pairs come many times, mirrors of each other included
+            states = rng.choice([0, 5, 37, 1000, 1024 + 512], size = 300)
+            actions = rng.integers(0, 3, size = 300)
+            targets = rng.normal(size = 300)
+            weights = rng.uniform(0, 2, size = 300) if weighted else None
+
+            batched.update_batch(states, actions, targets, weights)
+            for i in range(300):
+                if weighted:
+                    sequential.update_n_step_offpolicy(int(states [i]), int(actions [i]), weights [i], targets [i])
+                else:
+                    sequential.update_n_step_sarsa(int(states [i]), int(actions [i]), targets [i])
+
+            assert np.allclose(batched.Q, sequential.Q)
+
+
+def test_update_batch_without_duplicates_and_empty():
+    batched, sequential = random_agent(2), random_agent(2)
+    states, actions, targets = np.arange(0, 2048, 7), np.arange(0, 2048, 7) % 3, np.linspace(-1, 1, len(range(0, 2048, 7)))
+
+    batched.update_batch(states, actions, targets)
+    for state, action, target in zip(states, actions, targets):
+        sequential.update_n_step_sarsa(int(state), int(action), target)
+    assert np.allclose(batched.Q, sequential.Q)
+
+    Q = batched.Q.copy()
+    batched.update_batch([], [], [])
+    assert np.array_equal(batched.Q, Q)
+
+
+def test_mirrors_are_involutions():
+    assert np.array_equal(MIRROR_STATES [MIRROR_STATES], np.arange(N_STATES))
+    assert np.array_equal(MIRROR_ACTIONS [MIRROR_ACTIONS], np.arange(3))
+    assert np.array_equal(MIRROR_ENTRIES [MIRROR_ENTRIES], np.arange(N_STATES * 3))
+    assert np.array_equal(np.sort(MIRROR_ENTRIES), np.arange(N_STATES * 3))
+
+    # The mirror swaps the features of every pair and keeps the rest
+    for code in range(N_STATES):
+        state, mirror = decode_state(code), decode_state(int(MIRROR_STATES [code]))
+        swapped = dict(state)
+        for a, b in MIRROR_FEATURES:
+            swapped [a], swapped [b] = state [b], state [a]
+        assert mirror == swapped
+        assert encode_state(swapped) == MIRROR_STATES [code]
+
+
+def test_traces_match_dense_traces():
+    rng = np.random.default_rng(3)
+
+    for mode in TRACE_MODES:
+        for threshold in (0.0, 1e-3):
+            traces = EligibilityTraces(300, gamma = 0.95, lam = 0.8, mode = mode, threshold = threshold, capacity = 4)
+            agent = random_agent(4)
+            dense_Q = agent.Q.reshape(-1) [:300].copy()
+            dense = np.zeros(300)
+
+            for step in range(2000):
+                entry = int(rng.integers(0, 300 if step % 2 else 20))
+                traces.visit(entry)
+                dense [entry] = dense [entry] + 1 if mode == 'accumulating' else 1.0
+
+                # The sparse traces move Q like the dense ones
+                delta = rng.normal()
+                agent.update_traces(traces, delta)
+                dense_Q += agent.alpha * delta * dense
+
+                traces.decay()
+                dense *= 0.95 * 0.8
+                dense [dense < threshold] = 0
+
+                if step % 500 == 499:
+                    traces.clear()
+                    dense [:] = 0
+
+                entries, values = traces.active()
+                sparse = np.zeros(300)
+                sparse [entries] = values
+                assert len(set(entries.tolist())) == len(traces)
+                assert np.allclose(sparse, dense)
+
+            assert np.allclose(agent.Q.reshape(-1) [:300], dense_Q)
@@ -0,0 +1,217 @@
+import os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from board import Bitboard, FreeCellBoard, FreeCellIndex, BORDER
+
+
+def random_body(rng: random.Random, width: int, height: int, length: int, walls: set):
+    """
+    Self avoiding random walk of at most length cells, head first.
+    """
+    body = [ (rng.randrange(width), rng.randrange(height)) ]
+    while body [0] in walls:
+        body = [ (rng.randrange(width), rng.randrange(height)) ]
+
+    while len(body) < length:
+        x, y = body [-1]
+        free = [ (x + dx, y + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0))
+                 if 0 <= x + dx < width and 0 <= y + dy < height and (x + dx, y + dy) not in body and (x + dx, y + dy) not in walls ]
+        if not free:
+            break
+        body.append(rng.choice(free))
+
+    return body
+
+
+def reference_fill(start: tuple, width: int, height: int, blocked: set) -> set:
+    """
+    Cells reachable from start through the cells of the board that are not blocked, with a set based BFS.
+    """
+    seen, stack = {start}, [start]
+    while stack:
+        x, y = stack.pop()
+        for cell in ((x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)):
+            if 0 <= cell [0] < width and 0 <= cell [1] < height and cell not in blocked and cell not in seen:
+                seen.add(cell)
+                stack.append(cell)
+
+    return seen
+
+
+def test_release_matches_body_order():
+    """
+    A segment is released after as many moves as segments behind it plus one, free cells after 0 moves.
+    """
+    rng = random.Random(0)
+    for _ in range(50):
+        walls = { (rng.randrange(12), rng.randrange(9)) for _ in range(6) }
+        body = random_body(rng, 12, 9, rng.randrange(1, 30), walls)
+        board = Bitboard.from_body(12, 9, body, walls)
+
+        release = { cell: len(body) - position for position, cell in enumerate(body) }
+        for y in range(9):
+            for x in range(12):
+                index = board.index(x, y)
+                if (x, y) in walls:
+                    assert board.test(index)
+                else:
+                    assert board.release(index) == release.get((x, y), 0)
+
+
+def test_flood_fill_matches_reference():
+    rng = random.Random(1)
+    for _ in range(50):
+        walls = { (rng.randrange(15), rng.randrange(10)) for _ in range(10) }
+        body = random_body(rng, 15, 10, rng.randrange(1, 60), walls)
+        board = Bitboard.from_body(15, 10, body, walls)
+
+        free = ((1 << board.size) - 1) & ~(board.wall_bits | board.mask(board.body))
+        region = board.flood_fill(board.body [0], free)
+        cells = { board.cell(index) for index in range(board.size) if region >> index & 1 }
+
+        assert cells == reference_fill(body [0], 15, 10, walls | set(body [1:]))
+
+
+def test_popcount_counts_occupied_bits():
+    walls = [(3, 3), (4, 4)]
+    board = Bitboard.from_body(10, 6, [(1, 1), (1, 2), (1, 3)], walls)
+    border = (10 + 2 * BORDER) * (6 + 2 * BORDER) - 10 * 6
+
+    assert board.popcount() == border + len(walls) + 3
+
+    board.pop_tail()
+    assert board.popcount() == border + len(walls) + 2
+
+
+def test_free_cell_board_follows_the_body():
+    """
+    The free cell index of a FreeCellBoard holds exactly the cells that are neither walls nor body.
+    """
+    rng = random.Random(2)
+    walls = { (rng.randrange(10), rng.randrange(10)) for _ in range(8) }
+    body = random_body(rng, 10, 10, 5, walls)
+    board = FreeCellBoard.from_body(10, 10, body, walls)
+
+    for _ in range(500):
+        x, y = board.cell(board.body [0])
+        moves = [ (x + dx, y + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)) if not board.occupied(x + dx, y + dy) ]
+        if not moves or rng.random() < 0.1:
+            board = FreeCellBoard.from_body(10, 10, random_body(rng, 10, 10, rng.randrange(1, 20), walls), walls)
+            continue
+
+        board.push_head(*rng.choice(moves))
+        if rng.random() < 0.8:
+            board.pop_tail()
+
+        occupied = { board.cell(index) for index in board.body } | walls
+        free = { board.cell(board.free_cells.cells [i]) for i in range(len(board.free_cells)) }
+        assert free == { (x, y) for x in range(10) for y in range(10) } - occupied
+
+
+def check_index(index: FreeCellIndex, free: set):
+    assert len(index) == len(free)
+    assert set(index.cells [:index.count]) == free
+    for position, cell in enumerate(index.cells):
+        assert index.position [cell] == position
+    for cell in range(len(index.position)):
+        assert (cell in index) == (cell in free)
+
+
+def test_free_cell_index_add_remove_sample():
+    rng = random.Random(3)
+    size = 60
+    walls = bytearray(size)
+    for cell in rng.sample(range(size), 12):
+        walls [cell] = 1
+
+    index = FreeCellIndex(size, walls)
+    free = { cell for cell in range(size) if not walls [cell] }
+    check_index(index, free)
+
+    # Removing or adding twice and adding walls changes nothing
+    for _ in range(2000):
+        cell = rng.randrange(size)
+        if rng.random() < 0.5:
+            index.remove(cell)
+            free.discard(cell)
+        else:
+            index.add(cell)
+            if not walls [cell]:
+                free.add(cell)
+        check_index(index, free)
+
+        if free:
+            assert index.sample(rng) in free
+
+    # Every free cell is drawn and nothing else
+    while len(free) > 5:
+        index.remove(free.pop())
+    assert { index.sample(rng) for _ in range(500) } == free
+
+    for cell in list(free):
+        index.remove(cell)
+    check_index(index, set())
+    try:
+        index.sample(rng)
+        assert False
+    except ValueError:
+        pass
+
+
+def board_state(board: FreeCellBoard) -> tuple:
+    free = board.free_cells
+    return (bytes(board.bits), [ board.stamp [index] for index in board.body ], list(board.body), board.pushes,
+            list(free.cells), list(free.position), free.count)
+
+
+def test_snapshot_restore_undoes_the_moves():
+    rng = random.Random(4)
+    width, height = 9, 7
+    walls = {(4, 3), (5, 3)}
+
+    for _ in range(30):
+        board = FreeCellBoard.from_body(width, height, random_body(rng, width, height, 6, walls), walls)
+        snapshot = board.snapshot()
+        saved = board_state(board)
+
+        # Random walks from the snapshot until they collide, eating included, with the same draw after every
+        # restore
+        draws = set()
+        for _ in range(5):
+            for _ in range(rng.randrange(1, 15)):
+                x, y = board.cell(board.body [0])
+                dx, dy = rng.choice(((0, -1), (0, 1), (-1, 0), (1, 0)))
+                if board.push_head(x + dx, y + dy):
+                    break
+                if rng.random() < 0.8:
+                    board.pop_tail()
+
+            board.restore(snapshot)
+            assert board_state(board) == saved
+            draws.add(board.random_free(random.Random(0)))
+        assert len(draws) == 1
+
+        # Another board (like a worker process) gets the same body and free cells
+        other = FreeCellBoard(width, height, walls)
+        other.restore(snapshot)
+        assert (bytes(other.bits), list(other.body), set(other.free_cells.cells [:other.free_cells.count])) == \
+               (saved [0], saved [2], set(saved [4] [:saved [6]]))
+        assert [ other.release(index) for index in other.body ] == [ board.release(index) for index in board.body ]
+
+
+def test_long_journal_is_dropped():
+    board = FreeCellBoard.from_body(6, 6, [(2, 2), (2, 3)])
+    snapshot = board.snapshot()
+    saved = board_state(board)
+
+    # Back and forth far more than the size of the board
+    for step in range(4 * board.size):
+        x, y = board.cell(board.body [0])
+        board.push_head(x + (1 if step % 2 else -1), y)
+        board.pop_tail()
+    assert board.journal is None
+
+    board.restore(snapshot)
+    assert board_state(board) [:4] == saved [:4]
+    assert board.journal == []
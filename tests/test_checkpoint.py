@@ -0,0 +1,66 @@
+import os, sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from rl.checkpoint import CheckpointManager
+
+
+def test_rotation_keeps_versions(tmp_path):
+    """
+    With keep = 3 the current checkpoint and the two before it are kept, newest first.
+    """
+    manager = CheckpointManager(str(tmp_path / 'q'), episodes = None, seconds = None, keep = 3)
+    for value in range(4):
+        manager.write(np.full((2048, 3), value))
+    manager.close()
+
+    assert [ int(np.load(manager.version(number)) [0, 0]) for number in range(3) ] == [3, 2, 1]
+    assert sorted(os.listdir(tmp_path)) == ['q.1.npy', 'q.2.npy', 'q.npy']
+
+
+def test_crash_before_replace_keeps_current(tmp_path, monkeypatch):
+    """
+    A crash after the older versions moved but before the new checkpoint is renamed in leaves the current one.
+    """
+    manager = CheckpointManager(str(tmp_path / 'q'), episodes = None, seconds = None, keep = 2)
+    manager.write(np.zeros((2048, 3)))
+
+    replace = os.replace
+    def crash(source, destination):
+        if source.endswith('.tmp') and destination == manager.path:
+            raise OSError('crash')
+        replace(source, destination)
+
+    monkeypatch.setattr(os, 'replace', crash)
+    try:
+        manager.write(np.ones((2048, 3)))
+    except OSError:
+        pass
+    monkeypatch.setattr(os, 'replace', replace)
+    manager.close()
+
+    assert np.load(manager.path) [0, 0] == 0
+    assert np.load(manager.version(1)) [0, 0] == 0
+    assert not [ name for name in os.listdir(tmp_path) if name.endswith('.tmp') ]
+
+
+def test_stale_temporary_files_are_removed(tmp_path):
+    """
+    The temporary files of a killed process are removed when a manager starts, the ones of running processes stay.
+    """
+    pid = os.fork()
+    if not pid:
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    stale = [ str(tmp_path / ('q.npy.' + str(pid) + '.tmp')), str(tmp_path / ('q.1.npy.' + str(pid) + '.tmp')) ]
+    running = str(tmp_path / ('q.npy.' + str(os.getppid()) + '.tmp'))
+    for file in stale + [running]:
+        open(file, 'wb').close()
+
+    manager = CheckpointManager(str(tmp_path / 'q'), episodes = None, seconds = None)
+    manager.close()
+
+    assert [ os.path.exists(file) for file in stale + [running] ] == [False, False, True]
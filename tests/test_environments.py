@@ -0,0 +1,88 @@
+import os, random, sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from rl.environments import SnakeGame, VecSnakeGame
+from walls import load_map
+
+
+def food_bits(game: SnakeGame) -> int:
+    north, south, west, east = game.get_food_direction()
+    return north << 3 | south << 2 | west << 1 | east
+
+
+def run_against_games(vec: VecSnakeGame, games: list, steps: int):
+    # The generators of the food differ, so every game takes the food of its board after the spawns
+    def follow(i):
+        games [i].food_x, games [i].food_y = int(vec.food_x [i]), int(vec.food_y [i])
+        games [i].state = games [i].state & ~0xF | food_bits(games [i])
+
+    for i in range(vec.n):
+        follow(i)
+    assert list(vec.states) == [ game.state for game in games ]
+
+    rng = random.Random(0)
+    for _ in range(steps):
+        actions = np.array([ rng.randrange(3) for _ in games ])
+        terminal, reward, next_state = vec.step(actions)
+
+        for i, game in enumerate(games):
+            done, value, state = game.step(int(actions [i]))
+            assert (bool(terminal [i]), int(reward [i]), int(next_state [i])) == (done, value, state)
+
+            game.state = state
+            if done:
+                game.reset()
+                follow(i)
+
+        assert list(vec.states) == [ game.state for game in games ]
+
+    assert vec.deaths == sum( game.deaths for game in games )
+    assert vec.food_eaten == sum( game.food_eaten for game in games )
+
+
+def test_vec_matches_seeded_games():
+    vec = VecSnakeGame(4, 7, 9, seed = 0, observation = 'int')
+    games = [ SnakeGame(None, 7, 9, observation = 'int', seed = i) for i in range(4) ]
+    run_against_games(vec, games, 2000)
+
+
+def test_vec_matches_seeded_games_on_map():
+    wall_map = load_map(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'maps', 'rooms.txt'))
+    vec = VecSnakeGame(3, wall_map = wall_map, seed = 1, observation = 'int')
+    games = [ SnakeGame(None, wall_map = wall_map, observation = 'int', seed = i) for i in range(3) ]
+    run_against_games(vec, games, 2000)
+
+
+def game_state(game: SnakeGame) -> tuple:
+    state = game.state.tobytes() if game.observation == 'grid' else game.state
+    return (list(game.snake_body), game.x, game.y, state, game.current_direction, game.food_x, game.food_y,
+            game.steps, game.food_eaten, game.deaths, bytes(game.board.bits), list(game.board.free_cells.cells),
+            game.rng.getstate(), game.grid.tobytes() if game.grid is not None else None)
+
+
+def test_restore_matches_the_snapshot():
+    rng = random.Random(1)
+    for observation in ('int', 'dict', 'grid'):
+        game = SnakeGame(None, 6, 6, observation = observation, seed = 2)
+        snapshot = None
+
+        for _ in range(200):
+            done, _, game.state = game.step(rng.randrange(3))
+            if done:
+                game.reset()
+
+            snapshot = game.snapshot(snapshot)
+            saved = game_state(game)
+
+            # Rollouts through deaths, foods and resets
+            for _ in range(3):
+                for _ in range(rng.randrange(1, 20)):
+                    done, _, game.state = game.step(rng.randrange(3))
+                    if done:
+                        game.reset()
+
+                game.restore(snapshot)
+                assert game_state(game) == saved
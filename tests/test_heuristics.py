@@ -0,0 +1,29 @@
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from heuristics import HeuristicCache, LazyField, HEURISTICS
+
+
+def test_lazy_field_matches_field():
+    """
+    A target seen once gives a LazyField, the next time the NumPy field, both with the same values.
+    """
+    cache = HeuristicCache(eager_cells = 0)
+    for heuristic in HEURISTICS:
+        for target in ((0, 0), (7, 3), (29, 19)):
+            for border in (0, 2):
+                lazy = cache.field(heuristic, target, 30, 20, border)
+                field = cache.field(heuristic, target, 30, 20, border)
+
+                assert isinstance(lazy, LazyField) and not isinstance(field, LazyField)
+                assert [ lazy [index] for index in range(len(field)) ] == list(field)
+
+
+def test_cache_limited_by_bytes():
+    cache = HeuristicCache(max_bytes = 3 * 8 * 100, eager_cells = 100)
+    for x in range(10):
+        cache.field('manhattan', (x, 0), 10, 10)
+
+    assert len(cache.fields) == 3 and cache.bytes == 3 * 8 * 100
+    assert isinstance(cache.field('manhattan', (0, 0), 20, 20), LazyField)
@@ -0,0 +1,22 @@
+import os, random, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from benchmark import random_position
+from Jormungandr import Jormungandr
+
+
+def test_jps_paths_as_short_as_grid():
+    """
+    With search = 'astar' the jumps must not skip the turns around the body, JPS used to return paths
+    a few moves longer than the grid A* on about 1% of the positions.
+    """
+    rng = random.Random(1)
+    jps = Jormungandr(200, 200, 'manhattan', backend = 'jps', search = 'astar')
+    grid = Jormungandr(200, 200, 'manhattan', backend = 'grid', search = 'astar')
+
+    for _ in range(1000):
+        snake_body, food_pos = random_position(rng, 20, 20, 30)
+        path = grid.pathfind(snake_body, food_pos)
+        if grid.found:
+            assert len(jps.pathfind(snake_body, food_pos)) == len(path)
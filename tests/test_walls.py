@@ -0,0 +1,34 @@
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import walls
+from walls import WallMap
+
+
+MAP = [
+    '..........',
+    '.####.###.',
+    '....#.....',
+    '.##.#.###.',
+    '....#.....',
+    '.#####.##.',
+    '..........',
+]
+
+
+def test_searched_distances_match_matrix(tmp_path, monkeypatch):
+    matrix = WallMap.from_lines(MAP, str(tmp_path))
+    cells = [ (x, y) for y in range(matrix.rows) for x in range(matrix.cols) ]
+
+    # The same map with a matrix too big to build
+    monkeypatch.setattr(walls, 'MATRIX_CELLS', matrix.cols * matrix.rows - 1)
+    searched = WallMap.from_lines(MAP, str(tmp_path / 'searched'))
+
+    for target in [ (0, 0), (9, 6), (5, 2), (1, 1) ]:
+        assert list(searched.field(target, 2)) == list(matrix.field(target, 2))
+        for cell in cells:
+            assert searched.distance(cell, target) == matrix.distance(cell, target)
+
+    # Nothing is written for the big map
+    assert not os.path.exists(str(tmp_path / 'searched'))